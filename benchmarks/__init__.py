@@ -0,0 +1,8 @@
+"""
+Benchmarks de NutriApp (sin servicios externos)
+- fakes.py: backends locales de Gemini y Supabase (PostgREST)
+- load_test.py: prueba de carga con percentiles, throughput y RSS vs baseline
+- microbench.py: tiempo y memoria por llamada de los helpers por request
+- replay_trace.py: replay de trazas grabadas con TRACE_RECORD_PATH (traces/sample.jsonl)
+- import_budget.py: tiempo de `import main` (arranque en frío) contra un presupuesto
+"""
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Presupuesto de arranque en frío: cuánto tarda `import main` en un proceso nuevo
+- Corre `python -X importtime -c "import main"` varias veces y toma la mediana
+- Reporta los módulos más caros (tiempo acumulado, como -X importtime)
+- Falla si el total supera el presupuesto o si se cargó algún SDK que debe ser lazy
+
+Ejecutar (desde la raíz del repo):
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 800 --top 25
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Presupuesto por defecto para `import main` (ms). Cloud Run con 1 vCPU es ~2x más
+# lento que una laptop: mantenerlo holgado aquí y ajustar con --budget-ms en CI.
+DEFAULT_BUDGET_MS = 1500.0
+
+# Módulos que no deben cargarse al importar la app (se importan en el primer uso)
+LAZY_MODULES = (
+    "langgraph",
+    "langchain_core",
+    "langchain_google_genai",
+    "google.genai",
+    "google.generativeai",
+    "supabase",
+    "uvicorn",
+    "numpy",
+)
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """Parsea la salida de -X importtime → [(módulo, self_us, cumulative_us, profundidad)]"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def run_once(module: str) -> List[Tuple[str, int, int, int]]:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "fake-key")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH", "")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"`import {module}` falló:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def build_report(module: str, runs: int, top: int) -> Dict[str, Any]:
+    run_once(module)  # warm-up: compila .pyc para no medir el bytecode
+    totals: List[float] = []
+    per_module: Dict[str, List[int]] = {}
+    loaded: set = set()
+    for _ in range(runs):
+        rows = run_once(module)
+        loaded.update(name for name, *_ in rows)
+        totals.append(next(c for name, _, c, depth in reversed(rows) if name == module and depth == 0) / 1000)
+        for name, _, cumulative, _ in rows:
+            per_module.setdefault(name, []).append(cumulative)
+
+    heaviest = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in per_module.items() if name != module),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+    eager = sorted(
+        name for name in loaded
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    return {
+        "module": module,
+        "runs": runs,
+        "python": sys.version.split()[0],
+        "total_ms_median": round(statistics.median(totals), 1),
+        "total_ms_min": round(min(totals), 1),
+        "modules_loaded": len(loaded),
+        "heaviest": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in heaviest],
+        "eager_lazy_modules": eager,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import de NutriApp")
+    parser.add_argument("--module", default="main", help="Módulo a importar (default: main)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Módulos más caros a listar")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--output", type=Path, help="Guardar el reporte JSON")
+    args = parser.parse_args(argv)
+
+    report = build_report(args.module, args.runs, args.top)
+    report["budget_ms"] = args.budget_ms
+
+    print(f"{'módulo':<50} {'acumulado (ms)':>15}")
+    for row in report["heaviest"]:
+        print(f"{row['module']:<50} {row['cumulative_ms']:>15.1f}")
+    print(
+        f"\nimport {args.module}: mediana {report['total_ms_median']} ms "
+        f"(mín {report['total_ms_min']} ms, {report['modules_loaded']} módulos) "
+        f"— presupuesto {args.budget_ms:.0f} ms"
+    )
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    failures = []
+    if report["total_ms_median"] > args.budget_ms:
+        failures.append(f"import {args.module}: {report['total_ms_median']} ms > {args.budget_ms:.0f} ms")
+    if report["eager_lazy_modules"]:
+        failures.append("SDKs cargados en el import: " + ", ".join(report["eager_lazy_modules"]))
+    if failures:
+        print("❌ Presupuesto de arranque excedido:")
+        for line in failures:
+            print(f"  - {line}")
+        return 1
+    print("✅ Dentro del presupuesto de arranque")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga offline de NutriApp
+- Levanta la app (uvicorn en un hilo) con Gemini y Supabase falsos
+- Ejecuta escenarios /qa, /analyze-meal, /chat/{user_id} y /user/* con concurrencia configurable
+- "mixed": /user/* mientras otra tanda de clientes sube notas de voz a /qa (pasan por el
+  pool de medios); mide si las subidas frenan a las lecturas
+- Reporta p50/p95/p99, throughput y RSS pico; falla si empeora respecto al baseline
+- El baseline guarda la config de la corrida (concurrencia, latencias falsas, mezcla de
+  requests): con otra config no se compara (salvo --allow-config-mismatch, con aviso)
+
+Ejecutar (desde la raíz del repo):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --concurrency 16 --requests 200 --output /tmp/carga.json
+    python -m benchmarks.load_test --update-baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeGeminiConfig,
+    FakePostgrest,
+    FAKE_SUPABASE_KEY,
+    fake_user_id,
+    install_fakes,
+    seed_rows,
+)
+
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baselines" / "load_test.json"
+SCENARIOS = ["qa", "analyze", "chat", "user", "mixed"]
+
+
+# ===========================
+# Arranque de la app
+# ===========================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def boot_app(gemini: FakeGeminiConfig, supabase_latency_ms: float, users: int):
+    """
+    Importa la app, instala los fakes y la sirve con uvicorn en un hilo.
+    Retorna (base_url, server, backend).
+    """
+    import uvicorn
+
+    backend = FakePostgrest(tables=seed_rows(users=users), latency_ms=supabase_latency_ms)
+    backend.start()
+
+    os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+    os.environ["NEXT_PUBLIC_SUPABASE_NUTRITION_URL"] = backend.url
+    os.environ["NEXT_PUBLIC_SUPABASE_NUTRITION_ANON_KEY"] = FAKE_SUPABASE_KEY
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("CACHE_ENABLED", "true")  # Como en producción
+
+    import main  # noqa: F401  (registra src/ en sys.path e importa la app)
+
+    install_fakes(gemini, backend.url)
+
+    port = _free_port()
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("La app no arrancó en 30s")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, backend
+
+
+# ===========================
+# Escenarios
+# ===========================
+
+def _image_bytes(size: int, rng: random.Random) -> bytes:
+    # Cabecera JPEG + relleno: suficiente para el pipeline (el modelo es falso)
+    return b"\xff\xd8\xff\xe0" + rng.randbytes(max(0, size - 4))
+
+
+def _wav_bytes(size: int, rng: random.Random) -> bytes:
+    """Nota de voz WAV (mono 16 bits, 16 kHz) de ~size bytes: el preprocesamiento la abre"""
+    import io
+    import wave
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(16000)
+        writer.writeframes(rng.randbytes(max(2, size - 44) // 2 * 2))
+    return out.getvalue()
+
+
+def build_scenarios(args, rng: random.Random) -> Dict[str, Callable[[Any], Awaitable[Any]]]:
+    image = _image_bytes(args.image_kb * 1024, rng)
+    voice_note = _wav_bytes(args.upload_kb * 1024, rng)
+    today = time.strftime("%Y-%m-%d")
+
+    def user() -> str:
+        return fake_user_id(rng.randrange(args.users))
+
+    async def qa(client):
+        files = [("files", (f"plato{i}.jpg", image, "image/jpeg")) for i in range(args.qa_files)]
+        return await client.post("/qa", data={"question": "¿Cuántas calorías tiene este plato?"}, files=files)
+
+    async def analyze(client):
+        # Sufijo único por request: mide el camino sin cache (salvo --repeat-images)
+        payload = image if args.repeat_images else image + rng.randbytes(16)
+        return await client.post("/analyze-meal", files={"file": ("plato.jpg", payload, "image/jpeg")})
+
+    async def chat(client):
+        return await client.post(f"/chat/{user()}", json={"message": "¿Qué ceno hoy?", "user_name": "Ana"})
+
+    user_paths = [
+        "/user/{uid}/profile",
+        "/user/{uid}/metrics",
+        "/user/{uid}/nutrition/history?limit=30",
+        "/user/{uid}/nutrition/today?date=" + today,
+    ]
+
+    async def user_endpoints(client):
+        return await client.get(rng.choice(user_paths).format(uid=user()))
+
+    async def upload(client):
+        # Sufijo único: cada subida se procesa en el pool (sin hits de cache)
+        payload = voice_note + rng.randbytes(2)
+        files = [("files", ("nota.wav", payload, "audio/wav"))]
+        return await client.post("/qa", data={"question": "¿Qué comí hoy según la nota?"}, files=files)
+
+    return {"qa": qa, "analyze": analyze, "chat": chat, "user": user_endpoints, "upload": upload}
+
+
+def _ok(response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        return bool(response.json().get("ok", True))
+    except ValueError:
+        return False
+
+
+async def run_scenario(base_url: str, call, requests: int, concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    response = await call(client)
+                    if not _ok(response):
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+async def run_mixed(base_url: str, foreground, background, requests: int, concurrency: int) -> Dict[str, Any]:
+    """`foreground` (medido) mientras `concurrency` clientes repiten `background` sin pausa"""
+    import httpx
+
+    # Pasada sin medir: caches como tras el escenario "user", corra solo o después de otros
+    await run_scenario(base_url, foreground, requests, concurrency)
+    stop = asyncio.Event()
+    background_done = 0
+
+    async def keep_uploading(client):
+        nonlocal background_done
+        while not stop.is_set():
+            try:
+                await background(client)
+            except Exception:
+                pass
+            background_done += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        uploaders = [asyncio.create_task(keep_uploading(client)) for _ in range(concurrency)]
+        await asyncio.sleep(0.5)  # Las subidas ya están en curso
+        try:
+            result = await run_scenario(base_url, foreground, requests, concurrency)
+        finally:
+            stop.set()
+            await asyncio.gather(*uploaders)
+    result["background_requests"] = background_done
+    return result
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """RSS pico del proceso (app + cliente comparten proceso)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024, 1)
+
+
+# ===========================
+# Baseline
+# ===========================
+
+def run_config(args) -> Dict[str, Any]:
+    """Lo que cambia los números: debe coincidir con el del baseline para comparar"""
+    return {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "users": args.users,
+        "image_kb": args.image_kb,
+        "qa_files": args.qa_files,
+        "upload_kb": args.upload_kb,
+        "repeat_images": args.repeat_images,
+        "gemini_latency_ms": args.gemini_latency_ms,
+        "gemini_jitter_ms": args.gemini_jitter_ms,
+        "gemini_failure_rate": args.gemini_failure_rate,
+        "supabase_latency_ms": args.supabase_latency_ms,
+        "seed": args.seed,
+    }
+
+
+def config_mismatches(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Diferencias de config entre la corrida y el baseline (vacía si son comparables)"""
+    return [
+        f"{key}: {current.get(key)!r} (baseline: {baseline[key]!r})" if key in baseline else f"{key}: falta en el baseline"
+        for key in sorted(set(current) | set(baseline))
+        if current.get(key) != baseline.get(key)
+    ]
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Retorna la lista de regresiones (vacía si todo está dentro de la tolerancia)"""
+    regressions = []
+    for name, current in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {current[key]} > {base[key]} (+{tolerance:.0%})")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}.throughput_rps: {current['throughput_rps']} < {base['throughput_rps']} (-{tolerance:.0%})"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}.errors: {current['errors']} > {base['errors']}")
+    base_rss = baseline.get("peak_rss_mb")
+    if base_rss and report["peak_rss_mb"] > base_rss * (1 + tolerance):
+        regressions.append(f"peak_rss_mb: {report['peak_rss_mb']} > {base_rss} (+{tolerance:.0%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga offline de NutriApp")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Lista separada por comas")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests por escenario")
+    parser.add_argument("--users", type=int, default=50, help="Usuarios sintéticos en Supabase")
+    parser.add_argument("--image-kb", type=int, default=256)
+    parser.add_argument("--qa-files", type=int, default=1)
+    parser.add_argument("--upload-kb", type=int, default=1024, help="Nota de voz del escenario mixed")
+    parser.add_argument("--repeat-images", action="store_true", help="Misma imagen en cada request (mide el cache)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Margen permitido (0.25 = 25%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--allow-config-mismatch", action="store_true", help="Comparar aunque la config difiera del baseline (con aviso)"
+    )
+    parser.add_argument("--output", type=Path, help="Guardar el reporte JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    gemini = FakeGeminiConfig(
+        latency_ms=args.gemini_latency_ms,
+        jitter_ms=args.gemini_jitter_ms,
+        failure_rate=args.gemini_failure_rate,
+        seed=args.seed,
+    )
+    base_url, server, backend = boot_app(gemini, args.supabase_latency_ms, args.users)
+    scenarios = build_scenarios(args, rng)
+
+    report: Dict[str, Any] = {
+        "config": run_config(args),
+        "environment": {"cpus": os.cpu_count(), "python": sys.version.split()[0]},
+        "scenarios": {},
+    }
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            if name == "mixed":
+                run = run_mixed(base_url, scenarios["user"], scenarios["upload"], args.requests, args.concurrency)
+            else:
+                run = run_scenario(base_url, scenarios[name], args.requests, args.concurrency)
+            result = asyncio.run(run)
+            report["scenarios"][name] = result
+            print(
+                f"{name:<8} n={result['requests']:<5} err={result['errors']:<4} "
+                f"p50={result['p50_ms']:>8.1f}ms p95={result['p95_ms']:>8.1f}ms "
+                f"p99={result['p99_ms']:>8.1f}ms  {result['throughput_rps']:>7.1f} req/s"
+            )
+    finally:
+        server.should_exit = True
+        backend.stop()
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(f"RSS pico: {report['peak_rss_mb']} MB")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline actualizado: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"Sin baseline en {args.baseline} (usa --update-baseline)")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    mismatches = config_mismatches(report["config"], baseline.get("config", {}))
+    if mismatches:
+        print("⚠️  La config de esta corrida no es la del baseline; los números no son comparables:")
+        for line in mismatches:
+            print(f"  - {line}")
+        if not args.allow_config_mismatch:
+            print("Sin comparar (usa la config del baseline, --update-baseline o --allow-config-mismatch)")
+            return 2
+    environment = baseline.get("environment", {})
+    if environment and environment != report["environment"]:
+        print(f"⚠️  Baseline medido en otro entorno: {environment} (ahora: {report['environment']})")
+
+    regressions = compare_to_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print("❌ Regresiones detectadas:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("✅ Sin regresiones respecto al baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks de los helpers que corren en cada request
+- classify_media, _detect_language, enrich_system_prompt, _force_markdown,
+  NutritionChatbot._format_context_for_prompt y guess_mime
+- Decodificación de filas de Supabase (TypeAdapter) y encode de respuestas (orjson)
+- Entradas realistas en español e inglés y estados con muchos archivos
+- Mide tiempo por llamada (mediana/mínimo) y memoria asignada (tracemalloc)
+- Guarda un JSON por commit para comparar entre versiones
+
+Ejecutar (desde la raíz del repo):
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --compare benchmarks/results/microbench-<commit>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# ===========================
+# Entradas realistas
+# ===========================
+
+QUESTIONS = {
+    "es_short": "¿Cuántas calorías tiene este plato?",
+    "es_long": (
+        "Hola, te comparto la foto de mi almuerzo de hoy y el menú del restaurante en PDF. "
+        "Quiero saber cuántas calorías, proteína, carbohidratos y grasa tiene aproximadamente, "
+        "si es un plato equilibrado para mi plan de la semana, y qué receta alternativa podría "
+        "preparar en casa con ingredientes parecidos pero con menos sodio y más fibra. "
+        "También dime si la etiqueta del producto envasado que aparece en la foto es saludable. "
+    ) * 4,
+    "en_short": "How many calories are in this meal?",
+    "en_long": (
+        "Hi, here is a photo of my lunch and the restaurant menu as a PDF. I would like to know "
+        "the approximate calories, protein, carbohydrate and fat content, whether it fits my "
+        "weekly meal plan, and which recipe I could prepare at home with similar ingredients "
+        "but less sodium and more fiber. Also tell me if the label of the packaged product is healthy. "
+    ) * 4,
+}
+
+MIME_MIX = [
+    ("plato.jpg", "image/jpeg"),
+    ("menu.pdf", "application/pdf"),
+    ("nota_de_voz.ogg", "audio/ogg"),
+    ("video_plato.mp4", "video/mp4"),
+    ("diario.csv", "text/csv"),
+    ("etiqueta.png", "image/png"),
+]
+
+MODEL_ANSWERS = {
+    "markdown": (
+        "**Respuesta directa**: el plato aporta unas 650 kcal.\n\n"
+        "**Análisis nutricional**:\n- Proteína: 35 g\n- Carbohidratos: 70 g\n- Grasas: 22 g\n\n"
+        "**Recomendaciones**: suma verduras y reduce la salsa.\n"
+    ) * 6,
+    "fenced_json": "```json\n" + json.dumps(
+        {"calories": 650, "protein_g": 35, "carbs_g": 70, "fat_g": 22, "items": list(range(40))},
+        indent=2,
+    ) + "\n```",
+}
+
+FILENAMES = [
+    "IMG_20260101_123456.jpg", "menu_restaurante.pdf", "nota.ogg", "clip.mp4",
+    "archivo_sin_extension", "https://cdn.example.com/fotos/plato.webp?size=large",
+]
+
+
+def _media_files(count: int, size: int = 64 * 1024):
+    from orchestration.state import MediaFile
+
+    payload = b"\x00" * size
+    files = []
+    for i in range(count):
+        name, mime = MIME_MIX[i % len(MIME_MIX)]
+        files.append(MediaFile(filename=f"{i}_{name}", mime_type=mime, data=payload, size_bytes=size))
+    return files
+
+
+def _state(question: str, files: int):
+    from orchestration.state import OrchestrationState
+
+    return OrchestrationState(question=question, media_files=_media_files(files))
+
+
+def _chatbot_context(with_today: bool) -> Dict[str, Any]:
+    from supabase_client import DailyNutrition, UserMetrics
+
+    metrics = UserMetrics(
+        id="m-1", user_id="u-1", weight=72.5, height=171.0, calorie_goal=2100, protein_goal=130,
+        carbs_goal=240, fat_goal=70, created_at="2026-01-01T00:00:00", updated_at="2026-01-01T00:00:00",
+    )
+    recent = [
+        DailyNutrition(
+            id=f"d-{d}", user_id="u-1", date=f"2026-01-{d + 1:02d}", calories=1850 + d, protein=110,
+            carbs=210, fat=65, created_at="2026-01-01T00:00:00", updated_at="2026-01-01T00:00:00",
+        )
+        for d in range(7)
+    ]
+    return {
+        "user_name": "Ana",
+        "metrics": metrics,
+        "today_nutrition": recent[0] if with_today else None,
+        "recent_nutrition": recent,
+    }
+
+
+def _daily_rows(days: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"d-{d}", "user_id": "u-1", "date": f"2026-{d // 28 % 12 + 1:02d}-{d % 28 + 1:02d}",
+            "calories": 1850.0 + d, "protein": 110.0, "carbs": 210.0, "fat": 65.0,
+            "created_at": "2026-01-01T00:00:00", "updated_at": "2026-01-01T00:00:00",
+        }
+        for d in range(days)
+    ]
+
+
+def _history_page(messages: int) -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "history": [
+            {
+                "id": f"msg-{m}", "message_type": "user" if m % 2 == 0 else "assistant",
+                "content": "¿Qué puedo cenar hoy para llegar a mi meta de proteína? " * 4,
+                "created_at": f"2026-01-01T16:{m // 60:02d}:{m % 60:02d}",
+            }
+            for m in range(messages)
+        ],
+        "metadata": {"timestamp": 1767283200.0, "message_count": messages, "next_cursor": None},
+    }
+
+
+# ===========================
+# Casos
+# ===========================
+
+# Cada caso: nombre -> (factory de argumentos por llamada, función)
+Case = Tuple[Callable[[], Tuple], Callable]
+
+
+def build_cases() -> Dict[str, Case]:
+    import main  # noqa: F401  (registra src/ en sys.path e importa la app)
+    from orchestration import graph
+    from orchestration.state import AnalysisType
+    from nutrition_chatbot import NutritionChatbot
+
+    guess_mime = sys.modules["src.nutrition_api"].guess_mime
+
+    cases: Dict[str, Case] = {}
+
+    for files in (1, 3, 10):
+        for qname in ("es_long", "en_short"):
+            cases[f"classify_media[{files}f,{qname}]"] = (
+                lambda f=files, q=QUESTIONS[qname]: (_state(q, f),),
+                graph.classify_media,
+            )
+
+    for qname, question in QUESTIONS.items():
+        cases[f"_detect_language[{qname}]"] = (lambda q=question: (q,), graph._detect_language)
+
+    all_types = [
+        AnalysisType.NUTRITIONAL, AnalysisType.RECIPE_SUGGESTION,
+        AnalysisType.PRODUCT_LABEL, AnalysisType.MEAL_PLAN,
+    ]
+
+    def enriched_state(question: str, files: int):
+        state = _state(question, files)
+        state.detected_analysis_types = list(all_types)
+        return (state,)
+
+    for qname in ("es_long", "en_long"):
+        cases[f"enrich_system_prompt[10f,{qname}]"] = (
+            lambda q=QUESTIONS[qname]: enriched_state(q, 10),
+            graph.enrich_system_prompt,
+        )
+
+    for aname, answer in MODEL_ANSWERS.items():
+        cases[f"_force_markdown[{aname}]"] = (lambda a=answer: (a,), graph._force_markdown)
+
+    chatbot = object.__new__(NutritionChatbot)  # sin LLM: el método es puro
+    for with_today in (True, False):
+        context = _chatbot_context(with_today)
+        cases[f"_format_context_for_prompt[today={with_today}]"] = (
+            lambda c=context: (c,),
+            chatbot._format_context_for_prompt,
+        )
+
+    for i, filename in enumerate(FILENAMES):
+        cases[f"guess_mime[{i}]"] = (lambda f=filename: (f,), guess_mime)
+
+    import json_response
+    import supabase_client
+
+    rows = _daily_rows(365)
+    cases["decode_daily_nutrition[365]"] = (
+        lambda: (rows,),
+        supabase_client._DAILY_NUTRITION_LIST.validate_python,
+    )
+    page = _history_page(100)
+    cases["json_response.dumps[history 100]"] = (lambda: (page,), json_response.dumps)
+
+    return cases
+
+
+# ===========================
+# Medición
+# ===========================
+
+def measure(make_args: Callable[[], Tuple], func: Callable, number: int, repeat: int) -> Dict[str, Any]:
+    """Tiempo por llamada (ns) y memoria por llamada (tracemalloc, fuera del cronometraje)"""
+    func(*make_args())  # warm-up
+    samples = []
+    for _ in range(repeat):
+        batch = [make_args() for _ in range(number)]  # los argumentos no cuentan en el tiempo
+        start = time.perf_counter_ns()
+        for args in batch:
+            func(*args)
+        samples.append((time.perf_counter_ns() - start) / number)
+
+    args = make_args()
+    tracemalloc.start()
+    base_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ns_per_call_median": round(statistics.median(samples), 1),
+        "ns_per_call_min": round(min(samples), 1),
+        "alloc_peak_bytes": peak - base_current,
+        "alloc_retained_bytes": max(0, current - base_current),
+    }
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        dirty = subprocess.run(["git", "diff", "--quiet"], cwd=ROOT).returncode != 0
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any], threshold: float) -> List[str]:
+    """Imprime la tabla de diferencias y retorna los casos que empeoraron > threshold"""
+    worse = []
+    print(f"\nComparación vs {previous.get('commit', '?')}:")
+    print(f"{'caso':<48} {'antes (ns)':>12} {'ahora (ns)':>12} {'Δ%':>8} {'Δ alloc':>10}")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            print(f"{name:<48} {'—':>12} {result['ns_per_call_median']:>12.0f} {'nuevo':>8}")
+            continue
+        delta = (result["ns_per_call_median"] / before["ns_per_call_median"] - 1) if before["ns_per_call_median"] else 0
+        alloc_delta = result["alloc_peak_bytes"] - before["alloc_peak_bytes"]
+        print(
+            f"{name:<48} {before['ns_per_call_median']:>12.0f} {result['ns_per_call_median']:>12.0f} "
+            f"{delta:>+7.1%} {alloc_delta:>+10d}"
+        )
+        if delta > threshold:
+            worse.append(f"{name}: {delta:+.1%}")
+    return worse
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks de helpers por request")
+    parser.add_argument("--number", type=int, default=500, help="Llamadas por ronda")
+    parser.add_argument("--repeat", type=int, default=7, help="Rondas (se reporta la mediana)")
+    parser.add_argument("--filter", default="", help="Solo casos que contengan este texto")
+    parser.add_argument("--compare", type=Path, help="JSON de una corrida anterior")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Regresión tolerada en --compare")
+    parser.add_argument("--output", type=Path, help="Ruta del JSON (default: results/microbench-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    cases = build_cases()
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "number": args.number,
+        "repeat": args.repeat,
+        "results": {},
+    }
+
+    print(f"{'caso':<48} {'mediana (ns)':>14} {'mín (ns)':>12} {'alloc pico (B)':>15}")
+    for name, (make_args, func) in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        result = measure(make_args, func, args.number, args.repeat)
+        report["results"][name] = result
+        print(
+            f"{name:<48} {result['ns_per_call_median']:>14.0f} {result['ns_per_call_min']:>12.0f} "
+            f"{result['alloc_peak_bytes']:>15d}"
+        )
+
+    output = args.output or RESULTS_DIR / f"microbench-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nResultados: {output}")
+
+    if args.compare:
+        worse = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        if worse:
+            print("\n❌ Regresiones:")
+            for line in worse:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Replay de trazas grabadas con TRACE_RECORD_PATH contra la app con backends falsos
+- Reproduce cada request en su instante original (a 1x o más rápido con --speed)
+- Sintetiza payloads con la misma forma: tamaños y MIME de archivos, largo de
+  pregunta/mensaje, usuario (por hash), repeticiones de contenido (por hash) y
+  el auto-log de /analyze-meal (log=true con el usuario de la traza).
+  JPEG, PDF (con texto) y WAV son archivos válidos para que el preprocesamiento
+  haga su trabajo real (OCR, pypdf, downmix) en vez de fallar al abrirlos
+- Reporta latencias por endpoint, tasa de contenido repetido (techo de hit rate)
+  y las estadísticas de cache de la app si expone /cache/stats
+
+Ejecutar (desde la raíz del repo):
+    python -m benchmarks.replay_trace benchmarks/traces/sample.jsonl --speed 4
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeGeminiConfig, fake_user_id
+from benchmarks.load_test import boot_app, peak_rss_mb, summarize
+
+_WORDS = (
+    "cuántas calorías tiene este plato de pollo con arroz y ensalada es saludable para mi plan "
+    "semanal receta proteína grasa fibra azúcar sodio menú desayuno almuerzo cena"
+).split()
+
+
+def load_trace(path: Path) -> List[Dict[str, Any]]:
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    return sorted(records, key=lambda r: r.get("t", 0.0))
+
+
+def synth_text(length: int) -> str:
+    """Texto en español de `length` caracteres (el contenido no importa, la forma sí)"""
+    words, size, i = [], 0, 0
+    while size < length:
+        word = _WORDS[i % len(_WORDS)]
+        words.append(word)
+        size += len(word) + 1
+        i += 1
+    return " ".join(words)[:max(length, 1)]
+
+
+_blob_cache: Dict[str, bytes] = {}
+
+# JPEG válido mínimo (8x8 gris, 159 bytes): SOI + APP0 (JFIF), después van los comentarios
+_JPEG_HEAD = bytes.fromhex("ffd8ffe000104a46494600010100000100010000")
+_JPEG_BODY = bytes.fromhex(
+    "ffdb004300100b0c0e0c0a100e0d0e1211101318281a181616183123251d283a333d3c3933383740485c4e"
+    "404457453738506d51575f626768673e4d71797064785c656763ffc0000b080008000801011100ffc400140001"
+    "00000000000000000000000000000000ffc40014100100000000000000000000000000000000ffda00080101"
+    "00003f003fffd9"
+)
+_JPEG_MAX_SEGMENT = 0xFFFF - 2  # Datos por segmento COM (el largo incluye sus 2 bytes)
+_PDF_PAGE_BYTES = 100_000  # Una página de texto por cada ~100 KB grabados (hasta 20)
+
+
+def _filler(seed: bytes, size: int) -> bytes:
+    return (seed * (size // len(seed) + 1))[:max(size, 0)]
+
+
+def _synth_jpeg(seed: bytes, size: int) -> bytes:
+    """JPEG decodificable; los bytes que faltan van en segmentos COM (0xFFFE)"""
+    missing = size - len(_JPEG_HEAD) - len(_JPEG_BODY)
+    segments = []
+    while missing > 4:
+        chunk = min(missing - 4, _JPEG_MAX_SEGMENT)
+        segments.append(b"\xff\xfe" + (chunk + 2).to_bytes(2, "big") + _filler(seed, chunk))
+        missing -= chunk + 4
+    # 1-4 bytes que no alcanzan para un segmento: después de EOI (los decodificadores los ignoran)
+    return _JPEG_HEAD + b"".join(segments) + _JPEG_BODY + bytes(max(missing, 0))
+
+
+def _synth_wav(seed: bytes, size: int) -> bytes:
+    """WAV PCM mono 16 bits a 16 kHz; las muestras son los bytes del seed (ruido)"""
+    import wave
+    from io import BytesIO
+
+    out = BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(16000)
+        writer.writeframes(_filler(seed, max(size - 44, 2) // 2 * 2))
+    return out.getvalue()
+
+
+def _synth_pdf(seed: bytes, size: int) -> bytes:
+    """PDF con capa de texto (palabras de la pregunta sintética); relleno en un comentario"""
+    pages = min(20, max(1, size // _PDF_PAGE_BYTES))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page in range(pages):
+        lines = [
+            " ".join(_WORDS[(seed[(page + line) % len(seed)] + line + i) % len(_WORDS)] for i in range(10))
+            for line in range(40)
+        ]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 50 780 Td {text} ET".encode("cp1252")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    def assemble(padding: bytes) -> bytes:
+        out = bytearray(b"%PDF-1.4\n" + padding)
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+        return bytes(out)
+
+    # Líneas de comentario ("%" + hex + "\n"): el relleno no cambia el contenido del PDF.
+    # Se ajusta dos veces porque startxref puede ganar dígitos con el relleno
+    hex_line = b"%" + seed.hex().encode() + b"\n"
+    blob = assemble(b"")
+    padding = b""
+    for _ in range(3):
+        missing = size - len(blob)
+        if missing == 0 or len(padding) + missing < 2:
+            break
+        padding = _filler(hex_line, len(padding) + missing - 1) + b"\n"
+        blob = assemble(padding)
+    return blob
+
+
+_SYNTHESIZERS = {
+    "image/jpeg": _synth_jpeg,
+    "application/pdf": _synth_pdf,
+    "audio/wav": _synth_wav,
+    "audio/x-wav": _synth_wav,
+    "audio/wave": _synth_wav,
+}
+
+
+def synth_file(spec: Dict[str, Any]) -> bytes:
+    """
+    Bytes deterministas por hash: el mismo archivo en la traza → los mismos bytes.
+    JPEG, PDF y WAV son archivos válidos (el preprocesamiento los abre de verdad)
+    rellenados hasta el tamaño grabado; los demás MIME son bytes sin formato
+    """
+    key = f"{spec.get('hash')}:{spec['size']}"
+    blob = _blob_cache.get(key)
+    if blob is None:
+        seed = hashlib.sha256(key.encode()).digest()
+        synthesize = _SYNTHESIZERS.get(spec.get("mime", ""))
+        blob = synthesize(seed, spec["size"]) if synthesize else _filler(seed, spec["size"])
+        _blob_cache[key] = blob
+    return blob
+
+
+def _extension(mime: str) -> str:
+    return {
+        "image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "application/pdf": "pdf",
+        "audio/ogg": "ogg", "audio/wav": "wav", "audio/mpeg": "mp3", "video/mp4": "mp4",
+    }.get(mime, "bin")
+
+
+def build_request(record: Dict[str, Any], users: Dict[str, str]) -> Dict[str, Any]:
+    """Traduce un registro de la traza a argumentos de httpx"""
+    endpoint = record["endpoint"]
+    user_id = users.get(record.get("user", ""), fake_user_id(0))
+    url = endpoint.replace("{user_id}", user_id)
+    request: Dict[str, Any] = {"method": record.get("method", "GET"), "url": url}
+    if record.get("query"):
+        request["params"] = record["query"]
+
+    files = [
+        (f"f{i}.{_extension(spec['mime'])}", synth_file(spec), spec["mime"])
+        for i, spec in enumerate(record.get("files", []))
+    ]
+    if endpoint == "/qa":
+        request["data"] = {
+            "question": synth_text(record.get("question_len", 40)),
+            "use_files_api": str(record.get("use_files_api", False)).lower(),
+        }
+        request["files"] = [("files", f) for f in files]
+    elif endpoint == "/analyze-meal":
+        request["files"] = {"file": files[0]} if files else None
+        if record.get("log"):
+            # Auto-log: el usuario de la traza y el día de hoy (los días sembrados terminan hoy)
+            request["data"] = {"log": "true", "user_id": user_id, "date": date.today().isoformat()}
+    elif endpoint == "/chat/{user_id}" and request["method"] == "POST":
+        request["json"] = {"message": synth_text(record.get("message_len", 30)), "user_name": "Replay"}
+    return request
+
+
+def repeat_stats(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fracción de archivos cuyo contenido ya había aparecido antes en la traza"""
+    seen, total, repeated = set(), 0, 0
+    for record in records:
+        for spec in record.get("files", []):
+            total += 1
+            if spec.get("hash") in seen:
+                repeated += 1
+            seen.add(spec.get("hash"))
+    return {
+        "files": total,
+        "repeated_files": repeated,
+        "repeat_ratio": round(repeated / total, 3) if total else 0.0,
+    }
+
+
+async def replay(base_url: str, records: List[Dict[str, Any]], speed: float, users: Dict[str, str]):
+    import httpx
+
+    by_endpoint: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    recorded: Dict[str, List[float]] = defaultdict(list)
+    origin = records[0].get("t", 0.0) if records else 0.0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        started = time.perf_counter()
+
+        async def fire(record):
+            delay = (record.get("t", 0.0) - origin) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            key = f"{record.get('method', 'GET')} {record['endpoint']}"
+            t0 = time.perf_counter()
+            try:
+                response = await client.request(**build_request(record, users))
+                if response.status_code >= 400 or not response.json().get("ok", True):
+                    errors[key] += 1
+            except Exception:
+                errors[key] += 1
+            by_endpoint[key].append((time.perf_counter() - t0) * 1000)
+            if "latency_ms" in record:
+                recorded[key].append(record["latency_ms"])
+
+        await asyncio.gather(*(fire(r) for r in records))
+        elapsed = time.perf_counter() - started
+
+        cache_stats = None
+        try:
+            response = await client.get("/cache/stats")
+            if response.status_code == 200:
+                cache_stats = response.json()
+        except Exception:
+            pass
+
+    report = {"elapsed_s": round(elapsed, 2), "endpoints": {}, "cache_stats": cache_stats}
+    for key, latencies in sorted(by_endpoint.items()):
+        summary = summarize(latencies, errors[key], elapsed)
+        if recorded[key]:
+            summary["recorded_p50_ms"] = round(sorted(recorded[key])[len(recorded[key]) // 2], 1)
+        report["endpoints"][key] = summary
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay de trazas de tráfico de NutriApp")
+    parser.add_argument("trace", type=Path, help="Archivo JSONL grabado con TRACE_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de aceleración (2 = doble de rápido)")
+    parser.add_argument("--limit", type=int, default=0, help="Solo los primeros N requests")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800.0)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=15.0)
+    parser.add_argument("--output", type=Path, help="Guardar el reporte JSON")
+    args = parser.parse_args(argv)
+
+    records = load_trace(args.trace)
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        print("Traza vacía")
+        return 1
+
+    # Cada hash de usuario de la traza se mapea a un usuario sintético estable
+    user_hashes = sorted({r["user"] for r in records if r.get("user")})
+    users = {h: fake_user_id(i) for i, h in enumerate(user_hashes)}
+
+    gemini = FakeGeminiConfig(latency_ms=args.gemini_latency_ms, failure_rate=args.gemini_failure_rate, seed=1)
+    base_url, server, backend = boot_app(gemini, args.supabase_latency_ms, max(len(users), 1))
+    try:
+        report = asyncio.run(replay(base_url, records, args.speed, users))
+    finally:
+        server.should_exit = True
+        backend.stop()
+
+    report["requests"] = len(records)
+    report["speed"] = args.speed
+    report["content_repeats"] = repeat_stats(records)
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    print(f"Replay de {len(records)} requests a {args.speed}x en {report['elapsed_s']}s")
+    for key, s in report["endpoints"].items():
+        recorded = f"  (grabado p50={s['recorded_p50_ms']}ms)" if "recorded_p50_ms" in s else ""
+        print(
+            f"{key:<40} n={s['requests']:<5} err={s['errors']:<4} p50={s['p50_ms']:>8.1f}ms "
+            f"p95={s['p95_ms']:>8.1f}ms p99={s['p99_ms']:>8.1f}ms{recorded}"
+        )
+    repeats = report["content_repeats"]
+    print(f"Archivos repetidos: {repeats['repeated_files']}/{repeats['files']} ({repeats['repeat_ratio']:.1%})")
+    if report["cache_stats"]:
+        print(f"Cache de la app: {json.dumps(report['cache_stats'])}")
+    print(f"RSS pico: {report['peak_rss_mb']} MB")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
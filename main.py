@@ -10,9 +10,10 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from src.nutrition_api import app
-import uvicorn
 
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.environ.get("PORT", 8000))
     print(f"🚀 NutriApp API iniciando...")
     print(f"📚 Swagger docs: http://localhost:{port}/docs")
@@ -0,0 +1,650 @@
+"""
+Cache de dos niveles compartible entre workers y réplicas
+- L1: LRU en memoria del proceso (TTL por entrada + tamaño máximo)
+- L2: compartido entre procesos: SQLite en disco (workers del mismo host) o
+  Redis (varias réplicas). Redis es opcional: si falta se usa SQLite
+- Protección contra estampida: single-flight por proceso (un solo cálculo por clave
+  en vuelo) y lease en L2 (un solo worker calcula; el resto espera su valor)
+- Caches con nombre (meal_analysis, files_api, ...) con TTL propio (CacheConfig.TTL_BY_NAME)
+- Read-through con stale-while-revalidate (get_or_revalidate): vencido el TTL, el valor
+  se sigue sirviendo STALE_BY_NAME segundos más mientras se refresca en segundo plano
+- delete() y set_fresh() invalidan también los cálculos en curso: lo que se leyó antes
+  de la escritura no se guarda. Desde el event loop: adelete/aset/aset_fresh (L1 al
+  instante, el I/O del L2 en un hilo)
+- Un error del L2 nunca rompe el request: se registra y se trata como miss
+- El L2 guarda JSON con marcas de tipo, nunca pickle (Redis y el archivo SQLite son
+  compartidos): los modelos pydantic vuelven solo si su clase está en register_model
+- Apagado por defecto (CacheConfig.ENABLED o CACHE_ENABLED); producción lo activa
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+from structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from orchestration.config import CacheConfig
+
+log = get_logger("cache")
+
+_MISSING = object()
+_KEY_PREFIX = "nutriapp:"
+
+
+def content_key(*parts: Any) -> str:
+    """Clave estable para contenido (bytes o texto): blake2b de 128 bits en hex"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part if isinstance(part, (bytes, bytearray, memoryview)) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+# ===========================
+# Serialización del L2 (JSON)
+# ===========================
+
+_models: Dict[str, type] = {}
+
+
+def register_model(*classes: type):
+    """Modelos pydantic que los caches pueden guardar en L2 (el resto queda solo en L1)"""
+    for cls in classes:
+        _models[cls.__qualname__] = cls
+
+
+def _encode(value: Any) -> Any:
+    # Cada contenedor es un objeto JSON de una sola marca: l(ist), t(uple), d(ict), b(ytes), m(odel)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return {"l": [_encode(item) for item in value]}
+    if isinstance(value, tuple):
+        return {"t": [_encode(item) for item in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value):
+            raise TypeError("dict con claves que no son texto")
+        return {"d": {k: _encode(v) for k, v in value.items()}}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"b": base64.b64encode(value).decode("ascii")}
+    name = type(value).__qualname__
+    if _models.get(name) is type(value):
+        return {"m": name, "v": value.model_dump(mode="json")}
+    raise TypeError(f"{type(value).__name__} no está registrado (register_model)")
+
+
+def _decode(data: Any) -> Any:
+    if not isinstance(data, dict):
+        return data
+    if "m" in data:
+        cls = _models.get(data["m"])
+        if cls is None:
+            raise ValueError(f"modelo desconocido: {data['m']}")
+        return cls.model_validate(data["v"])
+    (tag, payload), = data.items()
+    if tag == "l":
+        return [_decode(item) for item in payload]
+    if tag == "t":
+        return tuple(_decode(item) for item in payload)
+    if tag == "d":
+        return {k: _decode(v) for k, v in payload.items()}
+    if tag == "b":
+        return base64.b64decode(payload)
+    raise ValueError(f"marca desconocida: {tag}")
+
+
+def dumps_value(value: Any) -> bytes:
+    """Valor → bytes para L2; TypeError si tiene tipos no admitidos"""
+    return orjson.dumps(_encode(value))
+
+
+def loads_value(blob: bytes) -> Any:
+    """bytes de L2 → valor; nunca ejecuta código (ValueError si no es un valor válido)"""
+    return _decode(orjson.loads(blob))
+
+
+# ===========================
+# L1: memoria del proceso
+# ===========================
+
+class MemoryLRU:
+    """LRU con TTL por entrada (thread-safe: los nodos del grafo corren en hilos)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ===========================
+# L2: compartido entre procesos
+# ===========================
+
+class SQLiteStore:
+    """
+    L2 en un archivo SQLite (modo WAL) compartido por los workers de un mismo host.
+    Una conexión por hilo; expiración perezosa y poda periódica por tamaño.
+    """
+
+    _PRUNE_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache(expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        row = self._conn().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        return (row[0], remaining) if remaining > 0 else None
+
+    def set(self, key: str, blob: bytes, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, blob, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            # Primero las que vencen antes (aproximación de LRU sin escribir en cada lectura)
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def extend_lease(self, key: str, ttl: float):
+        self._conn().execute("UPDATE leases SET expires_at = ? WHERE key = ?", (time.time() + ttl, key))
+
+    def release_lease(self, key: str):
+        self._conn().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+
+class RedisStore:
+    """
+    L2 en Redis (o compatible) para varias réplicas. El límite de tamaño lo aplica
+    el servidor (maxmemory + allkeys-lru); aquí solo se fija el TTL de cada clave.
+    """
+
+    def __init__(self, url: str):
+        import redis  # dependencia opcional
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        blob, ttl_ms = self._client.pipeline().get(key).pttl(key).execute()
+        if blob is None or ttl_ms == -2:
+            return None
+        return blob, (ttl_ms / 1000 if ttl_ms > 0 else float("inf"))
+
+    def set(self, key: str, blob: bytes, ttl: float):
+        self._client.set(key, blob, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        return bool(self._client.set(f"lease:{key}", b"1", nx=True, px=max(1, int(ttl * 1000))))
+
+    def extend_lease(self, key: str, ttl: float):
+        self._client.pexpire(f"lease:{key}", max(1, int(ttl * 1000)))
+
+    def release_lease(self, key: str):
+        self._client.delete(f"lease:{key}")
+
+
+# ===========================
+# Cache con nombre
+# ===========================
+
+class Cache:
+    """
+    Cache con nombre sobre L1 (+ L2 opcional). Los valores deben tratarse como
+    inmutables (L1 devuelve el mismo objeto). En L2 solo entran escalares, listas,
+    tuplas, dicts, bytes y modelos registrados (register_model).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_entries: int,
+        l2: Any = None,
+        lease_seconds: float = 30.0,
+        enabled: bool = True,
+        stale_seconds: float = 0.0,
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.enabled = enabled
+        self.lease_seconds = lease_seconds
+        self._l1 = MemoryLRU(max_entries)
+        self._l2 = l2
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._invalidations = 0  # Un cálculo que empezó antes de un delete/set_fresh no se guarda
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.refresh_errors = 0
+        self.l2_errors = 0
+
+    # --- L2 (nunca lanza) ---
+
+    def _full_key(self, key: str) -> str:
+        return f"{_KEY_PREFIX}{self.name}:{key}"
+
+    def _l2_call(self, method: str, *args) -> Any:
+        try:
+            return getattr(self._l2, method)(*args)
+        except Exception as e:
+            self.l2_errors += 1
+            log.warning("cache L2 falló", extra={"cache": self.name, "op": method, "error": str(e)})
+            return None
+
+    def _l2_get(self, key: str) -> Any:
+        if self._l2 is None:
+            return _MISSING
+        hit = self._l2_call("get", self._full_key(key))
+        if hit is None:
+            return _MISSING
+        blob, remaining = hit
+        try:
+            value = loads_value(blob)
+        except Exception:
+            return _MISSING  # Formato viejo o entrada ajena
+        self._l1.set(key, value, min(remaining, self.ttl_seconds))
+        return value
+
+    def _l2_set(self, key: str, value: Any, ttl: float):
+        if self._l2 is None:
+            return
+        try:
+            blob = dumps_value(value)
+        except TypeError as e:
+            self.l2_errors += 1
+            log.warning("cache: valor no serializable, solo en L1", extra={"cache": self.name, "error": str(e)})
+            return
+        self._l2_call("set", self._full_key(key), blob, ttl)
+
+    # --- API síncrona (nodos del grafo, código en hilos) ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        value = self._l1.get(key)
+        if value is not _MISSING:
+            self.hits_l1 += 1
+            return value
+        value = self._l2_get(key)
+        if value is not _MISSING:
+            self.hits_l2 += 1
+            return value
+        self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        ttl = ttl or self.ttl_seconds
+        self._l1.set(key, value, ttl)
+        self._l2_set(key, value, ttl)
+
+    def delete(self, key: str):
+        self._invalidations += 1
+        self._l1.delete(key)
+        if self._l2 is not None:
+            self._l2_call("delete", self._full_key(key))
+
+    # --- Escrituras desde el event loop (L1 al instante, L2 en un hilo) ---
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        ttl = ttl or self.ttl_seconds
+        self._l1.set(key, value, ttl)
+        if self._l2 is not None:
+            await asyncio.to_thread(self._l2_set, key, value, ttl)
+
+    async def adelete(self, key: str):
+        self._invalidations += 1
+        self._l1.delete(key)
+        if self._l2 is not None:
+            await asyncio.to_thread(self._l2_call, "delete", self._full_key(key))
+
+    # --- API async con protección contra estampida ---
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        """
+        Retorna el valor cacheado o lo calcula con `compute()` una sola vez:
+        requests concurrentes con la misma clave (en este proceso) esperan el mismo
+        cálculo, y con L2 los demás workers esperan el valor del que tiene el lease.
+        El cálculo corre en su propia tarea: si el que lo inició se cancela, los demás
+        lo siguen esperando. Las excepciones de `compute` se propagan y no se cachean.
+        """
+        if not self.enabled:
+            return await compute()
+
+        value = self._l1.get(key)
+        if value is not _MISSING:
+            self.hits_l1 += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        task = asyncio.create_task(self._load_or_compute(key, compute, ttl or self.ttl_seconds))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # evita "never retrieved"
+        return await asyncio.shield(task)
+
+    async def _load_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        leased = False
+        if self._l2 is not None:
+            value = await asyncio.to_thread(self._l2_get, key)
+            if value is not _MISSING:
+                self.hits_l2 += 1
+                return value
+            full_key = self._full_key(key)
+            leased = bool(await asyncio.to_thread(self._l2_call, "acquire_lease", full_key, self.lease_seconds))
+            if not leased:
+                value = await self._wait_for_l2(key)
+                if value is not _MISSING:
+                    self.coalesced += 1
+                    return value
+
+        self.misses += 1
+        invalidations = self._invalidations
+        try:
+            value = await compute()
+            if self._invalidations == invalidations:
+                self._l1.set(key, value, ttl)
+                await asyncio.to_thread(self._l2_set, key, value, ttl)
+            return value
+        finally:
+            if leased:
+                await asyncio.to_thread(self._l2_call, "release_lease", self._full_key(key))
+
+    async def _wait_for_l2(self, key: str) -> Any:
+        """Otro worker tiene el lease: sondea L2 hasta que publique el valor (o venza el lease)"""
+        deadline = time.monotonic() + self.lease_seconds
+        delay = 0.02
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            value = await asyncio.to_thread(self._l2_get, key)
+            if value is not _MISSING:
+                return value
+            delay = min(delay * 2, 0.5)
+        return _MISSING
+
+    # --- Read-through con stale-while-revalidate ---
+
+    async def get_or_revalidate(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+    ) -> Any:
+        """
+        Como get_or_compute, pero pasado el TTL el valor se sigue retornando durante
+        stale_seconds mientras una sola tarea de fondo lo recalcula. Un refresco que
+        falla deja el valor viejo (se reintenta en la siguiente lectura)
+        """
+        ttl = ttl or self.ttl_seconds
+
+        async def stamped():
+            return time.time() + ttl, await compute()
+
+        fresh_until, value = await self.get_or_compute(key, stamped, ttl + self.stale_seconds)
+        if fresh_until <= time.time() and self.enabled:
+            self.stale_hits += 1
+            if key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(self._refresh(key, stamped, ttl + self.stale_seconds))
+        return value
+
+    def set_fresh(self, key: str, value: Any, ttl: Optional[float] = None, discard_inflight: bool = True):
+        """
+        Guarda un valor conocido (ej. la fila de un evento de la base) para
+        get_or_revalidate, fresco por `ttl`. Descarta las lecturas en curso de antes,
+        salvo discard_inflight=False (el valor viene de una lectura, no de una escritura)
+        """
+        if not self.enabled:
+            return
+        ttl = ttl or self.ttl_seconds
+        if discard_inflight:
+            self._invalidations += 1
+        self.set(key, (time.time() + ttl, value), ttl + self.stale_seconds)
+
+    async def aset_fresh(self, key: str, value: Any, ttl: Optional[float] = None, discard_inflight: bool = True):
+        """set_fresh desde el event loop (el L2 se escribe en un hilo)"""
+        if not self.enabled:
+            return
+        ttl = ttl or self.ttl_seconds
+        if discard_inflight:
+            self._invalidations += 1
+        await self.aset(key, (time.time() + ttl, value), ttl + self.stale_seconds)
+
+    @property
+    def generation(self) -> int:
+        """Cambia con cada delete/set_fresh/clear_local (tomarla antes de leer la fuente)"""
+        return self._invalidations
+
+    async def aset_fresh_if_unchanged(self, key: str, value: Any, generation: int, ttl: Optional[float] = None) -> bool:
+        """
+        Guarda un valor leído de la fuente (como set_fresh con discard_inflight=False)
+        solo si nada se invalidó desde `generation`: si no, hay algo más nuevo
+        """
+        if self._invalidations != generation:
+            return False
+        await self.aset_fresh(key, value, ttl, discard_inflight=False)
+        return True
+
+    def contains(self, key: str) -> bool:
+        """Si `key` está en L1 (fresca o stale), sin contar hit/miss"""
+        return self.enabled and self._l1.get(key) is not _MISSING
+
+    async def _refresh(self, key: str, stamped: Callable[[], Awaitable[Any]], ttl: float):
+        invalidations = self._invalidations
+        try:
+            entry = await stamped()
+            if self._invalidations == invalidations:
+                self._l1.set(key, entry, ttl)
+                await asyncio.to_thread(self._l2_set, key, entry, ttl)
+        except Exception as e:
+            self.refresh_errors += 1
+            log.warning("cache: refresco en segundo plano falló", extra={"cache": self.name, "error": str(e)})
+        finally:
+            self._refreshing.pop(key, None)
+
+    def clear_local(self):
+        """Vacía el L1 de este proceso (el L2 expira por TTL)"""
+        self._invalidations += 1
+        self._l1.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_l1 + self.hits_l2 + self.coalesced + self.misses
+        hits = self.hits_l1 + self.hits_l2 + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "entries_l1": len(self._l1),
+            "hits_l1": self.hits_l1,
+            "hits_l2": self.hits_l2,
+            "coalesced": self.coalesced,
+            "stale_hits": self.stale_hits,
+            "refresh_errors": self.refresh_errors,
+            "misses": self.misses,
+            "evictions_l1": self._l1.evictions,
+            "l2_errors": self.l2_errors,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ===========================
+# Registro de caches
+# ===========================
+
+_caches: Dict[str, Cache] = {}
+_l2_store: Any = _MISSING
+_registry_lock = threading.Lock()
+
+
+def build_l2(config: "CacheConfig") -> Any:
+    """Crea un L2 según CACHE_BACKEND / config (memory → sin L2), ej. para idempotency.py"""
+    backend = os.environ.get("CACHE_BACKEND", config.BACKEND)
+    if backend == "redis":
+        url = os.environ.get("REDIS_URL", config.REDIS_URL)
+        if url:
+            try:
+                return RedisStore(url)
+            except ImportError:
+                log.warning("CACHE_BACKEND=redis pero falta el paquete redis; usando SQLite")
+        else:
+            log.warning("CACHE_BACKEND=redis sin REDIS_URL; usando SQLite")
+        backend = "sqlite"
+    if backend == "sqlite":
+        path = os.environ.get("CACHE_SQLITE_PATH", config.SQLITE_PATH)
+        try:
+            return SQLiteStore(path, config.L2_MAX_ENTRIES)
+        except Exception as e:
+            log.warning("No se pudo abrir el cache SQLite; solo L1", extra={"path": path, "error": str(e)})
+    return None
+
+
+def get_cache(name: str) -> Cache:
+    """Obtiene (o crea) el cache `name` con su TTL y tamaño de CacheConfig (*_BY_NAME)"""
+    global _l2_store
+    cache = _caches.get(name)
+    if cache is not None:
+        return cache
+    # Import diferido: orchestration importa este módulo (graph.py)
+    from orchestration.config import get_config
+
+    with _registry_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            config = get_config().cache
+            enabled = os.environ.get("CACHE_ENABLED", str(config.ENABLED)).lower() in ("1", "true", "yes")
+            if _l2_store is _MISSING:
+                _l2_store = build_l2(config) if enabled else None
+            cache = Cache(
+                name,
+                ttl_seconds=config.TTL_BY_NAME.get(name, config.TTL_SECONDS),
+                max_entries=config.MAX_ENTRIES_BY_NAME.get(name, config.MAX_ENTRIES),
+                l2=_l2_store,
+                lease_seconds=config.LEASE_SECONDS,
+                enabled=enabled,
+                stale_seconds=config.STALE_BY_NAME.get(name, 0),
+            )
+            _caches[name] = cache
+    return cache
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Estadísticas de todos los caches creados (lo expone GET /cache/stats)"""
+    l2 = type(_l2_store).__name__ if _l2_store not in (_MISSING, None) else None
+    return {"l2": l2, "caches": {name: cache.stats() for name, cache in sorted(_caches.items())}}
+
+
+def reset_caches():
+    """Olvida los caches y el L2 (tests/benchmarks que cambian la configuración)"""
+    global _l2_store
+    with _registry_lock:
+        _caches.clear()
+        _l2_store = _MISSING
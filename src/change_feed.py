@@ -0,0 +1,336 @@
+"""
+Change feed de user_metrics y daily_nutrition para los caches de usuario
+- Cada cambio de fila actualiza o invalida al instante lo cacheado: métricas (perfil,
+  contexto del chatbot), días recientes y el registro del día (INSERT/UPDATE traen la
+  fila nueva y se guarda como fresca; DELETE invalida)
+- realtime: Supabase Realtime (postgres_changes, paquete realtime de supabase-py). Un
+  supervisor revisa la conexión y reconecta con backoff
+- local: stand-in en el proceso (tests/benchmarks); publish() se puede llamar desde
+  cualquier hilo, ej. el FakePostgrest de benchmarks/fakes.py
+- Mientras el feed está suscrito los caches usan TTLs largos (ChangeFeedConfig.TTL_BY_NAME);
+  al suscribirse y al perder la conexión se descartan las entradas (pudo perderse algún
+  evento) y, sin feed, vuelven los TTLs normales
+- Eventos y cambios de suscripción se aplican en orden, de a uno, en una tarea del event
+  loop; el I/O del L2 sale a un hilo (API async de cache.Cache)
+"""
+
+import asyncio
+import os
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+from pydantic import ValidationError
+
+import supabase_client
+from cache import get_cache
+from structured_logging import get_logger
+from supabase_client import (
+    USER_CACHE_NAMES,
+    DailyNutrition,
+    UserMetrics,
+    cache_today_nutrition,
+    cache_user_metrics,
+    clear_user_caches,
+    invalidate_daily_nutrition,
+    invalidate_user_metrics,
+)
+
+if TYPE_CHECKING:
+    from orchestration.config import ChangeFeedConfig
+
+log = get_logger("change_feed")
+
+INSERT = "INSERT"
+UPDATE = "UPDATE"
+DELETE = "DELETE"
+
+CHANNEL_TOPIC = "nutriapp-cache-invalidation"
+
+
+async def apply_change(table: str, event: str, record: Optional[Dict[str, Any]], old_record: Optional[Dict[str, Any]] = None):
+    """
+    Refleja un cambio de fila en los caches. Sin user_id/date (ej. DELETE sin
+    REPLICA IDENTITY FULL, ver README) no se sabe qué entradas tocar: se descartan todas
+    """
+    record = record or {}
+    old_record = old_record or {}
+    user_id = record.get("user_id") or old_record.get("user_id")
+
+    if table == "user_metrics":
+        if not user_id:
+            clear_user_caches()
+            return
+        if event != DELETE and record:
+            try:
+                await cache_user_metrics(UserMetrics.model_validate(record))
+                return
+            except ValidationError:
+                pass
+        await invalidate_user_metrics(user_id)
+
+    elif table == "daily_nutrition":
+        date = record.get("date") or old_record.get("date")
+        if not user_id or not date:
+            clear_user_caches()
+            return
+        await invalidate_daily_nutrition(user_id, date)
+        if old_record.get("date") and old_record["date"] != date:
+            await invalidate_daily_nutrition(user_id, old_record["date"])  # UPDATE que cambió la fecha
+        if event != DELETE and record:
+            try:
+                await cache_today_nutrition(DailyNutrition.model_validate(record))
+            except ValidationError:
+                pass
+
+
+class _ChangeFeed:
+    """Lo común: aplicar eventos, TTLs según la suscripción y contadores"""
+
+    backend = ""
+
+    def __init__(self, config: "ChangeFeedConfig"):
+        self.config = config
+        self.subscribed = False
+        self._base_ttls: Dict[str, float] = {}
+        self.events = 0
+        self.errors = 0
+        self.subscriptions = 0
+        self._steps: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    # --- Pasos en orden (solo desde el event loop) ---
+
+    def _enqueue(self, step: Callable[[], Awaitable[None]]):
+        if self._steps is None:
+            self._steps = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run_steps())
+        self._steps.put_nowait(step)
+
+    async def _run_steps(self):
+        # De a uno: un DELETE no se adelanta a la escritura en L2 del UPDATE anterior
+        while True:
+            step = await self._steps.get()
+            try:
+                await step()
+            finally:
+                self._steps.task_done()
+
+    async def drain(self):
+        """Espera a que se apliquen los eventos y cambios de suscripción ya recibidos"""
+        if self._steps is not None:
+            await self._steps.join()
+
+    async def _stop_steps(self):
+        await self.drain()
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        self._steps, self._worker = None, None
+
+    def _on_change(self, table: str, event: str, record: Optional[Dict[str, Any]], old_record: Optional[Dict[str, Any]]):
+        self.events += 1
+        self._enqueue(lambda: self._apply(table, event, record, old_record))
+
+    async def _apply(self, table: str, event: str, record: Optional[Dict[str, Any]], old_record: Optional[Dict[str, Any]]):
+        try:
+            await apply_change(table, event, record, old_record)
+        except Exception as e:
+            self.errors += 1
+            log.warning("change feed: evento no aplicado", extra={"table": table, "event": event, "error": str(e)})
+
+    def _set_subscribed(self, subscribed: bool):
+        """Cambia el estado al instante; TTLs y descarte de entradas, en orden con los eventos"""
+        if subscribed == self.subscribed:
+            return
+        self.subscribed = subscribed
+        if subscribed:
+            self.subscriptions += 1
+        self._enqueue(lambda: self._apply_subscription(subscribed))
+        log.info("change feed: suscripción", extra={"backend": self.backend, "subscribed": subscribed})
+
+    async def _apply_subscription(self, subscribed: bool):
+        try:
+            # El primer get_cache abre el L2 (SQLite/Redis): en un hilo
+            caches = {name: await asyncio.to_thread(get_cache, name) for name in USER_CACHE_NAMES}
+            if not self._base_ttls:
+                self._base_ttls = {name: cache.ttl_seconds for name, cache in caches.items()}
+            for name, cache in caches.items():
+                cache.ttl_seconds = (
+                    self.config.TTL_BY_NAME.get(name, self._base_ttls[name]) if subscribed else self._base_ttls[name]
+                )
+            clear_user_caches()
+        except Exception as e:
+            self.errors += 1
+            log.warning("change feed: suscripción no aplicada", extra={"subscribed": subscribed, "error": str(e)})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "subscribed": self.subscribed,
+            "subscriptions": self.subscriptions,
+            "events": self.events,
+            "errors": self.errors,
+        }
+
+
+class LocalChangeFeed(_ChangeFeed):
+    """Stand-in en el proceso: los cambios se publican con publish()"""
+
+    backend = "local"
+
+    def __init__(self, config: "ChangeFeedConfig"):
+        super().__init__(config)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._set_subscribed(True)
+        await self.drain()
+
+    async def stop(self):
+        self._set_subscribed(False)
+        self._loop = None
+        await self._stop_steps()
+
+    def publish(self, table: str, event: str, record: Optional[Dict[str, Any]] = None, old_record: Optional[Dict[str, Any]] = None):
+        """Entrega un cambio (desde cualquier hilo); se aplica en el event loop del feed"""
+        if self._loop is None or table not in self.config.TABLES:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._on_change(table, event, record, old_record)
+        else:
+            self._loop.call_soon_threadsafe(self._on_change, table, event, record, old_record)
+
+
+class RealtimeChangeFeed(_ChangeFeed):
+    """postgres_changes de Supabase Realtime, con reconexión propia (auto_reconnect del cliente apagado)"""
+
+    backend = "realtime"
+
+    def __init__(self, config: "ChangeFeedConfig"):
+        super().__init__(config)
+        self._client: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def start(self):
+        """Conecta en segundo plano: el arranque no espera a Realtime"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._close_client()
+        self._set_subscribed(False)
+        await self._stop_steps()
+
+    async def _supervise(self):
+        backoff = 1.0
+        while True:
+            try:
+                await self._connect()
+                backoff = 1.0
+                while self.subscribed and self._connected():
+                    await asyncio.sleep(self.config.HEALTH_CHECK_SECONDS)
+                log.warning("change feed: conexión con Realtime perdida")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("change feed: no se pudo suscribir a Realtime", extra={"error": str(e)})
+            self._set_subscribed(False)
+            await self._close_client()
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    async def _connect(self):
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates  # viene con supabase-py
+
+        url, key = supabase_client.SUPABASE_URL, supabase_client.SUPABASE_KEY
+        if not url or not key:
+            raise ValueError("faltan las credenciales de Supabase")
+        self._client = AsyncRealtimeClient(f"{url.rstrip('/')}/realtime/v1", token=key, auto_reconnect=False)
+        await asyncio.wait_for(self._client.connect(), self.config.CONNECT_TIMEOUT_SECONDS)
+
+        channel = self._client.channel(CHANNEL_TOPIC)
+        for table in self.config.TABLES:
+            channel.on_postgres_changes("*", callback=self._on_payload, table=table, schema="public")
+
+        joined = asyncio.Event()
+
+        def on_state(state: Any, error: Optional[Exception]):
+            if state == RealtimeSubscribeStates.SUBSCRIBED:
+                self._set_subscribed(True)
+                joined.set()
+            else:
+                log.warning("change feed: canal fuera de servicio", extra={"state": str(state), "error": str(error)})
+                self._set_subscribed(False)
+                joined.set()
+
+        await channel.subscribe(on_state)
+        await asyncio.wait_for(joined.wait(), self.config.CONNECT_TIMEOUT_SECONDS)
+        if not self.subscribed:
+            raise RuntimeError("Realtime rechazó la suscripción")
+
+    def _connected(self) -> bool:
+        # El cliente no expone el fin de la conexión: termina su tarea de lectura
+        listen_task = getattr(self._client, "_listen_task", None)
+        return listen_task is not None and not listen_task.done()
+
+    def _on_payload(self, payload: Dict[str, Any]):
+        data = payload.get("data") or {}
+        event = data.get("type")
+        self._on_change(
+            data.get("table", ""),
+            str(getattr(event, "value", event)),
+            data.get("record"),
+            data.get("old_record"),
+        )
+
+    async def _close_client(self):
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "reconnects": self.reconnects}
+
+
+_feed: Optional[_ChangeFeed] = None
+
+
+def get_change_feed() -> Optional[_ChangeFeed]:
+    """El feed del proceso según CHANGE_FEED_BACKEND / ChangeFeedConfig.BACKEND (None si está apagado)"""
+    global _feed
+    if _feed is None:
+        from orchestration.config import get_config
+
+        config = get_config().change_feed
+        backend = os.environ.get("CHANGE_FEED_BACKEND", config.BACKEND)
+        if backend == "realtime":
+            _feed = RealtimeChangeFeed(config)
+        elif backend == "local":
+            _feed = LocalChangeFeed(config)
+    return _feed
+
+
+async def start_change_feed():
+    feed = get_change_feed()
+    if feed is not None:
+        await feed.start()
+
+
+async def shutdown_change_feed():
+    global _feed
+    if _feed is not None:
+        await _feed.stop()
+        _feed = None
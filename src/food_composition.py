@@ -0,0 +1,151 @@
+"""
+Tabla local de composición de alimentos (src/data/food_composition.csv)
+- El modelo solo identifica alimentos y gramos; los nutrientes se calculan aquí,
+  así los totales son reproducibles y cacheables
+- Índice por nombre ES/EN y sinónimos (normalizados: minúsculas, sin acentos ni plurales)
+- Un plato compuesto sin fila propia ("arroz con pollo") queda sin coincidencia en vez de
+  resolverse a uno de sus ingredientes
+- Los totales de una comida son un producto matriz-vector (numpy) sobre las filas encontradas
+- Las búsquedas se recuerdan en un LRU acotado (los nombres vienen del modelo, texto libre)
+"""
+
+import csv
+import difflib
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from structured_logging import get_logger
+
+log = get_logger("food_composition")
+
+DATA_PATH = Path(__file__).resolve().parent / "data" / "food_composition.csv"
+
+# Columnas de la tabla, en el mismo orden que MealNutrients
+NUTRIENT_COLUMNS = ("calories", "protein_g", "carbs_g", "fat_g", "fiber_g", "sugar_g", "sodium_mg")
+
+# Palabras que no cambian el alimento ("arroz con sal", "a la plancha" se resuelve por sinónimo)
+_FILLER = frozenset("de del con al la el los las y en a of with and the".split())
+# Similitud mínima para aceptar un nombre aproximado (errores de tipeo del modelo)
+_FUZZY_CUTOFF = 0.85
+# Nombres normalizados recordados por tabla
+LOOKUP_CACHE_SIZE = 4096
+
+
+def normalize_name(name: str) -> str:
+    """Minúsculas, sin acentos ni puntuación; plural simple → singular por palabra"""
+    name = unicodedata.normalize("NFKD", name.lower())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    words = []
+    for word in re.findall(r"[a-z0-9]+", name):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        # "frijoles" → "frijole" → "frijol" (y "pan"/"panes" coinciden); "tomate" queda igual
+        if len(word) > 3 and word.endswith("e") and word[-2] in "lnrdj":
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+
+class FoodTable:
+    """Tabla en memoria: nombres, matriz de nutrientes por 100 g e índice de alias"""
+
+    def __init__(self, path: Path = DATA_PATH, lookup_cache_size: int = LOOKUP_CACHE_SIZE):
+        import numpy as np
+
+        self.names: List[str] = []
+        self.names_en: List[str] = []
+        rows: List[List[float]] = []
+        self._aliases: Dict[str, int] = {}
+
+        with open(path, encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(line for line in f if not line.startswith("#"))
+            for index, row in enumerate(reader):
+                self.names.append(row["name_es"])
+                self.names_en.append(row["name_en"])
+                rows.append([float(row[column]) for column in NUTRIENT_COLUMNS])
+                aliases = [row["name_es"], row["name_en"], *filter(None, row["synonyms"].split("|"))]
+                for alias in aliases:
+                    # El primer alimento que declara un alias se queda con él
+                    self._aliases.setdefault(normalize_name(alias), index)
+
+        self.values = np.asarray(rows, dtype=np.float64)  # (alimentos, nutrientes) por 100 g
+        # Alias por cantidad de palabras (para buscar el más específico dentro de un nombre)
+        self._alias_words = sorted(
+            ((alias, frozenset(alias.split()) - _FILLER) for alias in self._aliases),
+            key=lambda item: len(item[1]),
+            reverse=True,
+        )
+        # lru_cache es thread-safe y acotado: nombres inventados no crecen sin límite
+        self._resolve = lru_cache(maxsize=lookup_cache_size)(self._resolve_uncached)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Fila del alimento (None si no hay coincidencia razonable)"""
+        return self._resolve(normalize_name(name))
+
+    def _resolve_uncached(self, key: str) -> Optional[int]:
+        index = self._aliases.get(key)
+        ambiguous = False
+        if index is None:
+            index, ambiguous = self._contained_alias(key)
+        if index is None and not ambiguous:
+            close = difflib.get_close_matches(key, self._aliases.keys(), n=1, cutoff=_FUZZY_CUTOFF)
+            index = self._aliases[close[0]] if close else None
+        return index
+
+    def _contained_alias(self, key: str) -> Tuple[Optional[int], bool]:
+        """
+        Alias más específico contenido en el nombre: "arroz blanco con cilantro" → arroz blanco.
+        Si los más específicos son de alimentos distintos ("arroz con pollo", "helado de
+        chocolate") es un plato compuesto: ninguno (ambiguo) en vez del primero de la tabla.
+        Retorna (fila o None, ambiguo)
+        """
+        words = set(key.split()) - _FILLER
+        size, matches = 0, set()
+        for alias, alias_words in self._alias_words:
+            if len(alias_words) < size:
+                break
+            if alias_words and alias_words <= words:
+                size = len(alias_words)
+                matches.add(self._aliases[alias])
+        if len(matches) == 1:
+            return matches.pop(), False
+        return None, len(matches) > 1
+
+    def compute(self, items: Sequence[Tuple[str, float]]) -> Tuple[Dict[str, float], List[Optional[str]]]:
+        """
+        Totales de una comida a partir de (alimento, gramos).
+        Retorna (nutrientes por columna, alimento de la tabla por ítem o None si no se encontró)
+        """
+        import numpy as np
+
+        indexes = [self.lookup(name) for name, _ in items]
+        found = [i for i, index in enumerate(indexes) if index is not None]
+        totals = np.zeros(len(NUTRIENT_COLUMNS))
+        if found:
+            rows = np.fromiter((indexes[i] for i in found), dtype=np.intp, count=len(found))
+            grams = np.fromiter((max(0.0, float(items[i][1])) for i in found), dtype=np.float64, count=len(found))
+            totals = (grams / 100.0) @ self.values[rows]
+        nutrients = {column: round(float(value), 1) for column, value in zip(NUTRIENT_COLUMNS, totals)}
+        return nutrients, [self.names[index] if index is not None else None for index in indexes]
+
+
+_table: Optional[FoodTable] = None
+_table_lock = threading.Lock()
+
+
+def get_food_table() -> FoodTable:
+    """Obtiene (o carga) la tabla del proceso (singleton)"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = FoodTable()
+                log.info("tabla de alimentos cargada", extra={"foods": len(_table), "aliases": len(_table._aliases)})
+    return _table
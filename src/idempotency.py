@@ -0,0 +1,224 @@
+"""
+Idempotency-Key para los POST costosos (/analyze-meal, /qa, /chat)
+- La primera respuesta exitosa se guarda (IdempotencyConfig.TTL_SECONDS) y se repite en
+  los reintentos con el header Idempotent-Replayed: true
+- Store propio, activo aunque CacheConfig.ENABLED sea False: L1 del proceso + el L2 de
+  CacheConfig.BACKEND (SQLite/Redis) para que lo vean todos los workers. Guarda JSON
+- Un reintento que llega mientras el original sigue en curso:
+  - en el mismo proceso espera ese mismo resultado en vez de llamar otra vez al modelo
+  - en otro worker responde 409 con Retry-After: el original tiene un lease en L2 que se
+    renueva mientras el handler corre
+- El handler corre en su propia tarea: si el cliente corta la conexión termina igual y
+  su respuesta queda guardada para el reintento
+- Los errores (excepciones del handler, o respuestas que `should_store` rechaza) no se
+  guardan: el cliente puede reintentar con la misma clave
+- La clave queda atada al request: reusarla con otro payload responde 422
+"""
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from cache import MemoryLRU, build_l2, content_key
+from json_response import FastJSONResponse
+from structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from orchestration.config import IdempotencyConfig
+
+log = get_logger("idempotency")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_KEY_PREFIX = "nutriapp:idempotency-v2:"
+
+EXECUTED = "executed"  # Este request ejecutó el handler
+REPLAYED = "replayed"  # Respuesta guardada (o la de otro request en curso en este proceso)
+IN_PROGRESS = "in_progress"  # El original sigue en curso en otro worker
+
+Entry = Dict[str, Any]  # {"fingerprint": ..., "body": ...}
+
+
+class IdempotencyStore:
+    """Respuestas por clave (L1 + L2 opcional) y requests en curso del proceso"""
+
+    def __init__(self, config: "IdempotencyConfig", l2: Any = None):
+        self.config = config
+        self._l1 = MemoryLRU(config.MAX_ENTRIES)
+        self._l2 = l2
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.in_progress = 0
+        self.l2_errors = 0
+
+    # --- L2 (nunca lanza) ---
+
+    def _l2_call(self, method: str, *args, default: Any = None) -> Any:
+        if self._l2 is None:
+            return default
+        try:
+            return getattr(self._l2, method)(_KEY_PREFIX + args[0], *args[1:])
+        except Exception as e:
+            self.l2_errors += 1
+            log.warning("idempotency: L2 falló", extra={"op": method, "error": str(e)})
+            return default
+
+    def get(self, key: str) -> Optional[Entry]:
+        entry = self._l1.get(key)
+        if isinstance(entry, dict):
+            return entry
+        hit = self._l2_call("get", key)
+        if hit is None:
+            return None
+        blob, remaining = hit
+        try:
+            entry = orjson.loads(blob)
+        except orjson.JSONDecodeError:
+            return None
+        self._l1.set(key, entry, min(remaining, self.config.TTL_SECONDS))
+        return entry
+
+    def put(self, key: str, entry: Entry):
+        self._l1.set(key, entry, self.config.TTL_SECONDS)
+        self._l2_call("set", key, orjson.dumps(entry), self.config.TTL_SECONDS)
+
+    # --- Requests en curso ---
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+        should_store: Optional[Callable[[Any], bool]] = None,
+    ) -> Tuple[str, Optional[Entry]]:
+        """(EXECUTED | REPLAYED | IN_PROGRESS, entrada); las excepciones del handler se propagan"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            outcome, entry = await asyncio.shield(task)
+            return (REPLAYED if outcome == EXECUTED else outcome), entry
+
+        task = asyncio.create_task(self._resolve(key, fingerprint, handler, should_store))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # evita "never retrieved"
+        return await asyncio.shield(task)
+
+    async def _resolve(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]],
+        should_store: Optional[Callable[[Any], bool]],
+    ) -> Tuple[str, Optional[Entry]]:
+        entry = await asyncio.to_thread(self.get, key)
+        if entry is not None:
+            self.replayed += 1
+            return REPLAYED, entry
+
+        leased = await asyncio.to_thread(self._l2_call, "acquire_lease", key, self.config.LEASE_SECONDS, default=True)
+        if not leased:
+            entry = await asyncio.to_thread(self.get, key)  # Pudo terminar entre las dos lecturas
+            if entry is not None:
+                self.replayed += 1
+                return REPLAYED, entry
+            self.in_progress += 1
+            return IN_PROGRESS, None
+
+        renew = asyncio.create_task(self._renew_lease(key)) if self._l2 is not None else None
+        try:
+            self.executed += 1
+            body = jsonable_encoder(await handler())
+            entry = {"fingerprint": fingerprint, "body": body}
+            if should_store is None or should_store(body):
+                await asyncio.to_thread(self.put, key, entry)
+            return EXECUTED, entry
+        finally:
+            if renew is not None:
+                renew.cancel()
+                await asyncio.to_thread(self._l2_call, "release_lease", key)
+
+    async def _renew_lease(self, key: str):
+        """Mantiene el lease mientras el handler corre (los otros workers responden 409)"""
+        while True:
+            await asyncio.sleep(self.config.LEASE_SECONDS / 3)
+            await asyncio.to_thread(self._l2_call, "extend_lease", key, self.config.LEASE_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "l2": type(self._l2).__name__ if self._l2 is not None else None,
+            "entries_l1": len(self._l1),
+            "inflight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "in_progress": self.in_progress,
+            "l2_errors": self.l2_errors,
+        }
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Obtiene (o crea) el store del proceso (singleton; solo desde el event loop)"""
+    global _store
+    if _store is None:
+        from orchestration.config import get_config
+
+        config = get_config()
+        _store = IdempotencyStore(config.idempotency, build_l2(config.cache))
+    return _store
+
+
+def reset_idempotency_store():
+    """Olvida el store (tests/benchmarks que cambian la configuración)"""
+    global _store
+    _store = None
+
+
+async def run_idempotent(
+    idempotency_key: Optional[str],
+    scope: str,
+    handler: Callable[[], Awaitable[Any]],
+    *fingerprint_parts: Any,
+    should_store: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """
+    Ejecuta `handler` (debe lanzar en caso de error) una sola vez por
+    (scope, Idempotency-Key). `scope` separa endpoints y usuarios (ej. "/chat/<user_id>");
+    `fingerprint_parts` identifican el payload (bytes o texto). Sin clave no hace nada.
+    `should_store(body)` descarta respuestas que reportan un error transitorio sin lanzar
+    """
+    if idempotency_key is None:
+        return await handler()
+    key = idempotency_key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{IDEMPOTENCY_HEADER}' debe tener entre 1 y {MAX_KEY_LENGTH} caracteres",
+        )
+
+    store = get_idempotency_store()
+    fingerprint = content_key(*fingerprint_parts)
+    outcome, entry = await store.run(content_key(scope, key), fingerprint, handler, should_store)
+    if outcome == IN_PROGRESS:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Hay un request en curso con esta '{IDEMPOTENCY_HEADER}'; reintenta en unos segundos",
+            headers={"Retry-After": str(store.config.RETRY_AFTER_SECONDS)},
+        )
+    if entry["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail=f"'{IDEMPOTENCY_HEADER}' ya se usó con otro request",
+        )
+    headers = None if outcome == EXECUTED else {REPLAYED_HEADER: "true"}
+    return FastJSONResponse(entry["body"], headers=headers)
@@ -0,0 +1,374 @@
+"""
+Jobs asíncronos para /qa largos (PDFs y videos grandes)
+- POST /qa/jobs encola y responde al instante con el id; GET /qa/jobs/{id} para polling
+- Pool acotado: WORKERS jobs a la vez (cada uno en un hilo) y como máximo MAX_QUEUED
+  en espera; si la cola está llena se lanza JobQueueFull (→ 503 con Retry-After)
+- Estado en un store local: memoria (solo este proceso) o SQLite (lo ven todos los
+  workers del host; sobrevive a reinicios, los jobs interrumpidos quedan como failed)
+- Webhook opcional al terminar: POST con el mismo JSON que el polling, firmado con
+  HMAC-SHA256 si JOBS_WEBHOOK_SECRET está definido, con reintentos y backoff. Solo a
+  hosts de WEBHOOK_ALLOWED_HOSTS que resuelvan a direcciones públicas (SSRF), sin redirects
+- Las escrituras al store (SQLite) salen del event loop con asyncio.to_thread
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from structured_logging import get_logger
+
+if TYPE_CHECKING:
+    from orchestration.config import JobsConfig
+
+log = get_logger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFull(RuntimeError):
+    """Demasiados jobs en espera (back-pressure): el cliente debería reintentar"""
+
+
+class WebhookNotAllowed(ValueError):
+    """webhook_url fuera de la allowlist o que resuelve a una dirección interna (→ 400)"""
+
+
+# ===========================
+# Webhooks (SSRF)
+# ===========================
+
+def _allowed_hosts(config: "JobsConfig") -> List[str]:
+    raw = os.environ.get("JOBS_WEBHOOK_ALLOWED_HOSTS")
+    hosts = raw.split(",") if raw is not None else config.WEBHOOK_ALLOWED_HOSTS
+    return [host.strip().lower() for host in hosts if host.strip()]
+
+
+def _public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])  # sin scope id de IPv6
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # is_global excluye loopback, redes privadas, link-local (metadata 169.254.169.254), CGNAT y reservadas
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_webhook_url(url: str, config: "JobsConfig"):
+    """
+    Valida un webhook_url antes de encolar y antes de cada envío: http(s), host en
+    WEBHOOK_ALLOWED_HOSTS y todas sus direcciones públicas. Lanza WebhookNotAllowed
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme.lower() not in ("http", "https") or not host:
+        raise WebhookNotAllowed("'webhook_url' debe ser una URL http(s)")
+    allowed = _allowed_hosts(config)
+    if not allowed:
+        raise WebhookNotAllowed("webhooks deshabilitados (jobs.WEBHOOK_ALLOWED_HOSTS vacío)")
+    if not any(host == entry or (entry.startswith(".") and host.endswith(entry)) for entry in allowed):
+        raise WebhookNotAllowed(f"host de 'webhook_url' no permitido: {host}")
+    try:
+        port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (ValueError, OSError) as e:
+        raise WebhookNotAllowed(f"'webhook_url' inválido: {e}")
+    if not infos or not all(_public_address(info[4][0]) for info in infos):
+        raise WebhookNotAllowed(f"'webhook_url' resuelve a una dirección interna: {host}")
+
+
+# ===========================
+# Stores
+# ===========================
+
+class MemoryJobStore:
+    """Jobs en un dict del proceso (se pierden al reiniciar)"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["expires_at"] <= time.time():
+                return None
+            return dict(job)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [k for k, job in self._jobs.items() if job["expires_at"] <= now]:
+                del self._jobs[job_id]
+
+    def fail_unfinished(self, reason: str) -> int:
+        return 0  # Nada sobrevive a un reinicio
+
+
+class SQLiteJobStore:
+    """Jobs en SQLite (modo WAL), compartido por los workers del host. Una conexión por hilo"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, job: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, data, expires_at) VALUES (?, ?, ?, ?)",
+            (job["job_id"], job["status"], json.dumps(job, default=str), job["expires_at"]),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT data FROM jobs WHERE job_id = ? AND expires_at > ?", (job_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge_expired(self):
+        self._conn().execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+
+    def fail_unfinished(self, reason: str) -> int:
+        """
+        Jobs que quedaron a medias porque su proceso murió (los archivos no se persisten).
+        Los de workers vivos del mismo host no se tocan
+        """
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT data FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchall()
+        failed = 0
+        for (data,) in rows:
+            job = json.loads(data)
+            if _process_alive(job.get("owner_pid")):
+                continue
+            job.update(status=FAILED, error=reason, finished_at=time.time())
+            self.put(job)
+            failed += 1
+        return failed
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _build_store(config: "JobsConfig") -> Any:
+    backend = os.environ.get("JOBS_BACKEND", config.BACKEND)
+    if backend == "sqlite":
+        path = os.environ.get("JOBS_SQLITE_PATH", config.SQLITE_PATH)
+        try:
+            return SQLiteJobStore(path)
+        except Exception as e:
+            log.warning("No se pudo abrir el store SQLite de jobs; usando memoria", extra={"path": path, "error": str(e)})
+    return MemoryJobStore()
+
+
+# ===========================
+# Manager
+# ===========================
+
+_INTERNAL_FIELDS = ("expires_at", "webhook_url", "owner_pid")
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Lo que ven el polling y el webhook (sin campos internos)"""
+    return {key: value for key, value in job.items() if key not in _INTERNAL_FIELDS}
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class JobManager:
+    """Cola acotada + WORKERS tareas que ejecutan los jobs en hilos (asyncio.to_thread)"""
+
+    def __init__(self, config: Optional["JobsConfig"] = None):
+        if config is None:
+            from orchestration.config import get_config  # orchestration importa structured_logging
+
+            config = get_config().jobs
+        self.config = config
+        self.store = _build_store(config)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self.submitted = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Crea la cola y los workers en el event loop actual (lifespan)"""
+        if self._queue is not None:
+            return
+        interrupted = await asyncio.to_thread(self.store.fail_unfinished, "interrumpido por un reinicio del servidor")
+        if interrupted:
+            log.warning("jobs interrumpidos por reinicio", extra={"count": interrupted})
+        self._queue = asyncio.Queue(maxsize=self.config.MAX_QUEUED)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.config.WORKERS)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def submit(self, func: Callable[[], Any], *, webhook_url: Optional[str] = None, **info: Any) -> Dict[str, Any]:
+        """Encola func (síncrona, corre en un hilo) y retorna el job creado"""
+        await self.start()
+        if self._queue.full():
+            self.rejected += 1
+            raise JobQueueFull(f"cola de jobs llena ({self.config.MAX_QUEUED} en espera)")
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "webhook": {"status": "pending"} if webhook_url else None,
+            "webhook_url": webhook_url,
+            "owner_pid": os.getpid(),
+            "expires_at": now + self.config.RESULT_TTL_SECONDS,
+            **info,
+        }
+        await asyncio.to_thread(self.store.put, dict(job))
+        self._queue.put_nowait((job, func))
+        self.submitted += 1
+        if self.submitted % 64 == 0:
+            await asyncio.to_thread(self.store.purge_expired)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _worker(self, index: int):
+        while True:
+            job, func = await self._queue.get()
+            try:
+                await self._run(job, func)
+            except Exception:
+                log.exception("job: error inesperado del worker", extra={"job_id": job["job_id"]})
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any], func: Callable[[], Any]):
+        job.update(status=RUNNING, started_at=time.time())
+        await asyncio.to_thread(self.store.put, dict(job))
+        try:
+            result = await asyncio.to_thread(func)
+            job.update(status=SUCCEEDED, result=result)
+        except Exception as e:
+            job.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+        job["finished_at"] = time.time()
+        job["expires_at"] = job["finished_at"] + self.config.RESULT_TTL_SECONDS
+        await asyncio.to_thread(self.store.put, dict(job))
+        log.info(
+            "job terminado",
+            extra={
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "ms": round((job["finished_at"] - job["started_at"]) * 1000, 1),
+            },
+        )
+        if job.get("webhook_url"):
+            job["webhook"] = await self._notify(job)
+            await asyncio.to_thread(self.store.put, dict(job))
+
+    async def _notify(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """POST del resultado al webhook; reintenta errores de red y respuestas 5xx"""
+        import httpx
+
+        try:
+            await check_webhook_url(job["webhook_url"], self.config)  # el DNS pudo cambiar desde el submit
+        except WebhookNotAllowed as e:
+            log.warning("webhook de job rechazado", extra={"job_id": job["job_id"], "error": str(e)})
+            return {"status": "failed", "error": str(e), "attempts": 0}
+
+        body = json.dumps(public_view(job), default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-NutriApp-Job-Id": job["job_id"]}
+        secret = os.environ.get("JOBS_WEBHOOK_SECRET")
+        if secret:
+            headers["X-NutriApp-Signature"] = sign_payload(body, secret)
+
+        error = ""
+        attempts = max(1, self.config.WEBHOOK_RETRIES)
+        # Sin redirects: un 30x podría apuntar a una dirección interna
+        async with httpx.AsyncClient(timeout=self.config.WEBHOOK_TIMEOUT_SECONDS, follow_redirects=False) as client:
+            for attempt in range(1, attempts + 1):
+                try:
+                    response = await client.post(job["webhook_url"], content=body, headers=headers)
+                    if response.status_code < 500:
+                        return {"status": "delivered", "http_status": response.status_code, "attempts": attempt}
+                    error = f"HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    error = f"{type(e).__name__}: {e}"
+                if attempt < attempts:
+                    await asyncio.sleep(2 ** (attempt - 1))
+        log.warning("webhook de job falló", extra={"job_id": job["job_id"], "error": error})
+        return {"status": "failed", "error": error, "attempts": attempts}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.config.WORKERS,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.config.MAX_QUEUED,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """Obtiene (o crea) el manager del proceso (singleton; solo desde el event loop)"""
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
+
+
+async def shutdown_jobs():
+    global _manager
+    if _manager is not None:
+        await _manager.stop()
+        _manager = None
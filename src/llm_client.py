@@ -0,0 +1,44 @@
+"""
+Modelos de chat de LangChain (Gemini) compartidos entre requests
+- Un ChatGoogleGenerativeAI por temperatura, creado una sola vez (reusa conexiones)
+- El import de langchain_google_genai ocurre en el primer uso (arranque en frío)
+"""
+import os
+import threading
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
+DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+
+_chat_models: Dict[float, "ChatGoogleGenerativeAI"] = {}
+_lock = threading.Lock()
+
+
+def get_chat_model(temperature: float) -> "ChatGoogleGenerativeAI":
+    """
+    Obtiene o crea el modelo de chat para `temperature`.
+    /analyze-meal usa 0.0 y el chatbot 0.7; la instancia es segura para compartir.
+    """
+    model = _chat_models.get(temperature)
+    if model is None:
+        with _lock:
+            model = _chat_models.get(temperature)
+            if model is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                model = ChatGoogleGenerativeAI(
+                    model=DEFAULT_MODEL,
+                    temperature=temperature,
+                    google_api_key=GOOGLE_API_KEY,
+                )
+                _chat_models[temperature] = model
+    return model
+
+
+def reset_chat_models():
+    """Descarta los modelos creados (tests/benchmarks que reemplazan la clase)"""
+    with _lock:
+        _chat_models.clear()
@@ -0,0 +1,347 @@
+"""
+Registro automático de comidas analizadas (/analyze-meal con log=true)
+- Los macros se acumulan en memoria por (user_id, fecha): varias comidas del mismo
+  día se fusionan en un solo incremento
+- Un flush cada FLUSH_INTERVAL_SECONDS (o antes, al llegar a MAX_PENDING_KEYS días
+  pendientes) manda un increment_daily_nutrition por día, FLUSH_CONCURRENCY a la vez
+- Cada incremento lleva un token propio (p_token): la función SQL ignora un token ya
+  aplicado. Un incremento que falla se reenvía tal cual, con el mismo token, con backoff
+  exponencial por token (RETRY_BACKOFF_SECONDS); si en realidad había llegado (timeout
+  después del commit) no suma dos veces
+- Un rechazo de la base que reintentar no arregla (FK, datos inválidos, 4xx) pasa, tras
+  MAX_PERMANENT_FAILURES intentos, a la tabla meal_log_dead_letter del spool (con el error)
+  en vez de reintentarse para siempre
+- pending_totals() expone lo que todavía no llegó a Supabase (pendiente + en vuelo +
+  por reintentar): las lecturas del día lo suman para que la comida se vea al instante.
+  Es por proceso: otro worker de uvicorn no ve lo pendiente de este hasta el flush
+  (como mucho FLUSH_INTERVAL_SECONDS)
+- El shutdown (lifespan) hace un último flush (sin esperar backoffs) y guarda lo que no
+  se pudo mandar en SPOOL_PATH (SQLite); el siguiente arranque lo reenvía con sus tokens
+  (los intentos vuelven a cero)
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from structured_logging import get_logger
+from supabase_client import DailyNutrition, add_to_daily_nutrition
+
+if TYPE_CHECKING:
+    from orchestration.config import MealLogConfig
+
+log = get_logger("meal_log")
+
+MACROS = ("calories", "protein", "carbs", "fat")
+
+Key = Tuple[str, str]  # (user_id, fecha YYYY-MM-DD)
+Increment = Tuple[Key, Dict[str, float]]
+
+
+def _merge(into: Dict[Key, Dict[str, float]], key: Key, delta: Dict[str, float]):
+    totals = into.setdefault(key, dict.fromkeys(MACROS, 0.0))
+    for macro in MACROS:
+        totals[macro] += delta.get(macro, 0.0)
+
+
+def is_permanent_error(error: Optional[BaseException]) -> bool:
+    """
+    Rechazos que reintentar no arregla, según el `code` del APIError de PostgREST en la
+    cadena de excepciones: SQLSTATE 22 (datos), 23 (FK, NOT NULL, CHECK), 42 (permisos,
+    función o columna inexistente), PGRST1xx-3xx y HTTP 4xx salvo 408/429. Red, timeouts,
+    5xx y PGRST0xx (base caída) son transitorios
+    """
+    while error is not None:
+        code = str(getattr(error, "code", "") or "")
+        if code.isdigit() and len(code) == 3:
+            return code.startswith("4") and code not in ("408", "429")
+        if code.startswith("PGRST"):
+            return not code.startswith("PGRST0")
+        if len(code) == 5:
+            return code[:2] in ("22", "23", "42")
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class MealLogSpool:
+    """Incrementos no enviados al apagar (SQLite; lo comparten los workers del host)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meal_log_spool ("
+                "token TEXT PRIMARY KEY, user_id TEXT NOT NULL, date TEXT NOT NULL, "
+                "calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meal_log_dead_letter ("
+                "token TEXT PRIMARY KEY, user_id TEXT NOT NULL, date TEXT NOT NULL, "
+                "calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL, "
+                "error TEXT NOT NULL, failed_at TEXT NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def save(self, increments: Dict[str, Increment]):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO meal_log_spool VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(token, key[0], key[1], *(delta[m] for m in MACROS)) for token, (key, delta) in increments.items()],
+            )
+
+    def take(self) -> Dict[str, Increment]:
+        """Retira todo lo guardado (con el mismo token: reenviarlo dos veces no suma dos veces)"""
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT * FROM meal_log_spool").fetchall()
+            conn.execute("DELETE FROM meal_log_spool")
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return {row[0]: ((row[1], row[2]), dict(zip(MACROS, row[3:]))) for row in rows}
+
+    def dead_letter(self, token: str, increment: Increment, error: str):
+        """Guarda un incremento que la base rechaza (para revisarlo a mano, no se reenvía)"""
+        (user_id, date), delta = increment
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meal_log_dead_letter VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (token, user_id, date, *(delta[m] for m in MACROS), error, datetime.utcnow().isoformat()),
+            )
+
+    def dead_letters(self) -> Dict[str, Tuple[Increment, str]]:
+        with self._conn() as conn:
+            rows = conn.execute("SELECT * FROM meal_log_dead_letter").fetchall()
+        return {row[0]: (((row[1], row[2]), dict(zip(MACROS, row[3:7]))), row[7]) for row in rows}
+
+
+class MealLogAggregator:
+    """Incrementos de daily_nutrition coalescidos por (usuario, día); solo desde el event loop"""
+
+    def __init__(self, config: Optional["MealLogConfig"] = None):
+        if config is None:
+            from orchestration.config import get_config
+
+            config = get_config().meal_log
+        self.config = config
+        self._pending: Dict[Key, Dict[str, float]] = {}
+        self._inflight: Dict[str, Increment] = {}  # token → incremento
+        self._retry: Dict[str, Increment] = {}  # Fallidos: se reenvían con el mismo token
+        self._attempts: Dict[str, int] = {}  # token → intentos fallidos
+        self._retry_at: Dict[str, float] = {}  # token → cuándo reenviarlo (time.monotonic)
+        self._spool: Optional[MealLogSpool] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self.meals = 0
+        self.flushes = 0
+        self.writes = 0
+        self.failures = 0
+        self.spooled = 0
+        self.restored = 0
+        self.dead_lettered = 0
+
+    async def start(self):
+        """Arranca el flush periódico en el event loop actual (lifespan) y recupera el spool"""
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        path = os.environ.get("MEAL_LOG_SPOOL_PATH", self.config.SPOOL_PATH)
+        if self.config.ENABLED and path:
+            try:
+                self._spool = await asyncio.to_thread(MealLogSpool, path)
+                restored = await asyncio.to_thread(self._spool.take)
+            except Exception as e:
+                log.warning("meal_log: spool no disponible", extra={"path": path, "error": str(e)})
+                restored = {}
+            if restored:
+                self._retry.update(restored)
+                self.restored += len(restored)
+                self._wake.set()
+                log.info("meal_log: incrementos recuperados del spool", extra={"count": len(restored)})
+
+    async def stop(self):
+        """Detiene el timer, manda lo pendiente y guarda en el spool lo que no salió"""
+        if self._task is not None:
+            # Sin cancel(): un flush en curso termina (sus incrementos no quedan a medias)
+            self._stopping = True
+            self._wake.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush(force=True)
+        leftover = {**self._retry, **{uuid.uuid4().hex: (key, delta) for key, delta in self._pending.items()}}
+        if not leftover:
+            return
+        try:
+            if self._spool is None:
+                raise RuntimeError("sin spool (MealLogConfig.SPOOL_PATH)")
+            await asyncio.to_thread(self._spool.save, leftover)
+            self.spooled += len(leftover)
+            self._retry, self._pending = {}, {}
+            self._attempts, self._retry_at = {}, {}
+            log.warning("meal_log: incrementos guardados en el spool", extra={"count": len(leftover)})
+        except Exception as e:
+            log.error(
+                "meal_log: incrementos perdidos al apagar",
+                extra={"error": str(e), "increments": [[*key, delta] for key, delta in leftover.values()]},
+            )
+
+    async def add(self, user_id: str, date: str, **delta: float):
+        """Suma una comida (calories/protein/carbs/fat) a lo pendiente del día"""
+        if not self.config.ENABLED:
+            await add_to_daily_nutrition(user_id, date, *(delta.get(m, 0.0) for m in MACROS))
+            self.meals += 1
+            self.writes += 1
+            return
+        await self.start()
+        _merge(self._pending, (user_id, date), delta)
+        self.meals += 1
+        if len(self._pending) >= self.config.MAX_PENDING_KEYS:
+            self._wake.set()
+
+    def pending_totals(self, user_id: str, date: str) -> Optional[Dict[str, float]]:
+        """Macros del día que aún no están en Supabase (None si no hay nada)"""
+        key = (user_id, date)
+        totals: Dict[Key, Dict[str, float]] = {}
+        if key in self._pending:
+            _merge(totals, key, self._pending[key])
+        for source in (self._inflight, self._retry):
+            for increment_key, delta in source.values():
+                if increment_key == key:
+                    _merge(totals, key, delta)
+        return totals.get(key)
+
+    def with_pending(self, user_id: str, date: str, record: Optional[DailyNutrition]) -> Optional[DailyNutrition]:
+        """El registro del día con lo pendiente sumado (lo crea si todavía no existe)"""
+        pending = self.pending_totals(user_id, date)
+        if pending is None:
+            return record
+        if record is None:
+            return DailyNutrition.model_construct(
+                id="", user_id=user_id, date=date, created_at="", updated_at="", **pending
+            )
+        return record.model_copy(update={m: getattr(record, m) + pending[m] for m in MACROS})
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.config.FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("meal_log: error inesperado en el flush")
+
+    async def flush(self, force: bool = False):
+        """
+        Manda un incremento por (usuario, día) pendiente más los fallidos cuyo backoff
+        venció (todos con force=True); los que fallan quedan para un flush siguiente
+        """
+        if not self._pending and not self._retry:
+            return
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            now = time.monotonic()
+            due = [token for token in self._retry if force or self._retry_at.get(token, 0.0) <= now]
+            batch: Dict[str, Increment] = {uuid.uuid4().hex: (key, delta) for key, delta in self._pending.items()}
+            batch.update((token, self._retry.pop(token)) for token in due)
+            self._pending = {}
+            if not batch:
+                return
+            self._inflight.update(batch)
+            limit = asyncio.Semaphore(max(1, self.config.FLUSH_CONCURRENCY))
+
+            async def write(token: str, key: Key, delta: Dict[str, float]):
+                async with limit:
+                    try:
+                        await add_to_daily_nutrition(key[0], key[1], *(delta[m] for m in MACROS), token=token)
+                        self.writes += 1
+                        self._attempts.pop(token, None)
+                        self._retry_at.pop(token, None)
+                    except Exception as e:
+                        self.failures += 1
+                        await self._failed(token, (key, delta), e)
+                    finally:
+                        self._inflight.pop(token, None)
+
+            await asyncio.gather(*(write(token, key, delta) for token, (key, delta) in batch.items()))
+            self.flushes += 1
+
+    async def _failed(self, token: str, increment: Increment, error: Exception):
+        """Reintento con backoff, o dead letter si la base lo rechaza MAX_PERMANENT_FAILURES veces"""
+        (user_id, date), _ = increment
+        attempts = self._attempts[token] = self._attempts.get(token, 0) + 1
+        if is_permanent_error(error) and attempts >= self.config.MAX_PERMANENT_FAILURES:
+            self._attempts.pop(token, None)
+            self._retry_at.pop(token, None)
+            self.dead_lettered += 1
+            try:
+                if self._spool is None:
+                    raise RuntimeError("sin spool (MealLogConfig.SPOOL_PATH)")
+                await asyncio.to_thread(self._spool.dead_letter, token, increment, str(error))
+                log.error(
+                    "meal_log: incremento rechazado por la base, pasa a meal_log_dead_letter",
+                    extra={"user_id": user_id, "date": date, "attempts": attempts, "error": str(error)},
+                )
+            except Exception as e:
+                log.error(
+                    "meal_log: incremento rechazado por la base y descartado",
+                    extra={"increment": [user_id, date, increment[1]], "error": str(error), "spool_error": str(e)},
+                )
+            return
+        backoff = self.config.RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+        self._retry[token] = increment
+        self._retry_at[token] = time.monotonic() + min(backoff, self.config.RETRY_BACKOFF_MAX_SECONDS)
+        log.warning(
+            "meal_log: incremento fallido, se reintenta con el mismo token",
+            extra={"user_id": user_id, "date": date, "attempts": attempts, "error": str(error)},
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config.ENABLED,
+            "pending_days": len(self._pending),
+            "inflight": len(self._inflight),
+            "retrying": len(self._retry),
+            "meals": self.meals,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "failures": self.failures,
+            "spooled": self.spooled,
+            "restored": self.restored,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+_aggregator: Optional[MealLogAggregator] = None
+
+
+def get_meal_log() -> MealLogAggregator:
+    """Obtiene (o crea) el agregador del proceso (singleton; solo desde el event loop)"""
+    global _aggregator
+    if _aggregator is None:
+        _aggregator = MealLogAggregator()
+    return _aggregator
+
+
+async def shutdown_meal_log():
+    global _aggregator
+    if _aggregator is not None:
+        await _aggregator.stop()
+        _aggregator = None
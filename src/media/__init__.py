@@ -0,0 +1,21 @@
+"""
+Procesamiento local de medios (fuera del event loop)
+- pool.py: pool de procesos con memoria compartida y back-pressure
+- transforms.py: transformaciones CPU (base64, detección de MIME, ...)
+- pdf.py: texto de PDFs y selección de páginas (BM25)
+- audio.py / ffmpeg.py: transcodificación de audio (ffmpeg opcional, WAV con stdlib)
+- video.py: fotogramas clave (cambios de escena) con ffmpeg
+- label.py: OCR de etiquetas nutricionales y parser de la tabla
+"""
+
+from .pool import MediaPool, MediaPoolBusy, get_media_pool, shutdown_media_pool
+from .transforms import b64encode, sniff_mime
+
+__all__ = [
+    "MediaPool",
+    "MediaPoolBusy",
+    "get_media_pool",
+    "shutdown_media_pool",
+    "b64encode",
+    "sniff_mime",
+]
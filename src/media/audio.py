@@ -0,0 +1,80 @@
+"""
+Transcodificación de audio (notas de voz) antes de enviarlo al modelo
+- transcode: ffmpeg → Opus/Ogg mono a 16 kHz, sin silencio al inicio ni al final
+- wav_downmix: alternativa sin ffmpeg, solo para WAV PCM (stdlib): mono, 16 kHz,
+  PCM 16 bits y silencio recortado. Sin filtro anti-aliasing: alcanza para voz
+"""
+
+import io
+import wave
+from array import array
+
+from . import ffmpeg
+
+# Margen que se conserva alrededor de la voz al recortar silencio
+_TRIM_PADDING_SECONDS = 0.15
+
+
+def transcode(data: memoryview, sample_rate: int, bitrate: str, silence_db: float, timeout: float) -> bytes:
+    """Opus en Ogg (audio/ogg), mono, `sample_rate` Hz, silencio de los extremos recortado"""
+    trim = f"silenceremove=start_periods=1:start_threshold={silence_db}dB:start_silence={_TRIM_PADDING_SECONDS}"
+    return ffmpeg.run(
+        data,
+        [
+            "-vn", "-ac", "1", "-ar", str(sample_rate),
+            # silenceremove solo recorta el inicio: se invierte para recortar el final
+            "-af", f"{trim},areverse,{trim},areverse",
+            "-c:a", "libopus", "-b:a", bitrate, "-application", "voip",
+            "-f", "ogg", "pipe:1",
+        ],
+        timeout,
+    )
+
+
+def _read_samples(raw: bytes, width: int) -> array:
+    """PCM little-endian → enteros con signo (8 bits en WAV es sin signo)"""
+    if width == 1:
+        return array("h", (b - 128 << 8 for b in raw))
+    if width == 2:
+        samples = array("h")
+        samples.frombytes(raw)
+        return samples
+    if width == 4:
+        samples = array("i")
+        samples.frombytes(raw)
+        return array("h", (s >> 16 for s in samples))
+    raise ValueError(f"WAV de {width * 8} bits no soportado")
+
+
+def wav_downmix(data: memoryview, sample_rate: int, silence_db: float) -> bytes:
+    """WAV PCM → WAV mono 16 bits a `sample_rate` Hz sin silencio en los extremos"""
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        channels = reader.getnchannels()
+        width = reader.getsampwidth()
+        source_rate = reader.getframerate()
+        samples = _read_samples(reader.readframes(reader.getnframes()), width)
+
+    # Remuestreo por vecino más cercano y mezcla de canales en una sola pasada
+    frames = len(samples) // channels
+    step = source_rate / sample_rate
+    out_frames = int(frames / step)
+    mono = array("h", bytes(2 * out_frames))
+    for i in range(out_frames):
+        base = int(i * step) * channels
+        mono[i] = sum(samples[base:base + channels]) // channels
+
+    # Recorte de silencio (amplitud bajo el umbral en dBFS), con un margen
+    threshold = int(32768 * 10 ** (silence_db / 20))
+    start = next((i for i, s in enumerate(mono) if abs(s) > threshold), None)
+    if start is not None:
+        end = len(mono) - next(i for i, s in enumerate(reversed(mono)) if abs(s) > threshold)
+        padding = int(_TRIM_PADDING_SECONDS * sample_rate)
+        mono = mono[max(0, start - padding):min(len(mono), end + padding)]
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(sample_rate)
+        writer.writeframes(mono.tobytes())
+    return out.getvalue()
@@ -0,0 +1,33 @@
+"""
+Envoltorio mínimo de ffmpeg (binario del sistema, opcional)
+- available(): sin ffmpeg los nodos de preprocesamiento dejan el archivo como está
+- run(): el payload va a un archivo temporal (mp4/m4a necesitan entrada con seek);
+  la salida se lee de stdout
+"""
+
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from typing import List, Sequence
+
+
+class FFmpegError(RuntimeError):
+    """ffmpeg terminó con error (formato no soportado, archivo corrupto, ...)"""
+
+
+@lru_cache(maxsize=1)
+def available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def run(data: memoryview, args: List[str], timeout: float, input_args: Sequence[str] = ()) -> bytes:
+    """ffmpeg <input_args> -i <payload> <args>; retorna stdout (usar "pipe:1" como salida)"""
+    with tempfile.NamedTemporaryFile(prefix="media-") as source:
+        source.write(data)
+        source.flush()
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", *input_args, "-i", source.name, *args]
+        proc = subprocess.run(command, capture_output=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise FFmpegError(proc.stderr.decode("utf-8", "replace").strip()[-300:] or f"exit {proc.returncode}")
+    return proc.stdout
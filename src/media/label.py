@@ -0,0 +1,263 @@
+"""
+Lectura local de etiquetas nutricionales (OCR + parser de la tabla)
+- ocr_text corre en el pool (pytesseract + Pillow y el binario tesseract, opcionales)
+- parse_label: regex por fila, tolerante a errores típicos de OCR (coma decimal,
+  "O" por "0", kJ/kcal, sal → sodio); etiquetas en español e inglés
+- Se lee la primera columna de valores; `basis` dice si es por 100 g o por porción
+- La confianza combina cuántos campos se leyeron y si cuadran entre sí (Atwater)
+- is_generic_question: preguntas que la tabla sola ya contesta ("analiza la etiqueta")
+"""
+
+import re
+import shutil
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Campos que cuentan para la confianza (mismos nombres que MealNutrients)
+CORE_FIELDS = ("calories", "fat_g", "carbs_g", "sugar_g", "protein_g", "sodium_mg")
+
+# (campo, patrón de la fila, patrón que descarta la fila). Se usa la primera fila que coincide
+_ROWS: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    ("fat_g", r"\bgrasas?\b|\bfat\b|\blipidos\b", r"saturad|trans\b|insatur|monoinsat|poliinsat|calori"),
+    ("carbs_g", r"hidratos de carbono|carbohidratos?|carbohydrates?|\bcarbs?\b", None),
+    ("sugar_g", r"azucares|azucar|\bsugars?\b", r"added|anadid|alcohol"),
+    ("fiber_g", r"\bfibra\b|\bfib(?:er|re)\b", None),
+    ("protein_g", r"proteinas?|\bprotein\b", None),
+    ("sodium_mg", r"\bsodio\b|\bsodium\b", None),
+    ("salt_g", r"\bsal\b|\bsalt\b", None),
+)
+_ENERGY_ROW = re.compile(r"energ|calori|\bkcal\b|\bkj\b")
+_NUMBER = re.compile(r"(\d+(?:[.,]\d+)?)\s*(kcal|kj|mg|g)?\b")
+# Números con O/l/i leídos en lugar de 0/1 ("1OO", "O,5", "lO g"): no pegados a una
+# palabra; con algún dígito o seguidos de una unidad (así "lo" o "o" sueltos no cambian)
+_OCR_NUMBER = re.compile(r"(?<![a-z])([\doli]+(?:[.,][\doli]+)?)(?=(\s*(?:kcal|kj|mg|g)\b)|\b)")
+_OCR_DIGIT_FIXES = str.maketrans({"o": "0", "l": "1", "i": "1"})
+# Separador de miles en la energía ("1.046 kJ", "2,000 kcal")
+_THOUSANDS = re.compile(r"\d{1,3}[.,]\d{3}")
+# Base de la primera columna: la fila del encabezado dice por 100 g o por porción
+_BASIS_100G = re.compile(r"100\s*(?:g|ml)\b")
+_BASIS_SERVING = re.compile(r"(?:por|per)\s+(?:porcion|racion|serving)")
+
+# Sal (g) → sodio (mg): la sal es ~40% sodio
+_SALT_TO_SODIUM_MG = 400.0
+_KJ_PER_KCAL = 4.184
+
+# Semáforo por 100 g (FSA, Reino Unido): (campo, bajo <=, alto >)
+_TRAFFIC_LIGHTS = (("fat_g", 3.0, 17.5), ("sugar_g", 5.0, 22.5), ("sodium_mg", 120.0, 600.0))
+
+_LABELS = {
+    "es": {
+        "title": "Información nutricional leída de la etiqueta",
+        "per_100g": "por 100 g", "per_serving": "por porción",
+        "nutrient": "Nutriente", "value": "Valor", "level": "Nivel",
+        "levels": ("bajo", "medio", "alto"),
+        "calories": "Energía", "fat_g": "Grasas", "carbs_g": "Hidratos de carbono",
+        "sugar_g": "Azúcares", "fiber_g": "Fibra", "protein_g": "Proteínas", "sodium_mg": "Sodio",
+        "note": "Valores leídos localmente (OCR); revisa la etiqueta si algo no coincide.",
+    },
+    "en": {
+        "title": "Nutrition facts read from the label",
+        "per_100g": "per 100 g", "per_serving": "per serving",
+        "nutrient": "Nutrient", "value": "Value", "level": "Level",
+        "levels": ("low", "medium", "high"),
+        "calories": "Energy", "fat_g": "Fat", "carbs_g": "Carbohydrates",
+        "sugar_g": "Sugars", "fiber_g": "Fiber", "protein_g": "Protein", "sodium_mg": "Sodium",
+        "note": "Values read locally (OCR); check the label if something looks off.",
+    },
+}
+
+# Palabras de una pregunta que solo pide leer la etiqueta (ya normalizadas: sin acentos)
+_GENERIC_QUESTION_WORDS = frozenset(
+    "que cual cuales es son esto esta este la el los las de del un una me mi por favor dime dice "
+    "muestra muestrame lee leer analiza analizar analisis resume resumen revisa describe etiqueta "
+    "tabla producto informacion info nutricional nutricionales valor valores datos aporta tiene contiene "
+    "what is are this the a an of me my please tell show read analyze analyse summarize summary "
+    "check describe label table product information info nutrition nutritional facts value values data "
+    "does it have contain".split()
+)
+
+
+@lru_cache(maxsize=1)
+def available() -> bool:
+    """pytesseract/Pillow instalados y el binario tesseract en el PATH"""
+    try:
+        import pytesseract  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which("tesseract") is not None
+
+
+def ocr_text(data: memoryview, lang: str, timeout: float) -> str:
+    """Texto de la imagen (escala de grises, ampliada: tesseract rinde mejor a ~300 dpi)"""
+    import io
+
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("L")
+    if image.width < 1200:
+        scale = 1200 / image.width
+        image = image.resize((1200, int(image.height * scale)), Image.LANCZOS)
+    # --psm 6: un bloque de texto uniforme (filas de la tabla)
+    return pytesseract.image_to_string(image, lang=lang, config="--psm 6", timeout=timeout)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _fix_ocr_digits(text: str) -> str:
+    """Corrige O/l/i leídos en lugar de 0/1 dentro de los números (texto ya normalizado)"""
+    return _OCR_NUMBER.sub(
+        lambda m: m.group(1).translate(_OCR_DIGIT_FIXES) if m.group(2) or re.search(r"\d", m.group(1)) else m.group(1),
+        text,
+    )
+
+
+def _numbers(tail: str) -> List[Tuple[float, Optional[str]]]:
+    """Números con su unidad en el resto de la fila"""
+    numbers = []
+    for value, unit in _NUMBER.findall(_fix_ocr_digits(tail)):
+        if unit in ("kcal", "kj") and _THOUSANDS.fullmatch(value):
+            value = re.sub(r"[.,]", "", value)
+        numbers.append((float(value.replace(",", ".")), unit or None))
+    return numbers
+
+
+def _energy(line: str) -> Tuple[Optional[float], bool]:
+    """(kcal, si salió de kJ); la unidad puede ir junto al número o en la fila (Energía (kJ) 1046)"""
+    values = _numbers(line)
+    kcal = [v for v, unit in values if unit == "kcal"]
+    if kcal:
+        return kcal[0], False
+    kj = [v for v, unit in values if unit == "kj"]
+    plain = [v for v, unit in values if unit is None]
+    if not kj and plain and re.search(r"\bkj\b", line):
+        kj = plain
+    if kj:
+        return round(kj[0] / _KJ_PER_KCAL, 1), True
+    return (plain[0], False) if plain and re.search(r"calori|\bkcal\b", line) else (None, False)
+
+
+def _grams_or_mg(field: str, values: List[Tuple[float, Optional[str]]]) -> Optional[float]:
+    if not values:
+        return None
+    value, unit = values[0]
+    if field == "sodium_mg":
+        return value * 1000 if unit == "g" else value
+    return value / 1000 if unit == "mg" else value
+
+
+def parse_label(text: str) -> Dict[str, Any]:
+    """
+    Valores de la tabla nutricional. Retorna nutrients (solo los leídos), basis
+    ("100g", "serving" o None), fields_found y confidence (0-1)
+    """
+    lines = [_normalize(line) for line in text.splitlines() if line.strip()]
+    nutrients: Dict[str, float] = {}
+    energy_from_kj = False  # Una fila en kcal posterior la reemplaza (más exacta)
+
+    for line in lines:
+        if ("calories" not in nutrients or energy_from_kj) and _ENERGY_ROW.search(line):
+            energy, from_kj = _energy(line)
+            if energy is not None:
+                if "calories" not in nutrients or not from_kj:
+                    nutrients["calories"], energy_from_kj = energy, from_kj
+                continue
+        for field, pattern, exclude in _ROWS:
+            if field in nutrients:
+                continue
+            match = re.search(pattern, line)
+            if not match or (exclude and re.search(exclude, line)):
+                continue
+            value = _grams_or_mg(field, _numbers(line[match.end():]))
+            if value is not None:
+                nutrients[field] = value
+            break
+
+    salt = nutrients.pop("salt_g", None)
+    if "sodium_mg" not in nutrients and salt is not None:
+        nutrients["sodium_mg"] = round(salt * _SALT_TO_SODIUM_MG, 1)
+
+    basis = _basis(lines[:6])
+
+    found = sum(1 for field in CORE_FIELDS if field in nutrients)
+    return {
+        "nutrients": nutrients,
+        "basis": basis,
+        "fields_found": found,
+        "confidence": _confidence(nutrients, found),
+    }
+
+
+def _basis(header: List[str]) -> Optional[str]:
+    """Base de la primera columna: la que aparece antes en la fila del encabezado"""
+    for line in map(_fix_ocr_digits, header):
+        found = [(m.start(), name) for name, m in (("100g", _BASIS_100G.search(line)), ("serving", _BASIS_SERVING.search(line))) if m]
+        if found:
+            return min(found)[1]
+    if any(re.search(r"porcion|racion|serving", line) for line in header):
+        return "serving"
+    return None
+
+
+def _confidence(nutrients: Dict[str, float], found: int) -> float:
+    """Fracción de campos leídos, penalizada si los valores no son coherentes entre sí"""
+    confidence = found / len(CORE_FIELDS)
+    macros = ("calories", "fat_g", "carbs_g", "protein_g")
+    if all(field in nutrients for field in macros) and nutrients["calories"] > 0:
+        estimate = 9 * nutrients["fat_g"] + 4 * (nutrients["carbs_g"] + nutrients["protein_g"])
+        if abs(estimate - nutrients["calories"]) / nutrients["calories"] > 0.2:
+            confidence *= 0.5  # Algún número mal leído
+    else:
+        confidence = min(confidence, 0.75)  # Sin verificación cruzada
+    if nutrients.get("sugar_g", 0) > nutrients.get("carbs_g", float("inf")):
+        confidence *= 0.5
+    return round(confidence, 2)
+
+
+def _format_value(field: str, value: float) -> str:
+    unit = "kcal" if field == "calories" else ("mg" if field == "sodium_mg" else "g")
+    return f"{value:g} {unit}"
+
+
+def summary_text(parsed: Dict[str, Any]) -> str:
+    """Valores leídos en una línea (para enviar al modelo en vez de la imagen)"""
+    basis = {"100g": " (por 100 g)", "serving": " (por porción)"}.get(parsed["basis"], "")
+    values = ", ".join(f"{field}={_format_value(field, value)}" for field, value in parsed["nutrients"].items())
+    return f"Tabla nutricional leída por OCR{basis}: {values}"
+
+
+def is_generic_question(question: str) -> bool:
+    """Vacía o solo pide leer/analizar la etiqueta: la tabla la contesta sin el modelo"""
+    words = re.findall(r"[a-z]+", _normalize(question or ""))
+    return all(word in _GENERIC_QUESTION_WORDS for word in words)
+
+
+def render_markdown(parsed: Dict[str, Any], language: str = "es") -> str:
+    """Respuesta determinística: tabla de valores y semáforo FSA si la base es 100 g"""
+    labels = _LABELS.get(language, _LABELS["es"])
+    nutrients = parsed["nutrients"]
+    basis = {"100g": labels["per_100g"], "serving": labels["per_serving"]}.get(parsed["basis"])
+    title = f"**{labels['title']}**" + (f" ({basis})" if basis else "")
+
+    thresholds = {field: (low, high) for field, low, high in _TRAFFIC_LIGHTS} if parsed["basis"] == "100g" else {}
+    header = f"| {labels['nutrient']} | {labels['value']} |" + (f" {labels['level']} |" if thresholds else "")
+    divider = "|---|---|" + ("---|" if thresholds else "")
+    rows = []
+    for field in ("calories", "fat_g", "carbs_g", "sugar_g", "fiber_g", "protein_g", "sodium_mg"):
+        if field not in nutrients:
+            continue
+        row = f"| {labels[field]} | {_format_value(field, nutrients[field])} |"
+        if thresholds:
+            level = ""
+            if field in thresholds:
+                low, high = thresholds[field]
+                value = nutrients[field]
+                level = labels["levels"][0 if value <= low else 2 if value > high else 1]
+            row += f" {level} |"
+        rows.append(row)
+    return "\n".join([title, "", header, divider, *rows, "", f"_{labels['note']}_"])
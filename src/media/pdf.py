@@ -0,0 +1,118 @@
+"""
+Extracción local de texto de PDFs y selección de páginas relevantes (BM25)
+- extract_pages corre en el pool de procesos (pypdf, dependencia opcional)
+- Solo PDFs con capa de texto: los escaneados se siguen enviando como PDF
+- rank_pages/select_pages: BM25 en Python puro sobre las páginas (sin dependencias)
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+# Palabras vacías (ES/EN) que no aportan a la búsqueda
+_STOPWORDS = frozenset(
+    "a al algo como con de del el ella en es esta este esto la las lo los me mi mis no o "
+    "para pero por que se si sin su sus te tu un una uno unos y ya cual cuales cuanto cuanta "
+    "cuantos cuantas hay tiene tienen puedo puede the and or of to in is are for with on at "
+    "this that it my me i you what which how much many does do can".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def extract_pages(data: memoryview) -> List[str]:
+    """Texto de cada página del PDF ("" en páginas sin capa de texto)"""
+    import io
+
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception:
+            pages.append("")
+    return pages
+
+
+def has_text_layer(pages: Sequence[str], min_chars_per_page: int) -> bool:
+    """Un PDF escaneado (imágenes) casi no tiene texto extraíble"""
+    if not pages:
+        return False
+    with_text = sum(1 for p in pages if len(p.strip()) >= min_chars_per_page)
+    return with_text / len(pages) >= 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin acentos ni palabras vacías; plural simple → singular"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if len(token) < 2 or token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("es"):
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def rank_pages(question: str, pages: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Puntaje BM25 de cada página para la pregunta"""
+    docs = [Counter(tokenize(p)) for p in pages]
+    lengths = [sum(d.values()) for d in docs]
+    avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+    n = len(docs)
+    document_frequency: Dict[str, int] = Counter()
+    for doc in docs:
+        document_frequency.update(doc.keys())
+
+    query = set(tokenize(question))
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term in query:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = k1 * (1 - b + b * (length / avg_length if avg_length else 0))
+            score += idf * tf * (k1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def select_pages(
+    question: str,
+    pages: Sequence[str],
+    top_k: int,
+    max_chars: int,
+) -> Optional[Dict[str, object]]:
+    """
+    Elige las páginas más relevantes (en su orden original) hasta `top_k` y `max_chars`.
+    PDFs de hasta `top_k` páginas se envían completos. Retorna None si ninguna página
+    coincide con la pregunta (mejor mandar el PDF entero que adivinar).
+    """
+    if len(pages) <= top_k:
+        chosen = list(range(len(pages)))
+    else:
+        scores = rank_pages(question, pages)
+        ranked = sorted(range(len(pages)), key=lambda i: scores[i], reverse=True)
+        chosen = [i for i in ranked[:top_k] if scores[i] > 0]
+        if not chosen:
+            return None
+
+    parts, sent, total = [], [], 0
+    for i in sorted(chosen):
+        text = pages[i].strip()
+        remaining = max_chars - total
+        if remaining <= 0:
+            break
+        parts.append(f"--- Página {i + 1} ---\n{text[:remaining]}")
+        sent.append(i + 1)
+        total += min(len(text), remaining)
+    return {"text": "\n\n".join(parts), "pages": sent, "chars": total}
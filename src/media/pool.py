@@ -0,0 +1,238 @@
+"""
+Pool de procesos para transformaciones de medios (CPU) fuera del event loop
+- Tamaño configurable (MediaPoolConfig.WORKERS / MEDIA_POOL_WORKERS); por defecto
+  los núcleos disponibles para el proceso (cgroups/affinity, no los del host)
+- Los payloads viajan por memoria compartida (multiprocessing.shared_memory): el
+  worker recibe un memoryview, sin picklear los bytes por el pipe del executor
+- Back-pressure: como máximo MAX_PENDING trabajos en vuelo; si el pool está
+  saturado se espera hasta QUEUE_TIMEOUT_SECONDS y luego se lanza MediaPoolBusy
+- run (async) espera el lugar y el resultado en el event loop, sin ocupar hilos del
+  executor por defecto (ahí corren las queries a Supabase y el grafo de /qa)
+- Payloads chicos (< INLINE_THRESHOLD_BYTES) se procesan en el hilo actual
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+from orchestration.config import MediaPoolConfig, get_config
+from structured_logging import get_logger
+
+log = get_logger("media.pool")
+
+
+class MediaPoolBusy(RuntimeError):
+    """El pool está saturado (back-pressure): el cliente debería reintentar"""
+
+
+def available_cpus() -> int:
+    """Núcleos que este proceso puede usar (respeta affinity/cpuset en contenedores)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+# ===========================
+# Lado del worker
+# ===========================
+
+# Resultados más chicos vuelven por pickle (más barato que crear un bloque)
+_RESULT_SHM_MIN_BYTES = 64 * 1024
+
+
+def _publish(data: bytes) -> tuple:
+    """Copia el resultado a un bloque nuevo que el proceso padre lee y libera"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[: len(data)] = data
+    name = shm.name
+    shm.close()
+    return ("shm", name, len(data))
+
+
+def _run_in_worker(func: Callable, name: str, size: int, args: tuple) -> Any:
+    """
+    Ejecuta func(memoryview, *args) sobre el payload en memoria compartida.
+    Resultados en bytes viajan de vuelta también por memoria compartida.
+    Los workers comparten el resource_tracker del padre: quien hace unlink es el padre.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    view = shm.buf[:size]
+    try:
+        result = func(view, *args)
+    finally:
+        view.release()
+        shm.close()
+    if isinstance(result, (bytes, bytearray)) and len(result) >= _RESULT_SHM_MIN_BYTES:
+        return _publish(result)
+    return ("value", result)
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+def _collect(result: tuple) -> Any:
+    kind = result[0]
+    if kind == "value":
+        return result[1]
+    _, name, size = result
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# ===========================
+# Pool
+# ===========================
+
+class MediaPool:
+    """ProcessPoolExecutor administrado con back-pressure y payloads por memoria compartida"""
+
+    def __init__(self, config: Optional[MediaPoolConfig] = None):
+        config = config or get_config().media_pool
+        env_workers = os.environ.get("MEDIA_POOL_WORKERS")
+        self.workers = int(env_workers) if env_workers else (config.WORKERS or available_cpus())
+        self.max_pending = config.MAX_PENDING or self.workers * 2
+        self.inline_threshold = config.INLINE_THRESHOLD_BYTES
+        self.queue_timeout = config.QUEUE_TIMEOUT_SECONDS
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.inline = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # forkserver: workers limpios (sin hilos ni sockets heredados del servidor)
+                    methods = multiprocessing.get_all_start_methods()
+                    method = "forkserver" if "forkserver" in methods else "spawn"
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(method),
+                    )
+        return self._executor
+
+    def start(self):
+        """Crea los workers por adelantado (lifespan) para no pagar el arranque en un request"""
+        executor = self._get_executor()
+        for future in [executor.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+        log.info("media pool iniciado", extra={"workers": self.workers, "max_pending": self.max_pending})
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run_sync(self, func: Callable, data: bytes, *args: Any) -> Any:
+        """
+        Ejecuta func(data, *args) en el pool y espera el resultado (para código en hilos,
+        p. ej. nodos del grafo). `func` debe ser una función de módulo (picklable).
+        """
+        if len(data) < self.inline_threshold:
+            self.inline += 1
+            return func(memoryview(data), *args)
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise MediaPoolBusy(f"media pool saturado ({self.max_pending} trabajos en vuelo)")
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            shm.buf[: len(data)] = data
+            self.submitted += 1
+            future = self._get_executor().submit(_run_in_worker, func, shm.name, len(data), args)
+            return _collect(future.result())
+        finally:
+            shm.close()
+            shm.unlink()
+            self._slots.release()
+
+    async def _acquire_slot(self):
+        """Lugar en el pool sin bloquear un hilo: reintenta con sleeps cortos hasta QUEUE_TIMEOUT"""
+        deadline = time.monotonic() + self.queue_timeout
+        delay = 0.005
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self.rejected += 1
+                raise MediaPoolBusy(f"media pool saturado ({self.max_pending} trabajos en vuelo)")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    async def run(self, func: Callable, data: bytes, *args: Any) -> Any:
+        """Versión async de run_sync: el event loop nunca espera al pool ni ocupa hilos"""
+        if len(data) < self.inline_threshold:
+            self.inline += 1
+            return func(memoryview(data), *args)
+
+        await self._acquire_slot()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+
+        def release(future=None):
+            shm.close()
+            shm.unlink()
+            self._slots.release()
+            # Cancelado antes de leerlo: el resultado en memoria compartida se libera igual
+            if future is not None and not future.cancelled() and future.exception() is None:
+                _collect(future.result())
+
+        try:
+            shm.buf[: len(data)] = data
+            future = self._get_executor().submit(_run_in_worker, func, shm.name, len(data), args)
+        except BaseException:
+            release()
+            raise
+        self.submitted += 1
+        try:
+            result = await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # El worker sigue leyendo el bloque: se libera cuando termine
+            future.add_done_callback(release)
+            raise
+        except BaseException:
+            release()
+            raise
+        release()
+        return _collect(result)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "inline": self.inline,
+            "rejected": self.rejected,
+        }
+
+
+_pool: Optional[MediaPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_media_pool() -> MediaPool:
+    """Obtiene (o crea) el pool del proceso (singleton)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MediaPool()
+    return _pool
+
+
+def shutdown_media_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,52 @@
+"""
+Transformaciones de medios que corren en el pool de procesos (o inline si son chicas)
+- Reciben el payload como memoryview (memoria compartida) y retornan bytes/valores
+- Deben ser funciones de módulo sin estado global (se ejecutan en otros procesos)
+"""
+
+import base64
+from typing import Optional
+
+# Firmas de archivo (magic bytes) → MIME. El orden importa: las más específicas primero
+_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+)
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """
+    Detecta el MIME por los primeros bytes (basta con ~32). Retorna None si no
+    reconoce el formato; es barato y no necesita el pool.
+    """
+    head = bytes(head[:32])
+    for offset, signature, mime in _SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime
+    if head[:4] == b"RIFF":
+        if head[8:12] == b"WEBP":
+            return "image/webp"
+        if head[8:12] == b"WAVE":
+            return "audio/wav"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "image/heic"
+        if brand in (b"M4A ", b"M4B "):
+            return "audio/mp4"
+        return "video/mp4"
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0:
+        return "audio/mpeg"  # frame MPEG sin tag ID3
+    return None
+
+
+def b64encode(data: memoryview) -> bytes:
+    """Base64 estándar (para data URLs de imágenes)"""
+    return base64.b64encode(data)
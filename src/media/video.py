@@ -0,0 +1,44 @@
+"""
+Fotogramas clave de videos (cambios de escena) para enviarlos como imágenes
+- Solo se decodifican los keyframes del códec (-skip_frame nokey): minutos de video
+  se procesan en segundos
+- El primer fotograma siempre se incluye; luego los cambios de escena hasta max_frames
+- La pista de audio (opcional) se extrae con audio.transcode
+"""
+
+from typing import List
+
+from . import ffmpeg
+
+_JPEG_SOI = b"\xff\xd8\xff"
+
+
+def keyframes(data: memoryview, max_frames: int, scene_threshold: float, width: int, timeout: float) -> List[bytes]:
+    """JPEGs de los cambios de escena (en orden), a lo sumo `width` px de ancho"""
+    stream = ffmpeg.run(
+        data,
+        [
+            "-an",
+            "-vf", f"select='eq(n,0)+gt(scene,{scene_threshold})',scale='min({width},iw)':-2",
+            "-fps_mode", "vfr",
+            "-frames:v", str(max_frames),
+            "-c:v", "mjpeg", "-q:v", "4",
+            "-f", "image2pipe", "pipe:1",
+        ],
+        timeout,
+        input_args=["-skip_frame", "nokey"],
+    )
+    return split_jpegs(stream)
+
+
+def split_jpegs(stream: bytes) -> List[bytes]:
+    """
+    Separa JPEGs concatenados (image2pipe). En los datos comprimidos todo 0xFF va
+    seguido de 0x00, así que el marcador de inicio solo aparece al comienzo de cada imagen
+    """
+    starts = []
+    index = stream.find(_JPEG_SOI)
+    while index != -1:
+        starts.append(index)
+        index = stream.find(_JPEG_SOI, index + 1)
+    return [stream[start:end] for start, end in zip(starts, starts[1:] + [len(stream)])]
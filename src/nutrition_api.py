@@ -7,9 +7,11 @@ API QA Multimodal (Gemini) con FastAPI + LangGraph
 """
 
 from __future__ import annotations
-import os, io, time, mimetypes, re
+import os, io, time, mimetypes, re, asyncio
 from typing import List, Optional, Any
 from pathlib import Path
+from contextlib import asynccontextmanager
+from datetime import date as date_type, datetime
 
 # === .env ===
 try:
@@ -27,14 +29,17 @@ from fastapi import (
     UploadFile,
     File,
     Form,
+    Header,
     HTTPException,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Dict
 
 # ==== LangGraph Orchestration ====
-from orchestration.graph import invoke_orchestration
+from orchestration import graph as qa_graph  # Cliente google-genai compartido con /qa
+from orchestration.graph import invoke_orchestration, run_orchestration
 from orchestration.state import MediaFile, MediaType
 
 # ==== Supabase ====
@@ -42,8 +47,11 @@ from supabase_client import (
     get_user_profile,
     get_user_metrics,
     get_daily_nutrition,
+    get_daily_nutrition_page,
     get_today_nutrition,
-    get_conversation_history,
+    get_conversation_page,
+    page_cursor,
+    parse_cursor,
     save_conversation_message,
     clear_conversation_history,
     UserMetrics,
@@ -54,35 +62,67 @@ from supabase_client import (
 # ==== Nutrition Chatbot ====
 from nutrition_chatbot import NutritionChatbot
 
-# ==== LangChain para JSON ====
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel as PydanticModel, Field
+# ==== Server-Timing ====
+from server_timing import (
+    ServerTimingMiddleware,
+    TimedRoute,
+    timing_stage,
+    STAGE_UPLOAD,
+    STAGE_PREPROCESS,
+    STAGE_MODEL,
+)
 
-# ==== Gemini SDK (nuevo con fallback al anterior) ====
-USING_NEW_SDK = False
-try:
-    from google import genai
-    from google.genai.types import Part
-    USING_NEW_SDK = True
-except Exception:
-    import google.generativeai as genai
-    from google.generativeai.types import Part
+# ==== Trazas de tráfico (opcional, TRACE_RECORD_PATH) ====
+import trace_recorder
+from trace_recorder import TraceRecorderMiddleware, annotate_request, annotate_files, annotate_user
+
+# ==== Pool de procesos para medios ====
+from media import MediaPoolBusy, get_media_pool, shutdown_media_pool, b64encode, sniff_mime
+
+# ==== Cache L1/L2 ====
+from cache import get_cache, content_key, cache_stats, register_model
+
+# ==== Respuestas JSON (orjson) ====
+from json_response import FastJSONResponse
+
+# ==== Idempotency-Key (reintentos de POST costosos) ====
+from idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, get_idempotency_store, run_idempotent
+
+# ==== Jobs asíncronos (/qa/jobs) ====
+from jobs import JobQueueFull, WebhookNotAllowed, check_webhook_url, get_job_manager, public_view, shutdown_jobs
+
+# ==== Registro automático de comidas (/analyze-meal con log=true) ====
+from meal_log import get_meal_log, shutdown_meal_log
+
+# ==== Invalidación de caches de usuario por cambios en la base ====
+from change_feed import get_change_feed, start_change_feed, shutdown_change_feed
+
+# ==== Tabla local de composición de alimentos ====
+from food_composition import get_food_table
+
+# ==== Modelos de chat compartidos + warm-up ====
+from llm_client import get_chat_model
+import warmup
+
+# ==== Logging ====
+from structured_logging import get_logger
+
+log = get_logger("api")
+
+# ==== LangChain / Gemini SDK ====
+# Se importan en el primer uso (ver analyze_meal_direct); el cliente google-genai vive
+# en orchestration.graph. Así el arranque en frío no paga el import de los SDKs.
+from pydantic import BaseModel as PydanticModel, Field
 
 # ==== Config ====
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
 DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 
-if USING_NEW_SDK:
-    if not GOOGLE_API_KEY:
-        print("[AVISO] Falta GOOGLE_API_KEY")
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-else:
-    if not GOOGLE_API_KEY:
-        print("[AVISO] Falta GOOGLE_API_KEY")
-    genai.configure(api_key=GOOGLE_API_KEY)
-    client = None
+# Tamaño máximo de página de los endpoints de historial (limit mayores se recortan)
+HISTORY_MAX_PAGE_SIZE = 100
+
+if not GOOGLE_API_KEY:
+    log.warning("Falta GOOGLE_API_KEY")
 
 # ============================
 # Sistema de Orquestación - Sistema Instrucciones movido a orchestration_graph.py
@@ -91,17 +131,23 @@ else:
 # para mejor mantenibilidad y adaptabilidad según tipo de análisis detectado.
 
 # ============================
-# Modelo para JsonOutputParser de LangChain
+# Salida estructurada de /analyze-meal (response_schema / JsonOutputParser)
 # ============================
+class MealItemModel(PydanticModel):
+    """
+    Alimento identificado en la imagen. Los nutrientes salen de la tabla local; la
+    estimación del modelo solo se usa para los alimentos que la tabla no conoce
+    """
+    food: str = Field(description="Alimento, nombre genérico (ej. 'arroz blanco cocido')")
+    grams: float = Field(description="Porción estimada en gramos")
+    calories: Optional[float] = Field(None, description="Calorías estimadas de la porción")
+    protein_g: Optional[float] = Field(None, description="Proteína estimada de la porción (g)")
+    carbs_g: Optional[float] = Field(None, description="Carbohidratos estimados de la porción (g)")
+    fat_g: Optional[float] = Field(None, description="Grasa estimada de la porción (g)")
+
 class MealAnalysisModel(PydanticModel):
-    """Modelo estructurado para análisis de comida - SOLO VALORES NUTRICIONALES"""
-    calories: float = Field(description="Calorías totales en kcal")
-    protein_g: float = Field(description="Proteína en gramos")
-    carbs_g: float = Field(description="Carbohidratos en gramos")
-    fat_g: float = Field(description="Grasas en gramos")
-    fiber_g: float = Field(default=0, description="Fibra en gramos")
-    sugar_g: float = Field(default=0, description="Azúcar en gramos")
-    sodium_mg: float = Field(default=0, description="Sodio en miligramos")
+    """Modelo estructurado para análisis de comida - SOLO ALIMENTOS Y GRAMOS"""
+    items: List[MealItemModel] = Field(description="Alimentos visibles en el plato")
 
 class MealNutrients(BaseModel):
     """Estructura simplificada de nutrientes - SOLO LOS VALORES QUE NECESITAS"""
@@ -113,6 +159,16 @@ class MealNutrients(BaseModel):
     sugar_g: float = 0
     sodium_mg: float = 0
 
+class MealEstimate(BaseModel):
+    """Resultado de analyze_meal_direct: totales de la tabla local + desglose por alimento"""
+    nutrients: MealNutrients
+    # {"food", "grams", "matched", "source"}: source "table", "model" (fuera de la tabla,
+    # estimación del modelo) o None (sin valores: no suma)
+    items: List[Dict[str, Any]] = []
+    partial: bool = False  # Algún alimento quedó sin valores: los totales se quedan cortos
+
+register_model(MealEstimate)  # Cache meal_analysis (L2 compartido)
+
 class MealAnalysisResponse(BaseModel):
     """Respuesta de análisis de comida"""
     ok: bool
@@ -120,15 +176,37 @@ class MealAnalysisResponse(BaseModel):
     metadata: Dict[str, Any] = {}
 
 # ==== FastAPI app ====
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque: warm-up (grafo, clientes de Gemini/LangChain/Supabase) antes de
+    aceptar tráfico; uvicorn no abre el puerto hasta que termina.
+    """
+    await warmup.warm_up()
+    await get_job_manager().start()
+    await get_meal_log().start()
+    await start_change_feed()
+    yield
+    await shutdown_jobs()
+    await shutdown_meal_log()
+    await shutdown_change_feed()
+    shutdown_media_pool()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="QA Multimodal API (FastAPI + Gemini + LangGraph)",
     description="Sube archivos (imagen/PDF/audio, etc.) y haz preguntas sobre su contenido (NutriApp). "
                 "Orquestación con LangGraph para mejor escalabilidad.",
     version="2.0.0",
     docs_url="/docs",
     openapi_url="/openapi.json",
+    default_response_class=FastJSONResponse,
 )
 
+# Todas las rutas marcan inicio/fin del endpoint para el header Server-Timing
+app.router.route_class = TimedRoute
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -136,8 +214,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", REPLAYED_HEADER],
 )
 
+# Server-Timing (upload, preprocess, supabase, model, serialize, total)
+app.add_middleware(ServerTimingMiddleware)
+
+# Grabación de trazas anonimizadas para replay (solo si TRACE_RECORD_PATH está definido)
+if trace_recorder.is_enabled():
+    app.add_middleware(TraceRecorderMiddleware)
+
 # -------------------------------
 # Helpers: Conversión de archivos
 # -------------------------------
@@ -152,15 +238,15 @@ async def uploadfile_to_media_file(up: UploadFile) -> MediaFile:
     """
     Convierte un UploadFile de FastAPI a MediaFile para el orquestador
     """
-    mt = getattr(up, "content_type", None) or guess_mime(
-        getattr(up, "filename", "upload.bin")
-    )
-    
-    if hasattr(up, "file"):
-        data = up.file.read()
-    else:
+    with timing_stage(STAGE_UPLOAD):
+        # UploadFile.read() lee en un hilo si el archivo ya pasó a disco
         data = await up.read()
     
+    # Los clientes móviles suelen mandar application/octet-stream: se miran los magic bytes
+    mt = getattr(up, "content_type", None)
+    if not mt or mt == "application/octet-stream":
+        mt = sniff_mime(data[:32]) or guess_mime(getattr(up, "filename", "upload.bin"))
+    
     return MediaFile(
         filename=getattr(up, "filename", "upload.bin"),
         mime_type=mt,
@@ -169,77 +255,162 @@ async def uploadfile_to_media_file(up: UploadFile) -> MediaFile:
     )
 
 # ===========================
-# Análisis directo con LangChain + JsonOutputParser
+# Análisis directo: google-genai con salida estructurada (LangChain con el SDK viejo)
 # ===========================
 
-async def analyze_meal_direct(media_file: MediaFile) -> MealNutrients:
+MEAL_PROMPT = (
+    "Identifica cada alimento de esta imagen de comida y estima su porción en gramos.\n"
+    "Lista cada alimento por separado (no platos completos si se distinguen sus partes), "
+    "con nombres genéricos. Estima también calorías, proteína, carbohidratos y grasa de cada porción."
+)
+
+# Versión del prompt/esquema en la clave del cache meal_analysis
+_MEAL_ANALYSIS_VERSION = "items-v2"
+
+# Campos del ítem del modelo → columnas de MealNutrients (respaldo fuera de la tabla)
+_MODEL_ITEM_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+async def analyze_meal_direct(media_file: MediaFile) -> MealEstimate:
     """
-    Analiza comida usando LangChain con JsonOutputParser.
-    Retorna SOLO los valores nutricionales - sin texto.
+    Identifica alimentos y gramos con Gemini; los nutrientes se calculan con la
+    tabla local de composición (reproducibles, sin texto).
+    """
+    if qa_graph.USING_NEW_SDK:
+        return await _analyze_meal_structured(media_file)
+    return await _analyze_meal_langchain(media_file)
+
+
+async def _analyze_meal_structured(media_file: MediaFile) -> MealEstimate:
+    """
+    google-genai con response_schema derivado de MealAnalysisModel: el modelo responde
+    JSON válido (sin instrucciones de formato en el prompt ni JsonOutputParser) y la
+    imagen va como bytes (sin data URL en base64 ni conversión de mensajes de LangChain)
     """
     try:
-        # Usar LangChain con ChatGoogleGenerativeAI
-        llm = ChatGoogleGenerativeAI(
-            model=DEFAULT_MODEL,
-            temperature=0.0,
-            google_api_key=GOOGLE_API_KEY,
-        )
+        with timing_stage(STAGE_PREPROCESS):
+            client = qa_graph._get_gemini_client()
+            contents = [
+                qa_graph._part_type().from_bytes(data=media_file.data, mime_type=media_file.mime_type),
+                MEAL_PROMPT,
+            ]
         
-        # Parser JSON
-        parser = JsonOutputParser(pydantic_object=MealAnalysisModel)
-        
-        # Instrucciones de formato
-        format_instructions = parser.get_format_instructions()
-        
-        # Crear mensaje con imagen
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": (
-                        "Analiza esta imagen de comida y extrae SOLO estos valores nutricionales.\n"
-                        "Sé preciso con los números estimados basándote en el tamaño de las porciones.\n\n"
-                        f"{format_instructions}"
-                    ),
+        with timing_stage(STAGE_MODEL):
+            response = await asyncio.to_thread(
+                client.models.generate_content,
+                model=DEFAULT_MODEL,
+                contents=contents,
+                config={
+                    "temperature": 0.0,
+                    "response_mime_type": "application/json",
+                    "response_schema": MealAnalysisModel,
                 },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{media_file.mime_type};base64,{__import__('base64').b64encode(media_file.data).decode('utf-8')}"
+            )
+        
+        # Validador de pydantic compilado con el modelo (sin parseo de texto libre)
+        analysis = MealAnalysisModel.model_validate_json(response.text or "{}")
+        return estimate_from_items([item.model_dump() for item in analysis.items])
+    
+    except Exception as e:
+        log.exception("analyze_meal_direct falló")
+        raise Exception(f"Error: {str(e)}")
+
+
+async def _analyze_meal_langchain(media_file: MediaFile) -> MealEstimate:
+    """SDK viejo (google-generativeai): LangChain + JsonOutputParser"""
+    from langchain_core.messages import HumanMessage
+    from langchain_core.output_parsers import JsonOutputParser
+
+    try:
+        with timing_stage(STAGE_PREPROCESS):
+            # ChatGoogleGenerativeAI compartido (creado en el warm-up o en el primer uso)
+            llm = get_chat_model(temperature=0.0)
+            
+            # Parser JSON
+            parser = JsonOutputParser(pydantic_object=MealAnalysisModel)
+            
+            # Instrucciones de formato
+            format_instructions = parser.get_format_instructions()
+            
+            # Base64 en el pool de procesos (imágenes grandes no bloquean el event loop)
+            image_b64 = (await get_media_pool().run(b64encode, media_file.data)).decode("ascii")
+            
+            # Crear mensaje con imagen
+            message = HumanMessage(
+                content=[
+                    {
+                        "type": "text",
+                        "text": (
+                            f"{MEAL_PROMPT}\n\n"
+                            f"{format_instructions}"
+                        ),
                     },
-                },
-            ],
-        )
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{media_file.mime_type};base64,{image_b64}"
+                        },
+                    },
+                ],
+            )
         
         # Invocar modelo
-        print("[DEBUG] Invocando LangChain ChatGoogleGenerativeAI...")
-        response = llm.invoke([message])
+        log.debug("Invocando LangChain ChatGoogleGenerativeAI", extra={"image_bytes": media_file.size_bytes})
+        with timing_stage(STAGE_MODEL):
+            response = await asyncio.to_thread(llm.invoke, [message])
         response_text = response.content
         
-        print(f"[DEBUG] Respuesta: {response_text[:300]}")
+        log.debug("Respuesta del modelo recibida", extra={"chars": len(response_text)})
         
         # Parsear JSON
         parsed_data = parser.parse(response_text)
-        print("[DEBUG] ✓ JSON parseado correctamente")
+        log.debug("JSON parseado correctamente")
         
-        # Retornar solo los valores
-        return MealNutrients(
-            calories=float(parsed_data.get("calories", 0)),
-            protein_g=float(parsed_data.get("protein_g", 0)),
-            carbs_g=float(parsed_data.get("carbs_g", 0)),
-            fat_g=float(parsed_data.get("fat_g", 0)),
-            fiber_g=float(parsed_data.get("fiber_g", 0)),
-            sugar_g=float(parsed_data.get("sugar_g", 0)),
-            sodium_mg=float(parsed_data.get("sodium_mg", 0)),
-        )
+        return estimate_from_items(parsed_data.get("items") or [])
     
+    except MediaPoolBusy:
+        raise
     except Exception as e:
-        print(f"[DEBUG] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("analyze_meal_direct falló")
         raise Exception(f"Error: {str(e)}")
 
 
+def _model_values(item: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """Estimación del modelo para el ítem (None si le falta algún macro)"""
+    values = {}
+    for field in _MODEL_ITEM_FIELDS:
+        try:
+            values[field] = max(0.0, float(item[field]))
+        except (KeyError, TypeError, ValueError):
+            return None
+    return values
+
+
+def estimate_from_items(items: List[Dict[str, Any]]) -> MealEstimate:
+    """
+    Totales de la comida a partir de [{"food", "grams", calories/protein_g/...}]: tabla local
+    para los alimentos que conoce, la estimación del modelo para el resto. Sin ninguna de
+    las dos el ítem no suma y la estimación queda marcada como parcial
+    """
+    pairs = [(str(item.get("food", "")), float(item.get("grams") or 0)) for item in items]
+    with timing_stage(STAGE_PREPROCESS):
+        nutrients, matched = get_food_table().compute(pairs)
+    breakdown, missing = [], []
+    for item, (food, grams), row in zip(items, pairs, matched):
+        source = "table" if row is not None else None
+        if row is None:
+            values = _model_values(item)
+            if values is not None:
+                source = "model"
+                for field, value in values.items():
+                    nutrients[field] = round(nutrients[field] + value, 1)
+            else:
+                missing.append(food)
+        breakdown.append({"food": food, "grams": grams, "matched": row, "source": source})
+    if missing:
+        log.info("alimentos sin valores (ni tabla ni estimación del modelo)", extra={"foods": missing})
+    return MealEstimate(nutrients=MealNutrients(**nutrients), items=breakdown, partial=bool(missing))
+
+
 # -------------------------------
 # Endpoints utilitarios
 # -------------------------------
@@ -264,6 +435,29 @@ def health():
     """
     return {"status": "ok"}
 
+@app.get("/cache/stats", tags=["health"])
+def cache_stats_endpoint():
+    """
+    Hits (L1/L2), misses, cálculos coalescidos, hits stale y hit ratio de cada cache con nombre,
+    el store de Idempotency-Key y el estado del change feed que invalida los caches de
+    usuario (null si está apagado)
+    """
+    feed = get_change_feed()
+    return {
+        **cache_stats(),
+        "idempotency": get_idempotency_store().stats(),
+        "change_feed": feed.stats() if feed is not None else None,
+    }
+
+@app.get("/ready", tags=["health"])
+def ready():
+    """
+    Readiness: 200 cuando terminó el warm-up de arranque (con el detalle por paso),
+    503 mientras tanto. Un paso fallido no bloquea: se reintenta en el primer uso.
+    """
+    report = warmup.readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 # -------------------------------
 # QA endpoint (multimodal con LangGraph)
 # -------------------------------
@@ -272,96 +466,246 @@ async def qa_multipart(
     question: str = Form(...),
     use_files_api: Optional[str] = Form("false"),
     files: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     """
     QA multimodal con archivos (imagen/audio/PDF, etc.) orquestado con LangGraph.
     - `question`: pregunta del usuario (texto).
     - `files`: uno o más archivos (UploadFile).
     - `use_files_api`: 'true' para usar Files API (útil para PDFs grandes, si usas el SDK nuevo).
+    - Header `Idempotency-Key` (opcional): los reintentos con la misma clave repiten la respuesta.
     
     Retorna:
-    - `ok`: True si fue exitoso
+    - `ok`: True si fue exitoso (False también si la estimación es parcial: metadata.partial)
     - `answer`: Respuesta en Markdown
     - `metadata`: Información sobre el procesamiento (tipos de análisis, logs, tiempo)
     """
     try:
-        q = (question or "").strip()
-        use_flag = str(use_files_api).lower() in ("1", "true", "yes", "y")
-
-        if not q:
-            raise HTTPException(status_code=400, detail="Falta 'question'")
-        if not files:
-            raise HTTPException(
-                status_code=400,
-                detail="Adjunta al menos un archivo en 'files'",
+        q, use_flag, media_files = await _read_qa_inputs(question, use_files_api, files)
+
+        async def answer():
+            # Invocar orquestación LangGraph (síncrona: en los hilos del grafo, fuera del event loop)
+            answer_md, metadata = await run_orchestration(
+                question=q,
+                media_files=media_files,
+                use_files_api=use_flag,
             )
+            return {
+                "ok": True,
+                "answer": answer_md,
+                "metadata": metadata,
+            }
 
-        # Convertir UploadFiles a MediaFile
-        media_files = [await uploadfile_to_media_file(f) for f in files]
-        
-        # Invocar orquestación LangGraph
-        answer_md, metadata = invoke_orchestration(
-            question=q,
-            media_files=media_files,
-            use_files_api=use_flag,
+        return await run_idempotent(
+            idempotency_key,
+            "/qa",
+            answer,
+            q,
+            use_flag,
+            *(part for f in media_files for part in (f.filename, f.mime_type, f.data)),
+            should_store=lambda body: not body["answer"].startswith(qa_graph.GENERATION_ERROR_PREFIX),
         )
-        
-        return {
-            "ok": True,
-            "answer": answer_md,
-            "metadata": metadata,
-        }
     
     except HTTPException:
         raise
+    except MediaPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
     except Exception as e:
         return {
             "ok": False,
             "detail": f"{type(e).__name__}: {e}",
         }
 
+async def _read_qa_inputs(question: str, use_files_api: Optional[str], files: List[UploadFile]):
+    """Valida el formulario de /qa y convierte los UploadFiles a MediaFile"""
+    q = (question or "").strip()
+    use_flag = str(use_files_api).lower() in ("1", "true", "yes", "y")
+
+    if not q:
+        raise HTTPException(status_code=400, detail="Falta 'question'")
+    if not files:
+        raise HTTPException(
+            status_code=400,
+            detail="Adjunta al menos un archivo en 'files'",
+        )
+
+    # Convertir UploadFiles a MediaFile
+    media_files = [await uploadfile_to_media_file(f) for f in files]
+    annotate_request(question_len=len(q), use_files_api=use_flag)
+    annotate_files(media_files)
+    return q, use_flag, media_files
+
+# -------------------------------
+# QA asíncrono (jobs): para PDFs/videos largos que exceden el timeout del cliente
+# -------------------------------
+@app.post("/qa/jobs", tags=["qa"], status_code=202)
+async def qa_job_create(
+    question: str = Form(...),
+    use_files_api: Optional[str] = Form("false"),
+    files: List[UploadFile] = File(...),
+    webhook_url: Optional[str] = Form(None),
+):
+    """
+    Igual que /qa pero responde al instante (202) con un `job_id`.
+    - Polling: `GET /qa/jobs/{job_id}` hasta que `status` sea `succeeded` o `failed`.
+    - `webhook_url` (opcional): se le hace POST con el mismo JSON al terminar. Solo hosts
+      de jobs.WEBHOOK_ALLOWED_HOSTS con direcciones públicas (400 si no).
+    - 503 con Retry-After si la cola de jobs está llena.
+    """
+    webhook = (webhook_url or "").strip() or None
+    if webhook:
+        try:
+            await check_webhook_url(webhook, get_job_manager().config)
+        except WebhookNotAllowed as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        q, use_flag, media_files = await _read_qa_inputs(question, use_files_api, files)
+
+        def run_qa() -> Dict[str, Any]:
+            answer_md, metadata = invoke_orchestration(
+                question=q,
+                media_files=media_files,
+                use_files_api=use_flag,
+            )
+            if answer_md.startswith(qa_graph.GENERATION_ERROR_PREFIX):
+                raise RuntimeError(answer_md)  # El job queda failed, no succeeded con el error como respuesta
+            return {"answer": answer_md, "metadata": metadata}
+
+        job = await get_job_manager().submit(
+            run_qa,
+            webhook_url=webhook,
+            question=q[:200],
+            files=[{"filename": f.filename, "mime_type": f.mime_type, "size_bytes": f.size_bytes} for f in media_files],
+        )
+    except (JobQueueFull, MediaPoolBusy) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    status_url = f"/qa/jobs/{job['job_id']}"
+    return JSONResponse(
+        {"ok": True, "job_id": job["job_id"], "status": job["status"], "status_url": status_url},
+        status_code=202,
+        headers={"Location": status_url},
+    )
+
+@app.get("/qa/jobs/{job_id}", tags=["qa"])
+async def qa_job_status(job_id: str):
+    """
+    Estado de un job de /qa/jobs: `queued`, `running`, `succeeded` (con `result`:
+    answer + metadata) o `failed` (con `error`). 404 si no existe o ya expiró.
+    """
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado o expirado")
+    body = public_view(job)
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(body, headers={"Retry-After": "2"})
+    return body
+
 # -------------------------------
 # Meal Analysis endpoint (solo imagen, JSON estructurado)
 # -------------------------------
 @app.post("/analyze-meal", tags=["meal"], response_model=MealAnalysisResponse)
-async def analyze_meal(file: UploadFile = File(...)):
+async def analyze_meal(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    log_meal: Optional[str] = Form("false", alias="log"),
+    date: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
     """
     Analiza una comida desde una imagen y retorna nutrientes en JSON estructurado.
     Usa Gemini SDK directamente (sin LangGraph) para obtener JSON puro.
     
     - `file`: una única imagen (JPG, PNG, etc.)
+    - `log=true` + `user_id` (opcional): suma la comida a daily_nutrition de `date`
+      (YYYY-MM-DD, obligatoria: la fecha local del cliente). Se agrupa con otras comidas y se escribe en
+      segundo plano; /user/{user_id}/nutrition/today la refleja al instante. Una estimación
+      parcial (algún alimento sin valores) no se registra.
+    - Header `Idempotency-Key` (opcional): los reintentos con la misma clave repiten la respuesta.
     
     Retorna estructura JSON con:
-    - `ok`: True si fue exitoso
+    - `ok`: True si fue exitoso (False también si la estimación es parcial: metadata.partial)
     - `nutrients`: Objeto con macronutrientes, calorías, etc.
     - `metadata`: Información del procesamiento
     """
     try:
         if not file:
             raise HTTPException(status_code=400, detail="Se requiere una imagen")
+        should_log = str(log_meal).lower() in ("1", "true", "yes", "y")
+        log_user = (user_id or "").strip()
+        annotate_request(log=should_log)
+        annotate_user(log_user)
+        if should_log and not log_user:
+            raise HTTPException(status_code=400, detail="'log=true' requiere 'user_id'")
+        # La fecha la pone el cliente (su día local): la del servidor (UTC) cambia a
+        # otra hora y la comida caería en el día equivocado
+        log_date = (date or "").strip()
+        if should_log:
+            if not log_date:
+                raise HTTPException(status_code=400, detail="'log=true' requiere 'date' (YYYY-MM-DD, fecha local del cliente)")
+            try:
+                date_type.fromisoformat(log_date)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="'date' debe tener formato YYYY-MM-DD")
         
         # Convertir UploadFile a MediaFile
         media_file = await uploadfile_to_media_file(file)
+        annotate_files([media_file])
         
-        # Analizar directamente con Gemini SDK (sin LangGraph)
-        start_time = time.time()
-        nutrients = await analyze_meal_direct(media_file)
-        processing_time = (time.time() - start_time) * 1000
-        
-        metadata = {
-            "method": "direct_gemini_sdk",
-            "model": DEFAULT_MODEL,
-            "processing_time_ms": processing_time,
-        }
-        
-        return MealAnalysisResponse(
-            ok=True,
-            nutrients=nutrients,
-            metadata=metadata,
+        async def analyze():
+            # Analizar directamente con Gemini SDK (sin LangGraph); la misma imagen
+            # se resuelve desde el cache (compartido entre workers si hay L2)
+            start_time = time.time()
+            estimate = await get_cache("meal_analysis").get_or_compute(
+                content_key(_MEAL_ANALYSIS_VERSION, DEFAULT_MODEL, media_file.mime_type, media_file.data),
+                lambda: analyze_meal_direct(media_file),
+            )
+            processing_time = (time.time() - start_time) * 1000
+
+            metadata = {
+                "method": "direct_gemini_sdk",
+                "model": DEFAULT_MODEL,
+                "processing_time_ms": processing_time,
+                "nutrients_source": "local_food_table",
+                "items": estimate.items,
+                "partial": estimate.partial,
+            }
+            if should_log and estimate.partial:
+                # Los totales se quedan cortos: no se suman al día (el cliente puede corregir y registrar)
+                metadata["logged"] = None
+                metadata["log_skipped"] = "estimación parcial: hay alimentos sin valores nutricionales"
+            elif should_log:
+                # Dentro del handler idempotente: un reintento repite la respuesta sin volver a sumar
+                nutrients = estimate.nutrients
+                await get_meal_log().add(
+                    log_user,
+                    log_date,
+                    calories=nutrients.calories,
+                    protein=nutrients.protein_g,
+                    carbs=nutrients.carbs_g,
+                    fat=nutrients.fat_g,
+                )
+                metadata["logged"] = {"user_id": log_user, "date": log_date}
+
+            return MealAnalysisResponse(
+                ok=not estimate.partial,
+                nutrients=estimate.nutrients,
+                metadata=metadata,
+            )
+
+        return await run_idempotent(
+            idempotency_key,
+            "/analyze-meal",
+            analyze,
+            media_file.mime_type,
+            media_file.data,
+            *((f"log:{log_user}:{log_date}",) if should_log else ()),
         )
     
     except HTTPException:
         raise
+    except MediaPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
     except Exception as e:
         return MealAnalysisResponse(
             ok=False,
@@ -406,14 +750,14 @@ async def get_user_profile_endpoint(user_id: str):
     """
     try:
         profile = await get_user_profile(user_id)
-        return {
+        return FastJSONResponse({
             "ok": True,
             "profile": profile,
             "metadata": {
                 "timestamp": time.time(),
                 "user_id": user_id,
             }
-        }
+        })
     except Exception as e:
         return {
             "ok": False,
@@ -447,14 +791,14 @@ async def get_user_metrics_endpoint(user_id: str):
                 "ok": False,
                 "error": f"User {user_id} not found",
             }
-        return {
+        return FastJSONResponse({
             "ok": True,
             "metrics": metrics,
             "metadata": {
                 "timestamp": time.time(),
                 "user_id": user_id,
             }
-        }
+        })
     except Exception as e:
         return {
             "ok": False,
@@ -466,33 +810,71 @@ async def get_user_metrics_endpoint(user_id: str):
         }
 
 
+def _history_page_params(limit: int, before: Optional[str], after: Optional[str], parse) -> int:
+    """Valida los cursores (`parse` lanza ValueError si el formato es inválido) y recorta limit"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Usa 'before' o 'after', no ambos")
+    for name, value in (("before", before), ("after", after)):
+        if value:
+            try:
+                parse(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Cursor '{name}' inválido: {value}")
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+
+def _parse_message_cursor(cursor: str):
+    """Cursor del historial de conversación: created_at ISO 8601 y, opcional, |id"""
+    created_at, message_id = parse_cursor(cursor)
+    datetime.fromisoformat(created_at)
+    if message_id is not None and not re.fullmatch(r"[\w-]+", message_id):
+        raise ValueError(message_id)
+
+
 @app.get("/user/{user_id}/nutrition/history", tags=["nutrition"])
-async def get_nutrition_history(user_id: str, limit: int = 30):
+async def get_nutrition_history(
+    user_id: str,
+    limit: int = 30,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
     """
-    Obtiene el historial de nutrición diaria del usuario (últimos N días).
+    Obtiene el historial de nutrición diaria del usuario, paginado por fecha (cursor).
     
     Args:
         user_id: UUID del usuario
-        limit: Número máximo de días a retornar (default: 30)
+        limit: Días por página (default: 30, máximo 100)
+        before: Días anteriores a esta fecha (YYYY-MM-DD); sin cursor, los más recientes
+        after: Días posteriores a esta fecha (YYYY-MM-DD)
     
     Returns:
         {
             "ok": true,
-            "daily_nutrition": [ ... ],
-            "metadata": { ... }
+            "daily_nutrition": [ ... ],  # del más reciente al más antiguo
+            "metadata": { ..., "next_cursor": "YYYY-MM-DD" o null }
         }
+    
+    `next_cursor` se pasa en el mismo parámetro (`before` o `after`) para la página siguiente.
     """
+    page_size = _history_page_params(limit, before, after, date_type.fromisoformat)
     try:
-        daily_nutrition = await get_daily_nutrition(user_id, limit=limit)
-        return {
+        daily_nutrition, has_more = await get_daily_nutrition_page(
+            user_id, limit=page_size, before=before, after=after
+        )
+        next_cursor = None
+        if has_more and daily_nutrition:
+            next_cursor = daily_nutrition[0]["date"] if after else daily_nutrition[-1]["date"]
+        return FastJSONResponse({
             "ok": True,
             "daily_nutrition": daily_nutrition,
             "metadata": {
                 "timestamp": time.time(),
                 "user_id": user_id,
                 "count": len(daily_nutrition),
+                "limit": page_size,
+                "next_cursor": next_cursor,
             }
-        }
+        })
     except Exception as e:
         return {
             "ok": False,
@@ -521,13 +903,14 @@ async def get_today_nutrition_endpoint(user_id: str, date: str):
         }
     """
     try:
-        nutrition = await get_today_nutrition(user_id, date)
+        # Más las comidas registradas con /analyze-meal que todavía no se escribieron
+        nutrition = get_meal_log().with_pending(user_id, date, await get_today_nutrition(user_id, date))
         if not nutrition:
             return {
                 "ok": False,
                 "error": f"No nutrition record found for {date}",
             }
-        return {
+        return FastJSONResponse({
             "ok": True,
             "daily_nutrition": nutrition,
             "metadata": {
@@ -535,7 +918,7 @@ async def get_today_nutrition_endpoint(user_id: str, date: str):
                 "user_id": user_id,
                 "date": date,
             }
-        }
+        })
     except Exception as e:
         return {
             "ok": False,
@@ -565,7 +948,11 @@ class ChatResponse(BaseModel):
 
 
 @app.post("/chat/{user_id}", tags=["chatbot"], response_model=ChatResponse)
-async def nutrition_chatbot(user_id: str, request: ChatRequest):
+async def nutrition_chatbot(
+    user_id: str,
+    request: ChatRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
     """
     Chatbot de recomendaciones nutricionales con memory y contexto del usuario.
     
@@ -582,6 +969,8 @@ async def nutrition_chatbot(user_id: str, request: ChatRequest):
             "message": "Tu pregunta o solicitud",
             "user_name": "Tu nombre (opcional)"
         }
+        Header `Idempotency-Key` (opcional): un reintento con la misma clave repite la
+        respuesta sin volver a llamar al modelo ni duplicar el historial
     
     Returns:
         {
@@ -597,23 +986,36 @@ async def nutrition_chatbot(user_id: str, request: ChatRequest):
                 response="El mensaje no puede estar vacío",
             )
         
-        # Crear instancia del chatbot
-        chatbot = NutritionChatbot(
-            user_id=user_id,
-            user_name=request.user_name or "Usuario",
-        )
-        
-        # Procesar mensaje
-        response_text, metadata = await chatbot.chat(request.message)
+        annotate_request(message_len=len(request.message))
         
-        return ChatResponse(
-            ok=True,
-            response=response_text,
-            metadata=metadata,
+        async def reply():
+            # Crear instancia del chatbot
+            chatbot = NutritionChatbot(
+                user_id=user_id,
+                user_name=request.user_name or "Usuario",
+            )
+
+            # Procesar mensaje (guarda el turno en conversation_history)
+            response_text, metadata = await chatbot.chat(request.message)
+
+            return ChatResponse(
+                ok=True,
+                response=response_text,
+                metadata=metadata,
+            )
+
+        return await run_idempotent(
+            idempotency_key,
+            f"/chat/{user_id}",
+            reply,
+            request.message,
+            request.user_name or "",
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] nutrition_chatbot: {str(e)}")
+        log.error("nutrition_chatbot falló", extra={"user_id": user_id, "error": str(e)})
         return ChatResponse(
             ok=False,
             response=f"Error en el chatbot: {str(e)}",
@@ -622,32 +1024,50 @@ async def nutrition_chatbot(user_id: str, request: ChatRequest):
 
 
 @app.get("/chat/{user_id}/history", tags=["chatbot"])
-async def get_chat_history(user_id: str, limit: int = 50):
+async def get_chat_history(
+    user_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
     """
-    Obtiene el historial de conversación del usuario.
+    Obtiene el historial de conversación del usuario, paginado por created_at + id (cursor).
     
     Args:
         user_id: UUID del usuario
-        limit: Número máximo de mensajes a retornar (default: 50)
+        limit: Mensajes por página (default: 50, máximo 100)
+        before: Cursor "created_at|id" (o solo created_at): mensajes anteriores; sin
+            cursor, los más recientes
+        after: Cursor de la misma forma: mensajes posteriores
     
     Returns:
         {
             "ok": true,
-            "history": [ ... ],
-            "metadata": { ... }
+            "history": [ ... ],  # en orden cronológico
+            "metadata": { ..., "next_cursor": "created_at|id" o null }
         }
+    
+    `next_cursor` se pasa en el mismo parámetro (`before` o `after`) para la página siguiente.
     """
+    page_size = _history_page_params(limit, before, after, _parse_message_cursor)
     try:
-        history = await get_conversation_history(user_id, limit=limit)
-        return {
+        history, has_more = await get_conversation_page(
+            user_id, limit=page_size, before=before, after=after
+        )
+        next_cursor = None
+        if has_more and history:
+            next_cursor = page_cursor(history[-1] if after else history[0], "created_at", "id")
+        return FastJSONResponse({
             "ok": True,
             "history": history,
             "metadata": {
                 "timestamp": time.time(),
                 "user_id": user_id,
                 "message_count": len(history),
+                "limit": page_size,
+                "next_cursor": next_cursor,
             }
-        }
+        })
     except Exception as e:
         return {
             "ok": False,
@@ -1,28 +1,67 @@
 """
 Chatbot de recomendaciones nutricionales con memory
 Usa LangChain para mantener contexto y hacer recomendaciones inteligentes
+- Memoria acotada: todo lo que el resumen acumulado (conversation_summaries) todavía no
+  cubre va literal al prompt; al pasar de ventana + umbral, lo anterior a la ventana se
+  incorpora al resumen en segundo plano
 """
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import List, Dict, Any, Tuple
-
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage
-from langchain_core.prompts import ChatPromptTemplate
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Set, Tuple
 
 from supabase_client import (
     get_user_metrics,
     get_daily_nutrition,
     get_conversation_history,
+    get_conversation_range,
+    get_conversation_summary,
     save_conversation_message,
+    save_conversation_summary,
+    message_cursor,
+    ConversationSummary,
     UserMetrics,
     DailyNutrition,
 )
+from llm_client import get_chat_model
+from meal_log import get_meal_log
+from orchestration.config import get_config
+from server_timing import timing_stage, STAGE_MODEL
+from structured_logging import get_logger
+
+if TYPE_CHECKING:  # LangChain se importa en el primer uso (arranque en frío)
+    from langchain_core.messages import BaseMessage
+
+log = get_logger("chatbot")
 
 # Config
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
 DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
 
+SUMMARY_PROMPT = """Actualiza el resumen de una conversación entre un usuario y su asistente de nutrición.
+
+RESUMEN ACTUAL:
+{previous}
+
+MENSAJES NUEVOS (del más antiguo al más reciente):
+{transcript}
+
+Escribe el resumen actualizado en español, en un máximo de {max_words} palabras.
+Conserva lo que sirva para conversaciones futuras: datos personales, alergias,
+preferencias y restricciones, objetivos, comidas registradas y recomendaciones dadas.
+Responde solo con el resumen."""
+
+# Caracteres por mensaje en el texto que se resume (respuestas largas del asistente)
+_SUMMARY_MESSAGE_CHARS = 1200
+
+# Usuarios con una actualización de resumen en curso (evita duplicarlas en este proceso)
+_summarizing: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+# Hilo propio para las llamadas de resumen: no ocupan el pool por defecto (to_thread)
+# que usan las respuestas en primer plano
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+
 
 class NutritionChatbot:
     """
@@ -39,11 +78,7 @@ class NutritionChatbot:
         """
         self.user_id = user_id
         self.user_name = user_name
-        self.llm = ChatGoogleGenerativeAI(
-            model=DEFAULT_MODEL,
-            temperature=0.7,
-            google_api_key=GOOGLE_API_KEY,
-        )
+        self.llm = get_chat_model(temperature=0.7)
     
     async def _build_context(self) -> Dict[str, Any]:
         """
@@ -62,6 +97,8 @@ class NutritionChatbot:
                 (r for r in daily_records if r.date == today),
                 None
             )
+            # Comidas de /analyze-meal (log=true) que todavía no se escribieron
+            today_nutrition = get_meal_log().with_pending(self.user_id, today, today_nutrition)
             
             context = {
                 "user_name": self.user_name,
@@ -73,34 +110,50 @@ class NutritionChatbot:
             return context
         
         except Exception as e:
-            print(f"[ERROR] _build_context: {str(e)}")
+            log.error("_build_context falló", extra={"user_id": self.user_id, "error": str(e)})
             raise
     
-    async def _get_conversation_memory(self, limit: int = 10) -> List[BaseMessage]:
+    async def _get_conversation_memory(self) -> Tuple[List["BaseMessage"], Optional[ConversationSummary]]:
         """
-        Obtiene el historial de conversación formateado para LangChain
-        
-        Args:
-            limit: Número de mensajes anteriores a recuperar
+        Obtiene la memoria de la conversación formateada para LangChain: el resumen
+        acumulado y todos los mensajes posteriores a él (ninguno queda afuera del prompt
+        mientras espera al resumen). Con WINDOW_MESSAGES + SUMMARY_TRIGGER_MESSAGES sin
+        resumir, agenda en segundo plano el resumen de los anteriores a la ventana
         
         Returns:
-            Lista de mensajes (HumanMessage o SystemMessage)
+            Tupla (mensajes HumanMessage/AIMessage en orden cronológico, resumen o None)
         """
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        memory = get_config().chat_memory
+        summary = None
+        if memory.SUMMARY_ENABLED:
+            try:
+                summary = await get_conversation_summary(self.user_id)
+            except Exception:
+                summary = None  # Sin resumen (p. ej. tabla aún no creada): solo la ventana
+
         try:
-            history = await get_conversation_history(self.user_id, limit=limit)
-            
-            messages = []
-            for msg in history:
-                if msg.message_type == "user":
-                    messages.append(HumanMessage(content=msg.content))
-                else:
-                    messages.append(SystemMessage(content=msg.content))
-            
-            return messages
-        
+            # Una sola query: los no resumidos, hasta ventana + umbral
+            extra = memory.SUMMARY_TRIGGER_MESSAGES if memory.SUMMARY_ENABLED else 0
+            history = await get_conversation_history(
+                self.user_id,
+                limit=memory.WINDOW_MESSAGES + extra,
+                after=summary.covered_until if summary else None,
+            )
         except Exception as e:
-            print(f"[ERROR] _get_conversation_memory: {str(e)}")
-            return []
+            log.error("_get_conversation_memory falló", extra={"user_id": self.user_id, "error": str(e)})
+            return [], summary
+
+        window = history[len(history) - memory.WINDOW_MESSAGES:] if memory.WINDOW_MESSAGES else []
+        if extra and window and len(history) - len(window) >= extra:
+            _schedule_summary_update(self.user_id, summary, before=message_cursor(window[0]))
+
+        messages = [
+            HumanMessage(content=msg.content) if msg.message_type == "user" else AIMessage(content=msg.content)
+            for msg in history
+        ]
+        return messages, summary
     
     def _format_context_for_prompt(self, context: Dict[str, Any]) -> str:
         """
@@ -162,8 +215,11 @@ CONSUMO DE HOY ({today_nutrition.date}):
             context = await self._build_context()
             context_str = self._format_context_for_prompt(context)
             
-            # Obtener historial
-            memory_messages = await self._get_conversation_memory(limit=5)
+            # Obtener historial (ventana reciente + resumen de lo anterior)
+            memory_messages, summary = await self._get_conversation_memory()
+            summary_str = (
+                f"\nRESUMEN DE CONVERSACIONES ANTERIORES:\n{summary.summary}\n" if summary else ""
+            )
             
             # System prompt
             system_prompt = f"""Eres un experto nutricionista y asistente de salud personalizado.
@@ -175,11 +231,13 @@ Tu rol es:
 5. Sugerir alternativas saludables y deliciosas
 
 {context_str}
-
+{summary_str}
 Responde siempre en español de manera amigable y profesional.
 Proporciona recomendaciones específicas basadas en los datos del usuario."""
             
             # Construir mensajes para LangChain
+            from langchain_core.messages import HumanMessage, SystemMessage
+
             messages = [
                 SystemMessage(content=system_prompt),
                 *memory_messages,
@@ -187,8 +245,9 @@ Proporciona recomendaciones específicas basadas en los datos del usuario."""
             ]
             
             # Invocar LLM
-            print(f"[DEBUG] Invocando chatbot para usuario {self.user_name}...")
-            response = self.llm.invoke(messages)
+            log.debug("Invocando chatbot", extra={"user_id": self.user_id, "memory_messages": len(memory_messages)})
+            with timing_stage(STAGE_MODEL):
+                response = await asyncio.to_thread(self.llm.invoke, messages)
             assistant_response = response.content
             
             # Guardar en historial
@@ -209,12 +268,66 @@ Proporciona recomendaciones específicas basadas en los datos del usuario."""
                 "model": DEFAULT_MODEL,
                 "context_available": True,
                 "memory_messages_count": len(memory_messages),
+                "summary_messages_count": summary.messages_summarized if summary else 0,
             }
             
             return assistant_response, metadata
         
         except Exception as e:
-            print(f"[ERROR] chat: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.exception("chat falló", extra={"user_id": self.user_id})
             raise
+
+
+def _schedule_summary_update(user_id: str, summary: Optional[ConversationSummary], before: str):
+    """Agenda _update_summary sin demorar la respuesta (una por usuario a la vez)"""
+    if user_id in _summarizing:
+        return
+    _summarizing.add(user_id)
+    task = asyncio.get_running_loop().create_task(_update_summary(user_id, summary, before))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _update_summary(user_id: str, summary: Optional[ConversationSummary], before: str):
+    """
+    Incorpora al resumen los mensajes anteriores al cursor `before` (el primero de la
+    ventana), del más antiguo al más nuevo. Si quedan más de SUMMARY_BATCH_MESSAGES, el resto
+    entra en las próximas actualizaciones
+    """
+    from langchain_core.messages import HumanMessage
+
+    memory = get_config().chat_memory
+    try:
+        messages = await get_conversation_range(
+            user_id,
+            after=summary.covered_until if summary else None,
+            before=before,
+            limit=memory.SUMMARY_BATCH_MESSAGES,
+        )
+        if not messages:
+            return
+        transcript = "\n".join(
+            f"{'Usuario' if msg.message_type == 'user' else 'Asistente'}: {msg.content[:_SUMMARY_MESSAGE_CHARS]}"
+            for msg in messages
+        )
+        prompt = SUMMARY_PROMPT.format(
+            previous=summary.summary if summary else "(sin resumen todavía)",
+            transcript=transcript,
+            max_words=memory.SUMMARY_MAX_WORDS,
+        )
+        llm = get_chat_model(temperature=0.0)
+        response = await asyncio.get_running_loop().run_in_executor(
+            _summary_executor, llm.invoke, [HumanMessage(content=prompt)]
+        )
+        total = (summary.messages_summarized if summary else 0) + len(messages)
+        await save_conversation_summary(
+            user_id,
+            summary=str(response.content).strip(),
+            covered_until=message_cursor(messages[-1]),
+            messages_summarized=total,
+        )
+        log.info("resumen de conversación actualizado", extra={"user_id": user_id, "messages": len(messages), "total": total})
+    except Exception as e:
+        log.warning("no se pudo actualizar el resumen de conversación", extra={"user_id": user_id, "error": str(e)})
+    finally:
+        _summarizing.discard(user_id)
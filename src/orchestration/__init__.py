@@ -4,7 +4,7 @@ Expone la API principal para invocar el flujo de procesamiento
 """
 
 from .state import OrchestrationState, MediaFile, MediaType, AnalysisType
-from .graph import get_orchestration_graph, invoke_orchestration
+from .graph import get_orchestration_graph, invoke_orchestration, run_orchestration
 from .config import get_config, set_config, OrchestrationConfig
 
 __all__ = [
@@ -14,6 +14,7 @@ __all__ = [
     "AnalysisType",
     "get_orchestration_graph",
     "invoke_orchestration",
+    "run_orchestration",
     "get_config",
     "set_config",
     "OrchestrationConfig",
@@ -4,7 +4,7 @@ orchestration_config.py - Configuración centralizada para LangGraph Orchestrati
 
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 
 class EnvironmentMode(Enum):
@@ -169,6 +169,11 @@ class LoggingConfig:
     SAVE_LOGS_TO_FILE: bool = False
     LOG_FILE_PATH: str = "logs/orchestration.log"
     
+    # Pipeline no bloqueante (cola + hilo escritor)
+    LOG_FORMAT: str = "json"  # json, text
+    LOG_QUEUE_SIZE: int = 10000  # Registros en cola antes de descartar
+    DEBUG_SAMPLE_RATE: float = 1.0  # Fracción de eventos DEBUG que se escriben
+    
     # Nivel de detalle en respuestas
     INCLUDE_EXECUTION_LOGS_IN_RESPONSE: bool = True
     INCLUDE_METADATA_IN_RESPONSE: bool = True
@@ -176,12 +181,178 @@ class LoggingConfig:
 
 @dataclass
 class CacheConfig:
-    """Configuración de caching (futuro)"""
+    """Configuración del cache L1 (proceso) + L2 (compartido), ver src/cache.py"""
+    
+    ENABLED: bool = False  # Producción lo activa; también vía CACHE_ENABLED
+    BACKEND: str = "memory"  # memory (solo L1), sqlite (workers del host), redis (réplicas)
+    TTL_SECONDS: int = 3600  # 1 hora (default para caches sin TTL propio)
+    MAX_ENTRIES: int = 1000  # Por cache, en L1
+    
+    # TTL por cache con nombre
+    TTL_BY_NAME: Dict[str, int] = field(default_factory=lambda: {
+        "meal_analysis": 24 * 3600,  # Misma foto → mismo análisis (temperatura 0)
+        "files_api": 46 * 3600,  # Gemini borra los archivos subidos a las 48 h
+        "pdf_pages": 3600,  # Texto extraído por página (menús que se repiten)
+        "label_ocr": 24 * 3600,  # Texto OCR de etiquetas (mismo producto, misma foto)
+        # Lecturas de Supabase (read-through); las escrituras de este servicio las invalidan
+        "user_metrics": 600,  # Cambia pocas veces al día
+        "daily_nutrition": 300,  # Últimos días (perfil, historial, chatbot)
+        "today_nutrition": 60,  # Otros servicios también suman comidas al día
+    })
+    
+    # Segundos extra que un valor vencido se sirve mientras se refresca en segundo plano
+    # (stale-while-revalidate, solo en get_or_revalidate)
+    STALE_BY_NAME: Dict[str, int] = field(default_factory=lambda: {
+        "user_metrics": 3600,
+        "daily_nutrition": 900,
+        "today_nutrition": 120,
+    })
+    
+    # Tamaño L1 por cache con nombre (los que guardan valores grandes)
+    MAX_ENTRIES_BY_NAME: Dict[str, int] = field(default_factory=lambda: {
+        "pdf_pages": 100,
+    })
+    
+    # L2
+    SQLITE_PATH: str = "/tmp/nutriapp-cache.sqlite3"
+    REDIS_URL: str = ""  # También vía REDIS_URL
+    L2_MAX_ENTRIES: int = 100000
+    LEASE_SECONDS: float = 30.0  # Máximo que otro worker espera un cálculo en curso
+
+
+@dataclass
+class IdempotencyConfig:
+    """
+    Respuestas por Idempotency-Key (src/idempotency.py). Store propio, activo aunque
+    cache.ENABLED sea False; usa el L2 de cache.BACKEND para que lo vean todos los workers
+    """
+    
+    TTL_SECONDS: int = 24 * 3600  # Reintentos de clientes móviles
+    MAX_ENTRIES: int = 1000  # En L1
+    LEASE_SECONDS: float = 30.0  # Se renueva mientras el request original sigue en curso
+    RETRY_AFTER_SECONDS: int = 2  # Retry-After del 409 (request original en curso en otro worker)
+
+
+@dataclass
+class MediaPreprocessConfig:
+    """Preprocesamiento local de medios antes de llamar al modelo (nodo preprocess_media)"""
+    
+    # PDFs: texto de las páginas más relevantes (BM25) en vez del PDF completo
+    PDF_ENABLED: bool = True
+    PDF_TOP_PAGES: int = 4  # PDFs con hasta estas páginas se envían completos (como texto)
+    PDF_MAX_CHARS: int = 24000  # Tope de texto enviado por PDF
+    PDF_MIN_CHARS_PER_PAGE: int = 80  # Menos texto por página → escaneado, se envía el PDF
+    
+    # Audio: mono, 16 kHz, Opus (ffmpeg) y sin silencio en los extremos
+    AUDIO_ENABLED: bool = True
+    AUDIO_MIN_BYTES: int = 32 * 1024  # Notas más chicas se envían tal cual
+    AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_BITRATE: str = "24k"
+    AUDIO_SILENCE_DB: float = -45.0  # Bajo este nivel (dBFS) se considera silencio
+    
+    # Video: fotogramas clave (cambios de escena) como imágenes + pista de audio opcional
+    VIDEO_ENABLED: bool = True
+    VIDEO_MIN_BYTES: int = 1024 * 1024  # Videos más chicos se envían tal cual
+    VIDEO_MAX_FRAMES: int = 6
+    VIDEO_SCENE_THRESHOLD: float = 0.3  # 0-1: cuánto debe cambiar la imagen para ser escena nueva
+    VIDEO_FRAME_WIDTH: int = 768  # px; los fotogramas más anchos se reducen
+    VIDEO_INCLUDE_AUDIO: bool = True  # Narración del usuario (mono, 16 kHz, Opus)
+    
+    # Etiquetas nutricionales (AnalysisType.PRODUCT_LABEL): OCR local + parser de la tabla
+    LABEL_OCR_ENABLED: bool = True
+    LABEL_OCR_LANG: str = "spa+eng"
+    LABEL_MIN_CONFIDENCE: float = 0.6  # Desde aquí se envía el texto leído en vez de la imagen
+    # Desde aquí se responde con la tabla: sin modelo si la pregunta es genérica ("analiza la
+    # etiqueta"); si no, una llamada corta solo de texto (valores + pregunta) la contesta
+    LABEL_SKIP_MODEL_CONFIDENCE: float = 0.9
+    LABEL_ANSWER_MAX_TOKENS: int = 512
+    LABEL_MAX_OCR_CHARS: int = 3000  # Texto OCR que acompaña a los valores (ingredientes, ...)
+    OCR_TIMEOUT_SECONDS: float = 10.0
+    
+    FFMPEG_TIMEOUT_SECONDS: float = 60.0
+
+
+@dataclass
+class MediaPoolConfig:
+    """Pool de procesos para transformaciones de medios (src/media/pool.py)"""
+    
+    WORKERS: int = 0  # 0 = núcleos disponibles (también vía MEDIA_POOL_WORKERS)
+    MAX_PENDING: int = 0  # Trabajos en vuelo antes de aplicar back-pressure (0 = 2x WORKERS)
+    INLINE_THRESHOLD_BYTES: int = 512 * 1024  # Más chicos se procesan en el hilo actual
+    QUEUE_TIMEOUT_SECONDS: float = 10.0  # Espera máxima por un lugar antes de responder 503
+    # Hilos propios del grafo de /qa: sus esperas al pool no ocupan el pool por defecto
+    # (asyncio.to_thread) que usan las llamadas a Supabase del resto de endpoints
+    GRAPH_THREADS: int = 8
+
+
+@dataclass
+class JobsConfig:
+    """Jobs asíncronos de /qa (POST /qa/jobs + polling o webhook), ver src/jobs.py"""
+    
+    WORKERS: int = 2  # Jobs ejecutándose a la vez por proceso
+    MAX_QUEUED: int = 50  # Jobs en espera antes de responder 503
+    BACKEND: str = "memory"  # memory (solo este proceso) o sqlite (visible para los workers del host); también vía JOBS_BACKEND
+    SQLITE_PATH: str = "/tmp/nutriapp-jobs.sqlite3"  # También vía JOBS_SQLITE_PATH
+    RESULT_TTL_SECONDS: int = 3600  # Tiempo que se conserva el resultado para polling
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    WEBHOOK_RETRIES: int = 3  # Intentos con backoff exponencial (1 s, 2 s, ...)
+    # Hosts a los que se puede mandar webhook_url ("api.ejemplo.com" o ".ejemplo.com" para
+    # subdominios); vacío = webhooks deshabilitados. También vía JOBS_WEBHOOK_ALLOWED_HOSTS (coma)
+    WEBHOOK_ALLOWED_HOSTS: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ChatMemoryConfig:
+    """Memoria del chatbot: ventana de mensajes recientes + resumen acumulado de los anteriores"""
+    
+    WINDOW_MESSAGES: int = 10  # Mensajes recientes que quedan literales al resumir los anteriores
+    SUMMARY_ENABLED: bool = True
+    # Mensajes sin resumir antes de la ventana que disparan el resumen; hasta entonces van
+    # literales al prompt (como mucho WINDOW_MESSAGES + este valor)
+    SUMMARY_TRIGGER_MESSAGES: int = 10
+    SUMMARY_BATCH_MESSAGES: int = 60  # Máximo de mensajes que se incorporan por actualización
+    SUMMARY_MAX_WORDS: int = 200  # Tope del resumen (mantiene acotado el prompt)
+
+
+@dataclass
+class MealLogConfig:
+    """Registro automático de /analyze-meal (log=true) en daily_nutrition, ver src/meal_log.py"""
+    
+    ENABLED: bool = True  # False: cada comida se suma con su propio increment_daily_nutrition
+    FLUSH_INTERVAL_SECONDS: float = 2.0  # Cada cuánto se mandan los incrementos acumulados
+    MAX_PENDING_KEYS: int = 200  # Días (usuario, fecha) pendientes que adelantan el flush
+    FLUSH_CONCURRENCY: int = 4  # Incrementos en vuelo a la vez (cada uno ocupa un hilo)
+    SPOOL_PATH: str = "/tmp/nutriapp-meal-log.sqlite3"  # Lo no enviado al apagar; "" lo desactiva (también vía MEAL_LOG_SPOOL_PATH)
+    RETRY_BACKOFF_SECONDS: float = 2.0  # Espera antes de reenviar un incremento fallido; se duplica por intento
+    RETRY_BACKOFF_MAX_SECONDS: float = 120.0
+    MAX_PERMANENT_FAILURES: int = 3  # Rechazos de la base (FK, 4xx) antes de pasar a meal_log_dead_letter
+
+
+@dataclass
+class ChangeFeedConfig:
+    """Invalidación de los caches de usuario por cambios en la base, ver src/change_feed.py"""
+    
+    BACKEND: str = "off"  # off, realtime (Supabase Realtime) o local (eventos publicados en el proceso, tests); también vía CHANGE_FEED_BACKEND
+    TABLES: Tuple[str, ...] = ("user_metrics", "daily_nutrition")
+    CONNECT_TIMEOUT_SECONDS: float = 10.0
+    HEALTH_CHECK_SECONDS: float = 5.0  # Cada cuánto se revisa la conexión (reconecta con backoff)
+    
+    # TTL mientras el feed está suscrito (los cambios llegan al instante); sin feed rigen
+    # los de CacheConfig.TTL_BY_NAME
+    TTL_BY_NAME: Dict[str, int] = field(default_factory=lambda: {
+        "user_metrics": 24 * 3600,
+        "daily_nutrition": 6 * 3600,
+        "today_nutrition": 6 * 3600,
+    })
+
+
+@dataclass
+class WarmupConfig:
+    """Warm-up en el arranque (lifespan de FastAPI), antes de aceptar tráfico"""
     
-    ENABLED: bool = False
-    BACKEND: str = "memory"  # memory, redis
-    TTL_SECONDS: int = 3600  # 1 hora
-    MAX_ENTRIES: int = 1000
+    ENABLED: bool = True
+    PRIME_BACKENDS: bool = False  # Request mínimo a Gemini y Supabase (abre keep-alive)
+    TIMEOUT_SECONDS: float = 20.0  # Pasado este tiempo se arranca igual (no es fatal)
 
 
 @dataclass
@@ -197,6 +368,14 @@ class OrchestrationConfig:
     prompt_enrichment: PromptEnrichmentConfig = field(default_factory=PromptEnrichmentConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
     cache: CacheConfig = field(default_factory=CacheConfig)
+    idempotency: IdempotencyConfig = field(default_factory=IdempotencyConfig)
+    warmup: WarmupConfig = field(default_factory=WarmupConfig)
+    media_pool: MediaPoolConfig = field(default_factory=MediaPoolConfig)
+    preprocess: MediaPreprocessConfig = field(default_factory=MediaPreprocessConfig)
+    jobs: JobsConfig = field(default_factory=JobsConfig)
+    chat_memory: ChatMemoryConfig = field(default_factory=ChatMemoryConfig)
+    meal_log: MealLogConfig = field(default_factory=MealLogConfig)
+    change_feed: ChangeFeedConfig = field(default_factory=ChangeFeedConfig)
     
     # Settings globales
     ENABLE_PARALLEL_PROCESSING: bool = False  # LangGraph feature
@@ -211,9 +390,13 @@ class OrchestrationConfig:
             config.mode = EnvironmentMode.PRODUCTION
             config.generation.MAX_GENERATION_RETRIES = 3
             config.logging.LOG_LEVEL = "WARNING"
+            config.logging.DEBUG_SAMPLE_RATE = 0.01
             config.files_api.AUTO_CLEANUP = True
             config.cache.ENABLED = True
             config.cache.BACKEND = "redis"
+            config.warmup.PRIME_BACKENDS = True
+            config.jobs.BACKEND = "sqlite"  # El polling puede caer en otro worker de uvicorn
+            config.change_feed.BACKEND = "realtime"  # Otras apps también escriben user_metrics/daily_nutrition
             
         elif env == "staging":
             config.mode = EnvironmentMode.STAGING
@@ -3,8 +3,13 @@ Orquestación de flujos multimodales con LangGraph
 Gestiona: validación → clasificación → procesamiento → generación
 """
 
+import asyncio
+import contextvars
 import time
 import os
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from pathlib import Path
 from typing import List, Optional, Tuple, Any, Dict
 import io
@@ -19,41 +24,58 @@ try:
 except:
     pass
 
-# LangGraph
-from langgraph.graph import StateGraph, END
-
-# LangChain
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
-
-# Gemini SDK (fallback)
-try:
-    from google import genai as google_genai
-    from google.genai.types import Part
-    USING_NEW_SDK = True
-except:
-    import google.generativeai as google_genai
-    USING_NEW_SDK = False
+# Gemini SDK: se detecta sin importarlo. LangGraph y el SDK se importan en el primer
+# uso (build_orchestration_graph / _get_gemini_client) para no pagar segundos de
+# import en el arranque en frío; el SDK viejo solo se carga si falta el nuevo.
+USING_NEW_SDK = importlib.util.find_spec("google.genai") is not None
 
 # Local
+from .config import get_config
 from .state import (
     OrchestrationState,
     MediaFile,
     MediaType,
     AnalysisType,
 )
+from server_timing import (
+    timing_stage,
+    STAGE_PREPROCESS,
+    STAGE_MODEL,
+    STAGE_FILES_API,
+)
 
 # Config
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
 DEFAULT_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+# Prefijo de la respuesta cuando falla la llamada al modelo (la API no la guarda por Idempotency-Key)
+GENERATION_ERROR_PREFIX = "Error al generar respuesta"
 
 # Cliente Gemini - lazy initialization (se crea cuando sea necesario)
 _gemini_client = None
 
+def _genai_sdk():
+    """Importa (una vez) el módulo del SDK de Gemini disponible"""
+    if USING_NEW_SDK:
+        from google import genai as google_genai
+    else:
+        import google.generativeai as google_genai
+    return google_genai
+
+
+def _part_type():
+    """Importa (una vez) la clase Part del SDK de Gemini disponible"""
+    if USING_NEW_SDK:
+        from google.genai.types import Part
+    else:
+        from google.generativeai.types import Part
+    return Part
+
+
 def _get_gemini_client():
     """Obtiene o crea el cliente de Gemini de forma lazy"""
     global _gemini_client
     if _gemini_client is None:
+        google_genai = _genai_sdk()
         if USING_NEW_SDK:
             if not GOOGLE_API_KEY:
                 raise ValueError("GOOGLE_API_KEY no configurada. Verifica config/.env")
@@ -203,6 +225,243 @@ def classify_media(state: OrchestrationState) -> OrchestrationState:
     return state
 
 
+def preprocess_media(state: OrchestrationState) -> OrchestrationState:
+    """
+    Nodo 2b: Preprocesamiento local de medios (CPU en el pool de procesos)
+    - PDF con capa de texto → solo el texto de las páginas relevantes para la pregunta
+    - Audio → mono, 16 kHz, Opus y sin silencio en los extremos (menos bytes y tokens)
+    - Video → fotogramas clave (cambios de escena) como imágenes + audio opcional
+    - Etiqueta nutricional (imagen) → valores leídos por OCR en vez de la imagen
+    Cualquier fallo deja el archivo como está (se envía completo al modelo)
+    """
+    start_time = time.time()
+    state.add_log("preprocess_media", "iniciado")
+    
+    if not state.validation_passed:
+        state.add_log("preprocess_media", "skipped", "validación falló")
+        return state
+    
+    config = get_config().preprocess
+    for media_file in state.media_files:
+        try:
+            if media_file.media_type == MediaType.PDF and config.PDF_ENABLED:
+                _preprocess_pdf(state, media_file, config)
+            elif media_file.media_type == MediaType.AUDIO and config.AUDIO_ENABLED:
+                _preprocess_audio(state, media_file, config)
+            elif media_file.media_type == MediaType.VIDEO and config.VIDEO_ENABLED:
+                _preprocess_video(state, media_file, config)
+            elif media_file.media_type == MediaType.IMAGE and config.LABEL_OCR_ENABLED and (
+                AnalysisType.PRODUCT_LABEL in state.detected_analysis_types
+            ):
+                _preprocess_label(state, media_file, config)
+        except Exception as e:
+            media_file.preprocessing = {"action": "raw", "reason": f"{type(e).__name__}: {e}"}
+            state.add_log("preprocess_media", "warning", f"{media_file.filename}: {e}")
+    
+    state.processing_time_ms += (time.time() - start_time) * 1000
+    return state
+
+
+def _preprocess_pdf(state: OrchestrationState, media_file: MediaFile, config) -> None:
+    """Extrae el texto del PDF (cacheado por contenido) y elige páginas con BM25"""
+    # Imports diferidos: media/cache → structured_logging → orchestration (circular)
+    from cache import get_cache, content_key
+    from media import get_media_pool
+    from media import pdf
+    
+    try:
+        import pypdf  # noqa: F401  (dependencia opcional)
+    except ImportError:
+        media_file.preprocessing = {"kind": "pdf", "action": "raw", "reason": "pypdf no instalado"}
+        return
+    
+    pages_cache = get_cache("pdf_pages")
+    key = content_key(media_file.data)
+    pages = pages_cache.get(key)
+    if pages is None:
+        pages = get_media_pool().run_sync(pdf.extract_pages, media_file.data)
+        pages_cache.set(key, pages)
+    
+    info = {"kind": "pdf", "pages_total": len(pages), "bytes_before": media_file.size_bytes}
+    if not pdf.has_text_layer(pages, config.PDF_MIN_CHARS_PER_PAGE):
+        media_file.preprocessing = {**info, "action": "raw", "reason": "sin capa de texto (escaneado)"}
+        return
+    
+    selection = pdf.select_pages(state.question, pages, config.PDF_TOP_PAGES, config.PDF_MAX_CHARS)
+    if selection is None:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "ninguna página coincide con la pregunta"}
+        return
+    
+    media_file.extracted_text = selection["text"]
+    media_file.preprocessing = {
+        **info,
+        "action": "text",
+        "pages_sent": selection["pages"],
+        "bytes_after": len(selection["text"].encode("utf-8")),
+    }
+    state.add_log(
+        "preprocess_media",
+        "success",
+        f"{media_file.filename}: páginas {selection['pages']} de {len(pages)} como texto",
+    )
+
+
+# Notas de voz que la alternativa sin ffmpeg (stdlib) sabe leer
+_WAV_MIMETYPES = ("audio/wav", "audio/x-wav", "audio/wave")
+
+
+def _preprocess_audio(state: OrchestrationState, media_file: MediaFile, config) -> None:
+    """Transcodifica el audio en el pool y lo reemplaza si el resultado es más chico"""
+    from media import audio, ffmpeg, get_media_pool  # media → structured_logging → orchestration
+    
+    info = {"kind": "audio", "bytes_before": media_file.size_bytes}
+    if media_file.size_bytes < config.AUDIO_MIN_BYTES:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "archivo chico"}
+        return
+    
+    pool = get_media_pool()
+    if ffmpeg.available():
+        data = pool.run_sync(
+            audio.transcode,
+            media_file.data,
+            config.AUDIO_SAMPLE_RATE,
+            config.AUDIO_BITRATE,
+            config.AUDIO_SILENCE_DB,
+            config.FFMPEG_TIMEOUT_SECONDS,
+        )
+        mime_type, encoder = "audio/ogg", "opus"
+    elif media_file.mime_type in _WAV_MIMETYPES:
+        data = pool.run_sync(audio.wav_downmix, media_file.data, config.AUDIO_SAMPLE_RATE, config.AUDIO_SILENCE_DB)
+        mime_type, encoder = "audio/wav", "pcm16"
+    else:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "ffmpeg no instalado"}
+        return
+    
+    if len(data) >= media_file.size_bytes:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "sin reducción"}
+        return
+    
+    media_file.data = data
+    media_file.mime_type = mime_type
+    media_file.size_bytes = len(data)
+    media_file.preprocessing = {
+        **info,
+        "action": "transcoded",
+        "encoder": encoder,
+        "bytes_after": len(data),
+        "reduction": round(1 - len(data) / info["bytes_before"], 3),
+    }
+    state.add_log(
+        "preprocess_media",
+        "success",
+        f"{media_file.filename}: audio {info['bytes_before']} → {len(data)} bytes ({encoder})",
+    )
+
+
+# Una pista Opus más chica es solo silencio (encabezados Ogg)
+_MIN_AUDIO_TRACK_BYTES = 4 * 1024
+
+
+def _preprocess_video(state: OrchestrationState, media_file: MediaFile, config) -> None:
+    """Reemplaza el video por sus fotogramas clave (JPEG) y, si hay, su audio en Opus"""
+    from media import audio, ffmpeg, get_media_pool, video  # media → structured_logging → orchestration
+    
+    info = {"kind": "video", "bytes_before": media_file.size_bytes}
+    if media_file.size_bytes < config.VIDEO_MIN_BYTES:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "archivo chico"}
+        return
+    if not ffmpeg.available():
+        media_file.preprocessing = {**info, "action": "raw", "reason": "ffmpeg no instalado"}
+        return
+    
+    pool = get_media_pool()
+    frames = pool.run_sync(
+        video.keyframes,
+        media_file.data,
+        config.VIDEO_MAX_FRAMES,
+        config.VIDEO_SCENE_THRESHOLD,
+        config.VIDEO_FRAME_WIDTH,
+        config.FFMPEG_TIMEOUT_SECONDS,
+    )
+    if not frames:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "sin fotogramas decodificables"}
+        return
+    parts = [("image/jpeg", frame) for frame in frames]
+    
+    if config.VIDEO_INCLUDE_AUDIO:
+        try:
+            track = pool.run_sync(
+                audio.transcode,
+                media_file.data,
+                config.AUDIO_SAMPLE_RATE,
+                config.AUDIO_BITRATE,
+                config.AUDIO_SILENCE_DB,
+                config.FFMPEG_TIMEOUT_SECONDS,
+            )
+        except ffmpeg.FFmpegError:
+            track = b""  # Video sin pista de audio
+        if len(track) >= _MIN_AUDIO_TRACK_BYTES:
+            parts.append(("audio/ogg", track))
+    
+    bytes_after = sum(len(data) for _, data in parts)
+    if bytes_after >= media_file.size_bytes:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "sin reducción"}
+        return
+    
+    media_file.derived_parts = parts
+    media_file.preprocessing = {
+        **info,
+        "action": "keyframes",
+        "frames": len(frames),
+        "audio": len(parts) > len(frames),
+        "bytes_after": bytes_after,
+        "reduction": round(1 - bytes_after / info["bytes_before"], 3),
+    }
+    state.add_log(
+        "preprocess_media",
+        "success",
+        f"{media_file.filename}: {len(frames)} fotogramas clave ({info['bytes_before']} → {bytes_after} bytes)",
+    )
+
+
+def _preprocess_label(state: OrchestrationState, media_file: MediaFile, config) -> None:
+    """OCR de la etiqueta (cacheado por contenido) y parseo de la tabla nutricional"""
+    from cache import get_cache, content_key  # cache → structured_logging → orchestration
+    from media import get_media_pool, label
+    
+    info = {"kind": "label", "bytes_before": media_file.size_bytes}
+    if not label.available():
+        media_file.preprocessing = {**info, "action": "raw", "reason": "OCR no disponible (tesseract)"}
+        return
+    
+    ocr_cache = get_cache("label_ocr")
+    key = content_key(config.LABEL_OCR_LANG, media_file.data)
+    text = ocr_cache.get(key)
+    if text is None:
+        text = get_media_pool().run_sync(
+            label.ocr_text, media_file.data, config.LABEL_OCR_LANG, config.OCR_TIMEOUT_SECONDS
+        )
+        ocr_cache.set(key, text)
+    
+    parsed = label.parse_label(text)
+    info.update(confidence=parsed["confidence"], basis=parsed["basis"], nutrients=parsed["nutrients"])
+    if parsed["confidence"] < config.LABEL_MIN_CONFIDENCE:
+        media_file.preprocessing = {**info, "action": "raw", "reason": "lectura de la tabla poco confiable"}
+        return
+    
+    media_file.extracted_text = f"{label.summary_text(parsed)}\n\nTexto OCR:\n{text[:config.LABEL_MAX_OCR_CHARS]}"
+    media_file.preprocessing = {
+        **info,
+        "action": "text",
+        "bytes_after": len(media_file.extracted_text.encode("utf-8")),
+    }
+    state.add_log(
+        "preprocess_media",
+        "success",
+        f"{media_file.filename}: etiqueta leída por OCR (confianza {parsed['confidence']})",
+    )
+
+
 def upload_large_files(state: OrchestrationState) -> OrchestrationState:
     """
     Nodo 3: Sube archivos grandes vía Files API (si está habilitado y es SDK nuevo)
@@ -214,19 +473,38 @@ def upload_large_files(state: OrchestrationState) -> OrchestrationState:
         state.add_log("upload_large_files", "skipped", "No habilitado o SDK viejo")
         return state
     
+    # Handles de Files API por contenido: el mismo archivo no se vuelve a subir
+    # mientras Gemini lo conserve (48 h). Los handles cacheados no se borran en cleanup.
+    from cache import get_cache, content_key  # cache → structured_logging → orchestration
+
+    files_cache = get_cache("files_api")
+    
     try:
         for i, media_file in enumerate(state.media_files):
-            if media_file.size_bytes > 20 * 1024 * 1024:  # >20MB
+            replaced = media_file.extracted_text is not None or media_file.derived_parts
+            if not replaced and media_file.size_bytes > 20 * 1024 * 1024:  # >20MB
+                cache_key = content_key(media_file.mime_type, media_file.data)
+                cached_id = files_cache.get(cache_key)
+                if cached_id:
+                    media_file.file_id = cached_id
+                    media_file.is_uploaded = True
+                    state.add_log("upload_large_files", "success", f"Archivo {i+1} reusado: {media_file.filename}")
+                    continue
+                
                 file_obj = io.BytesIO(media_file.data)
                 client = _get_gemini_client()
-                uploaded = client.files.upload(
-                    file=file_obj,
-                    name=media_file.filename,
-                    mime_type=media_file.mime_type,
-                )
+                with timing_stage(STAGE_FILES_API):
+                    uploaded = client.files.upload(
+                        file=file_obj,
+                        name=media_file.filename,
+                        mime_type=media_file.mime_type,
+                    )
                 media_file.file_id = uploaded.name if hasattr(uploaded, 'name') else str(uploaded)
                 media_file.is_uploaded = True
-                state.uploaded_file_ids.append(media_file.file_id)
+                if files_cache.enabled:
+                    files_cache.set(cache_key, media_file.file_id)
+                else:
+                    state.uploaded_file_ids.append(media_file.file_id)
                 state.add_log("upload_large_files", "success", f"Archivo {i+1} subido: {media_file.filename}")
     except Exception as e:
         state.add_log("upload_large_files", "warning", f"Error al subir: {str(e)}")
@@ -310,14 +588,23 @@ def generate_answer(state: OrchestrationState) -> OrchestrationState:
         state.add_log("generate_answer", "failed", "Skipped due to validation errors")
         return state
     
+    if _answer_from_labels(state):
+        state.processing_time_ms += (time.time() - start_time) * 1000
+        return state
+    
     try:
+        Part = _part_type()
+
         # Construir mensaje con archivos
         if USING_NEW_SDK:
             parts = [state.system_prompt]
             
-            # Agregar archivos (directo o referencia)
+            # Agregar archivos (preprocesados, referencia o directo)
             for media_file in state.media_files:
-                if media_file.is_uploaded:
+                replacement = _preprocessed_parts(media_file, Part)
+                if replacement is not None:
+                    parts.extend(replacement)
+                elif media_file.is_uploaded:
                     # Referencia a archivo subido
                     parts.append(Part.from_uri(
                         uri=media_file.file_id,
@@ -333,33 +620,39 @@ def generate_answer(state: OrchestrationState) -> OrchestrationState:
             parts.append(f"Pregunta del usuario: {state.question}")
             
             client = _get_gemini_client()
-            response = client.models.generate_content(
-                model=state.model_name,
-                contents=parts,
-                config={"temperature": state.temperature},
-            )
+            with timing_stage(STAGE_MODEL):
+                response = client.models.generate_content(
+                    model=state.model_name,
+                    contents=parts,
+                    config={"temperature": state.temperature},
+                )
             state.answer = getattr(response, "text", "") or ""
         
         else:
             # Fallback SDK viejo (solo bytes directo)
-            model = google_genai.GenerativeModel(state.model_name)
+            model = _genai_sdk().GenerativeModel(state.model_name)
             parts = [state.system_prompt]
             
             for media_file in state.media_files:
+                replacement = _preprocessed_parts(media_file, Part)
+                if replacement is not None:
+                    parts.extend(replacement)
+                    continue
                 parts.append(Part.from_bytes(
                     data=media_file.data,
                     mime_type=media_file.mime_type
                 ))
             
             parts.append(f"Pregunta del usuario: {state.question}")
-            response = model.generate_content(parts, generation_config={"temperature": state.temperature})
+            with timing_stage(STAGE_MODEL):
+                response = model.generate_content(parts, generation_config={"temperature": state.temperature})
             state.answer = getattr(response, "text", "") or ""
         
         state.answer_markdown = _force_markdown(state.answer)
         state.add_log("generate_answer", "success", f"Respuesta generada ({len(state.answer)} caracteres)")
     
     except Exception as e:
-        state.answer = f"Error al generar respuesta: {type(e).__name__}: {e}"
+        state.answer = f"{GENERATION_ERROR_PREFIX}: {type(e).__name__}: {e}"
         state.answer_markdown = state.answer
         state.add_log("generate_answer", "error", str(e))
     
@@ -382,7 +675,8 @@ def cleanup_uploads(state: OrchestrationState) -> OrchestrationState:
         for file_id in state.uploaded_file_ids:
             try:
                 client = _get_gemini_client()
-                client.files.delete(file_id)
+                with timing_stage(STAGE_FILES_API):
+                    client.files.delete(file_id)
                 state.add_log("cleanup_uploads", "success", f"Borrado: {file_id}")
             except:
                 pass  # Silenciar errores de borrado
@@ -437,6 +731,92 @@ def _detect_language(text: str) -> str:
     return "es"
 
 
+def _timed_node(stage: str, node):
+    """Envuelve un nodo para sumar su duración a una etapa de Server-Timing"""
+    @wraps(node)
+    def wrapper(state: OrchestrationState) -> OrchestrationState:
+        with timing_stage(stage):
+            return node(state)
+    return wrapper
+
+
+_LABEL_QUESTION_INSTRUCTIONS = {
+    "es": "Contesta la pregunta en pocas líneas usando solo estos valores; la tabla completa se muestra aparte.",
+    "en": "Answer the question in a few lines using only these values; the full table is shown separately.",
+}
+
+
+def _answer_from_labels(state: OrchestrationState) -> bool:
+    """
+    Fast path de etiquetas: si todos los archivos son etiquetas leídas con confianza
+    alta, la respuesta lleva la tabla (con semáforo). Una pregunta genérica no llama
+    al modelo; una concreta ("¿sirve para una dieta baja en sodio?") se contesta con
+    una llamada corta solo de texto: los valores leídos y la pregunta, sin la imagen
+    """
+    config = get_config().preprocess
+    threshold = config.LABEL_SKIP_MODEL_CONFIDENCE
+    labels = [media_file.preprocessing for media_file in state.media_files]
+    if not labels or not all(
+        info.get("kind") == "label" and info.get("action") == "text" and info["confidence"] >= threshold
+        for info in labels
+    ):
+        return False
+    
+    from media import label  # media → structured_logging → orchestration
+    
+    tables = "\n\n".join(label.render_markdown(info, state.language) for info in labels)
+    state.answer = tables
+    state.fast_path = "label"
+    if label.is_generic_question(state.question):
+        state.add_log("generate_answer", "success", "Respuesta desde la etiqueta leída localmente (sin modelo)")
+    else:
+        parts = [state.system_prompt] if state.system_prompt else []
+        parts += [
+            f"Valores de la etiqueta '{media_file.filename}': {label.summary_text(media_file.preprocessing)}"
+            for media_file in state.media_files
+        ]
+        parts += [
+            _LABEL_QUESTION_INSTRUCTIONS.get(state.language, _LABEL_QUESTION_INSTRUCTIONS["es"]),
+            f"Pregunta del usuario: {state.question}",
+        ]
+        try:
+            answer = _force_markdown(_generate_text(state, parts, config.LABEL_ANSWER_MAX_TOKENS))
+            if answer:
+                state.answer = f"{answer}\n\n{tables}"
+                state.fast_path = "label_text"
+            state.add_log("generate_answer", "success", "Pregunta sobre la etiqueta respondida solo con texto")
+        except Exception as e:
+            # La tabla sigue siendo una respuesta útil
+            state.add_log("generate_answer", "warning", f"Modelo no disponible, solo la tabla: {e}")
+    state.answer_markdown = state.answer
+    return True
+
+
+def _generate_text(state: OrchestrationState, parts: List[str], max_output_tokens: int) -> str:
+    """Llamada al modelo solo con texto (sin archivos), con la respuesta acotada"""
+    settings = {"temperature": state.temperature, "max_output_tokens": max_output_tokens}
+    with timing_stage(STAGE_MODEL):
+        if USING_NEW_SDK:
+            response = _get_gemini_client().models.generate_content(
+                model=state.model_name, contents=parts, config=settings
+            )
+        else:
+            response = _genai_sdk().GenerativeModel(state.model_name).generate_content(
+                parts, generation_config=settings
+            )
+    return getattr(response, "text", "") or ""
+
+
+def _preprocessed_parts(media_file: MediaFile, Part) -> Optional[List[Any]]:
+    """Partes que reemplazan a un archivo preprocesado localmente (None → se envía tal cual)"""
+    if media_file.extracted_text is not None:
+        return [f"Contenido extraído de '{media_file.filename}':\n{media_file.extracted_text}"]
+    if media_file.derived_parts:
+        header = f"Fotogramas clave de '{media_file.filename}' (en orden) y su audio si lo tiene:"
+        return [header] + [Part.from_bytes(data=data, mime_type=mime) for mime, data in media_file.derived_parts]
+    return None
+
+
 def _force_markdown(text: str) -> str:
     """Limpia fences de código y evita respuestas en JSON puro"""
     import re
@@ -458,22 +838,25 @@ def build_orchestration_graph() -> Any:
     """
     Construye el grafo LangGraph de orquestación multimodal
     """
-    
+    from langgraph.graph import StateGraph, END
+
     # Crear StateGraph
     workflow = StateGraph(OrchestrationState)
     
-    # Agregar nodos
-    workflow.add_node("validate_input", validate_input)
-    workflow.add_node("classify_media", classify_media)
+    # Agregar nodos (los nodos locales cuentan como "preprocess" en Server-Timing)
+    workflow.add_node("validate_input", _timed_node(STAGE_PREPROCESS, validate_input))
+    workflow.add_node("classify_media", _timed_node(STAGE_PREPROCESS, classify_media))
+    workflow.add_node("preprocess_media", _timed_node(STAGE_PREPROCESS, preprocess_media))
     workflow.add_node("upload_large_files", upload_large_files)
-    workflow.add_node("enrich_system_prompt", enrich_system_prompt)
+    workflow.add_node("enrich_system_prompt", _timed_node(STAGE_PREPROCESS, enrich_system_prompt))
     workflow.add_node("generate_answer", generate_answer)
     workflow.add_node("cleanup_uploads", cleanup_uploads)
     
     # Definir flujo
     workflow.set_entry_point("validate_input")
     workflow.add_edge("validate_input", "classify_media")
-    workflow.add_edge("classify_media", "upload_large_files")
+    workflow.add_edge("classify_media", "preprocess_media")
+    workflow.add_edge("preprocess_media", "upload_large_files")
     workflow.add_edge("upload_large_files", "enrich_system_prompt")
     workflow.add_edge("enrich_system_prompt", "generate_answer")
     workflow.add_edge("generate_answer", "cleanup_uploads")
@@ -486,6 +869,7 @@ def build_orchestration_graph() -> Any:
 
 # Instancia global
 _orchestration_graph = None
+_graph_executor: Optional[ThreadPoolExecutor] = None
 
 
 def get_orchestration_graph() -> Any:
@@ -525,3 +909,21 @@ def invoke_orchestration(
         final_state.answer_markdown,
         final_state.get_summary(),
     )
+
+
+async def run_orchestration(
+    question: str,
+    media_files: List[MediaFile],
+    use_files_api: bool = False,
+) -> Tuple[str, Dict]:
+    """
+    invoke_orchestration desde el event loop, en hilos propios (MediaPoolConfig.GRAPH_THREADS):
+    un grafo esperando al pool de medios no deja sin hilos a asyncio.to_thread
+    """
+    global _graph_executor
+    if _graph_executor is None:
+        threads = max(1, get_config().media_pool.GRAPH_THREADS)
+        _graph_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="qa-graph")
+    # Como asyncio.to_thread: el hilo ve los ContextVar del request (Server-Timing, trazas)
+    call = partial(contextvars.copy_context().run, invoke_orchestration, question, media_files, use_files_api)
+    return await asyncio.get_running_loop().run_in_executor(_graph_executor, call)
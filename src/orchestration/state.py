@@ -3,7 +3,7 @@ Definición de estados y tipos para LangGraph Orchestration
 """
 
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from enum import Enum
 
 
@@ -37,6 +37,12 @@ class MediaFile:
     size_bytes: int = 0
     is_uploaded: bool = False
     file_id: Optional[str] = None  # Para archivos subidos a API de Gemini
+    # Preprocesamiento local (nodo preprocess_media): si hay texto extraído o partes
+    # derivadas (mime_type, bytes) se envían en lugar de los bytes originales;
+    # `preprocessing` resume qué se hizo y cuánto se ahorró
+    extracted_text: Optional[str] = None
+    derived_parts: List[Tuple[str, bytes]] = field(default_factory=list)
+    preprocessing: Dict[str, Any] = field(default_factory=dict)
 
 
 @dataclass
@@ -69,6 +75,7 @@ class OrchestrationState:
     # Salida final
     answer: str = ""
     answer_markdown: str = ""
+    fast_path: Optional[str] = None  # label: tabla local sin modelo; label_text: tabla + modelo solo con texto
     metadata: Dict[str, Any] = field(default_factory=dict)
     
     # Auditoría y debugging
@@ -94,9 +101,13 @@ class OrchestrationState:
             "question": self.question[:100] + "..." if len(self.question) > 100 else self.question,
             "language": self.language,
             "media_count": len(self.media_files),
+            "preprocessing": {
+                f.filename: f.preprocessing for f in self.media_files if f.preprocessing
+            },
             "analysis_types": [at.value for at in self.detected_analysis_types],
             "validation_passed": self.validation_passed,
             "answer_length": len(self.answer),
+            "fast_path": self.fast_path,
             "execution_logs": len(self.execution_logs),
             "processing_time_ms": self.processing_time_ms,
         }
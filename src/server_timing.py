@@ -0,0 +1,164 @@
+"""
+Server-Timing: desglose de latencia por etapa en cada respuesta HTTP
+- Cada request obtiene un colector propio (ContextVar) que acumula etapas
+- Las etapas se registran con `timing_stage("model")` desde cualquier capa
+- El middleware agrega el header `Server-Timing` al iniciar la respuesta
+"""
+
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterator, Optional
+
+from fastapi.routing import APIRoute
+
+# Nombres de etapa estándar (usar siempre estos para que el header sea estable)
+STAGE_PARSE = "parse"            # Recepción y parseo del body/form (antes del endpoint)
+STAGE_UPLOAD = "upload"          # Lectura de archivos subidos
+STAGE_PREPROCESS = "preprocess"  # Validación, clasificación, prompts
+STAGE_SUPABASE = "supabase"      # Consultas a Supabase
+STAGE_MODEL = "model"            # Llamadas a Gemini
+STAGE_FILES_API = "files_api"    # Subida/borrado en Gemini Files API
+STAGE_SERIALIZE = "serialize"    # Serialización de la respuesta (FastAPI)
+STAGE_TOTAL = "total"
+
+
+class ServerTiming:
+    """Acumula duraciones (ms) por etapa durante un request"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.endpoint_started_at: Optional[float] = None
+        self.endpoint_done_at: Optional[float] = None
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, duration_ms: float):
+        """Suma una duración a la etapa (varias llamadas se acumulan)"""
+        self.durations[name] = self.durations.get(name, 0.0) + duration_ms
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def header_value(self, now: Optional[float] = None) -> str:
+        """Construye el valor del header Server-Timing"""
+        now = now or time.perf_counter()
+        entries = []
+        if self.endpoint_started_at is not None:
+            entries.append(f"{STAGE_PARSE};dur={(self.endpoint_started_at - self.started_at) * 1000:.1f}")
+        for name, duration in self.durations.items():
+            count = self.counts.get(name, 1)
+            entry = f"{name};dur={duration:.1f}"
+            if count > 1:
+                entry += f';desc="{count} calls"'
+            entries.append(entry)
+        if self.endpoint_done_at is not None and STAGE_SERIALIZE not in self.durations:
+            entries.append(f"{STAGE_SERIALIZE};dur={(now - self.endpoint_done_at) * 1000:.1f}")
+        entries.append(f"{STAGE_TOTAL};dur={(now - self.started_at) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timing: ContextVar[Optional[ServerTiming]] = ContextVar("server_timing", default=None)
+
+
+def get_current_timing() -> Optional[ServerTiming]:
+    """Retorna el colector del request actual (None fuera de un request)"""
+    return _current_timing.get()
+
+
+@contextmanager
+def timing_stage(name: str) -> Iterator[None]:
+    """
+    Mide un bloque y lo suma a la etapa `name` del request actual.
+    Fuera de un request HTTP (scripts, tests) no hace nada.
+    """
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, (time.perf_counter() - start) * 1000)
+
+
+def _mark(attr: str):
+    timing = _current_timing.get()
+    if timing is not None:
+        setattr(timing, attr, time.perf_counter())
+
+
+def _mark_endpoint_bounds(endpoint):
+    """
+    Envuelve un endpoint para marcar cuándo empieza (lo previo es parseo)
+    y cuándo termina (lo posterior es serialización)
+    """
+    if getattr(endpoint, "__server_timing_wrapped__", False):
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            _mark("endpoint_started_at")
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark("endpoint_done_at")
+        wrapper = async_wrapper
+    else:
+        @wraps(endpoint)
+        def sync_wrapper(*args, **kwargs):
+            _mark("endpoint_started_at")
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark("endpoint_done_at")
+        wrapper = sync_wrapper
+
+    # FastAPI resuelve anotaciones con los globals de la función; como el wrapper vive
+    # en este módulo, se entrega la firma ya evaluada con los globals del endpoint
+    wrapper.__signature__ = inspect.signature(endpoint, eval_str=True)
+    wrapper.__server_timing_wrapped__ = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute que marca inicio/fin del endpoint para separar parseo y serialización.
+    Usar con `app.router.route_class = TimedRoute` antes de declarar rutas.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_endpoint_bounds(endpoint), **kwargs)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI: crea el colector por request y agrega `Server-Timing`
+    (y `Timing-Allow-Origin` para que los navegadores expongan los valores).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        token = _current_timing.set(timing)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header_value().encode("latin-1")))
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timing.reset(token)
@@ -0,0 +1,207 @@
+"""
+Logging estructurado (JSON) y no bloqueante para NutriApp
+- Los requests solo encolan el LogRecord (QueueHandler); el formateo JSON,
+  los tracebacks y la escritura a stdout/archivo ocurren en un hilo aparte
+- Nivel, archivo y muestreo se leen de LoggingConfig (orchestration.config)
+- Los eventos DEBUG de alto volumen se muestrean con DEBUG_SAMPLE_RATE
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import orjson
+except Exception:  # orjson es opcional: fallback a json estándar
+    orjson = None
+
+from orchestration.config import LoggingConfig, get_config
+
+ROOT_LOGGER_NAME = "nutriapp"
+
+# Atributos estándar de LogRecord (todo lo demás se considera campo estructurado)
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON (campos `extra` incluidos)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        if orjson is not None:
+            return orjson.dumps(payload, default=str).decode("utf-8")
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los eventos DEBUG (INFO+ siempre pasan)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que nunca bloquea el request:
+    - No formatea en el hilo que loguea (el listener lo hace)
+    - Si la cola está llena, descarta el registro y lo contabiliza
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Se resuelve solo el mensaje (barato); exc_info viaja tal cual al listener.
+        # Los dicts (registros JSON Lines) se dejan intactos para serializarlos allá
+        if not isinstance(record.msg, dict):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Escribe el dict del registro (record.msg) como una línea JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if orjson is not None:
+            return orjson.dumps(record.msg, default=str).decode("utf-8")
+        return json.dumps(record.msg, default=str, ensure_ascii=False)
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_jsonl_listeners: Dict[str, QueueListener] = {}
+
+
+def _build_sink(config: LoggingConfig) -> logging.Handler:
+    """Handler final (stdout o archivo) que corre en el hilo del listener"""
+    if config.SAVE_LOGS_TO_FILE:
+        path = Path(config.LOG_FILE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sink = logging.FileHandler(path, encoding="utf-8")
+    else:
+        sink = logging.StreamHandler(sys.stdout)
+    if config.LOG_FORMAT == "json":
+        sink.setFormatter(JsonFormatter())
+    else:
+        sink.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    return sink
+
+
+def configure_logging(config: Optional[LoggingConfig] = None) -> logging.Logger:
+    """
+    Configura el logger raíz de la app (idempotente).
+    La variable de ambiente LOG_LEVEL tiene prioridad sobre la configuración.
+    """
+    global _listener, _queue_handler
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if _listener is not None:
+        return root
+
+    config = config or get_config().logging
+    level_name = os.environ.get("LOG_LEVEL", config.LOG_LEVEL).upper()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(DebugSamplingFilter(config.DEBUG_SAMPLE_RATE))
+
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+    root.addHandler(_queue_handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, _build_sink(config), respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Detiene los listeners vaciando las colas (se llama en atexit)"""
+    global _listener, _queue_handler
+    for listener in _jsonl_listeners.values():
+        listener.stop()
+    _jsonl_listeners.clear()
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger(ROOT_LOGGER_NAME).removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Obtiene un logger hijo de `nutriapp` (configura el pipeline en el primer uso)
+
+    Uso:
+        log = get_logger("api")
+        log.debug("respuesta del modelo", extra={"chars": len(text)})
+    """
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def get_jsonl_logger(name: str, path: str, queue_size: int = 10000) -> logging.Logger:
+    """
+    Logger independiente que escribe dicts como JSON Lines en `path`,
+    con la misma cola no bloqueante que el logger principal.
+
+    Uso:
+        trace = get_jsonl_logger("trace", "traces/prod.jsonl")
+        trace.info({"endpoint": "/qa", "files": 3})
+    """
+    logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.jsonl.{name}")
+    if name in _jsonl_listeners:
+        return logger
+
+    file_path = Path(path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    sink = logging.FileHandler(file_path, encoding="utf-8")
+    sink.setFormatter(JsonLinesFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, sink)
+    listener.start()
+    _jsonl_listeners[name] = listener
+    atexit.register(shutdown_logging)
+    return logger
+
+
+def dropped_records() -> int:
+    """Cantidad de registros descartados por cola llena"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -1,20 +1,30 @@
 """
 Cliente de Supabase para manejar datos de nutrición del usuario
 """
+import asyncio
 import os
-from typing import Optional, List, Dict, Any
+import uuid
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple
 from datetime import datetime
-from supabase import create_client, Client
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+
+from cache import content_key, get_cache, register_model
+from server_timing import timing_stage, STAGE_SUPABASE
+from structured_logging import get_logger
+
+if TYPE_CHECKING:  # supabase-py se importa al crear el cliente (arranque en frío)
+    from supabase import Client
+
+log = get_logger("supabase")
 
 # Cargar variables de ambiente
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_NUTRITION_URL")
 SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_NUTRITION_ANON_KEY")
 
 # Crear cliente de Supabase
-supabase_client: Optional[Client] = None
+supabase_client: Optional["Client"] = None
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     """
     Obtiene o crea el cliente de Supabase
     """
@@ -25,10 +35,40 @@ def get_supabase_client() -> Client:
                 "Missing Supabase credentials. Check NEXT_PUBLIC_SUPABASE_NUTRITION_URL "
                 "and NEXT_PUBLIC_SUPABASE_NUTRITION_ANON_KEY in .env"
             )
+        from supabase import create_client
+
         supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
     return supabase_client
 
 
+def _execute(query):
+    """
+    Ejecuta una query de Supabase midiendo su duración (etapa "supabase" de Server-Timing)
+    """
+    with timing_stage(STAGE_SUPABASE):
+        return query.execute()
+
+
+async def _execute_async(query):
+    """
+    _execute en un hilo: la query no bloquea el event loop mientras espera a PostgREST
+    """
+    return await asyncio.to_thread(_execute, query)
+
+
+def prime_connection():
+    """
+    Query mínima (una fila de user_metrics) para abrir la conexión keep-alive
+    con PostgREST antes del primer request real (warm-up)
+    """
+    _execute(get_supabase_client().table("user_metrics").select("id").limit(1))
+
+
+# Columnas de las páginas de historial (sin select("*"): payload y parseo acotados)
+DAILY_NUTRITION_PAGE_COLUMNS = "id,date,calories,protein,carbs,fat"
+CONVERSATION_PAGE_COLUMNS = "id,message_type,content,created_at"
+
+
 # ===== Modelos Pydantic para las respuestas =====
 
 class UserMetrics(BaseModel):
@@ -68,17 +108,89 @@ class ConversationMessage(BaseModel):
     created_at: str
 
 
+class ConversationSummary(BaseModel):
+    """Resumen acumulado de los mensajes que ya salieron de la ventana de memoria del chat"""
+    user_id: str
+    summary: str
+    covered_until: str  # Cursor "created_at|id" del último mensaje resumido (solo created_at en resúmenes viejos)
+    messages_summarized: int = 0
+    updated_at: Optional[str] = None
+
+
 class UserNutritionProfile(BaseModel):
     """Perfil completo de nutrición del usuario"""
     metrics: UserMetrics
     daily_nutrition: List[DailyNutrition]
 
 
+# ===== Decodificación de filas =====
+# - Listas: TypeAdapter precompilado (una sola llamada a pydantic-core por lista,
+#   sin desempaquetar kwargs fila por fila)
+# - Filas que retorna una escritura propia (insert/upsert con el payload que armamos):
+#   model_construct, sin volver a validar lo que acabamos de escribir
+
+_DAILY_NUTRITION_LIST = TypeAdapter(List[DailyNutrition])
+_CONVERSATION_LIST = TypeAdapter(List[ConversationMessage])
+
+# ===== Lecturas cacheadas =====
+# - get_user_metrics, get_daily_nutrition y get_today_nutrition pasan por caches con
+#   stale-while-revalidate (TTL_BY_NAME / STALE_BY_NAME en CacheConfig)
+# - Las escrituras de este servicio invalidan lo que tocan; las de otros servicios llegan
+#   por el change feed (src/change_feed.py) o, sin él, se ven al vencer el TTL
+# - Los valores cacheados se comparten: no modificarlos (model_copy)
+register_model(UserMetrics, DailyNutrition)  # Para que viajen por el L2 (JSON)
+
+# Días recientes que se cachean por usuario: 30 (perfil, historial) + 1 para saber si hay más
+DAILY_NUTRITION_CACHE_ROWS = 31
+_DAILY_NUTRITION_PAGE_FIELDS = set(DAILY_NUTRITION_PAGE_COLUMNS.split(","))
+
+# Parte de cada clave de usuario. Al vaciar los caches se reemplaza por uno aleatorio: las
+# entradas anteriores (también las de L2, que otros procesos comparten) no se vuelven a leer.
+# Sin change feed nunca cambia y los workers comparten L2; con feed cada suscripción tiene
+# el suyo (un proceso no reusa filas que otro cacheó mientras este no recibía eventos)
+_user_cache_epoch = "0"
+
+
+def _user_key(*parts: Any) -> str:
+    return content_key(_user_cache_epoch, *parts)
+
+
+async def invalidate_user_metrics(user_id: str):
+    await get_cache("user_metrics").adelete(_user_key(user_id))
+
+
+async def invalidate_daily_nutrition(user_id: str, date: str):
+    """Olvida los días recientes del usuario y el registro de `date`"""
+    await get_cache("daily_nutrition").adelete(_user_key(user_id))
+    await get_cache("today_nutrition").adelete(_user_key(user_id, date))
+
+
+async def cache_user_metrics(metrics: UserMetrics):
+    """Reemplaza las métricas cacheadas por una fila conocida (evento del change feed)"""
+    await get_cache("user_metrics").aset_fresh(_user_key(metrics.user_id), metrics)
+
+
+async def cache_today_nutrition(record: DailyNutrition):
+    """Reemplaza el registro del día cacheado por una fila conocida (evento del change feed)"""
+    await get_cache("today_nutrition").aset_fresh(_user_key(record.user_id, record.date), record)
+
+
+USER_CACHE_NAMES = ("user_metrics", "daily_nutrition", "today_nutrition")
+
+
+def clear_user_caches():
+    """Descarta todas las lecturas de usuario cacheadas (ej. eventos del change feed perdidos)"""
+    global _user_cache_epoch
+    _user_cache_epoch = uuid.uuid4().hex
+    for name in USER_CACHE_NAMES:
+        get_cache(name).clear_local()
+
+
 # ===== Funciones para interactuar con Supabase =====
 
 async def get_user_metrics(user_id: str) -> Optional[UserMetrics]:
     """
-    Obtiene las métricas del usuario desde la tabla user_metrics
+    Obtiene las métricas del usuario desde la tabla user_metrics (cacheadas)
     
     Args:
         user_id: UUID del usuario
@@ -86,15 +198,17 @@ async def get_user_metrics(user_id: str) -> Optional[UserMetrics]:
     Returns:
         UserMetrics o None si no existe
     """
-    try:
+    async def fetch() -> Optional[UserMetrics]:
         client = get_supabase_client()
-        response = client.table("user_metrics").select("*").eq("user_id", user_id).execute()
-        
+        response = await _execute_async(client.table("user_metrics").select("*").eq("user_id", user_id))
         if response.data and len(response.data) > 0:
-            return UserMetrics(**response.data[0])
+            return UserMetrics.model_validate(response.data[0])
         return None
+
+    try:
+        return await get_cache("user_metrics").get_or_revalidate(_user_key(user_id), fetch)
     except Exception as e:
-        print(f"[ERROR] get_user_metrics: {str(e)}")
+        log.error("get_user_metrics falló", extra={"error": str(e)})
         raise Exception(f"Error fetching user metrics: {str(e)}")
 
 
@@ -104,31 +218,143 @@ async def get_daily_nutrition(user_id: str, limit: int = 30) -> List[DailyNutrit
     
     Args:
         user_id: UUID del usuario
-        limit: Número máximo de registros (últimos N días)
+        limit: Número máximo de registros (últimos N días). Hasta
+            DAILY_NUTRITION_CACHE_ROWS se sirven del cache
     
     Returns:
         Lista de DailyNutrition
     """
-    try:
+    async def fetch(rows: int) -> List[DailyNutrition]:
         client = get_supabase_client()
-        response = (
+        response = await _execute_async(
             client.table("daily_nutrition")
             .select("*")
             .eq("user_id", user_id)
             .order("date", desc=True)
-            .limit(limit)
-            .execute()
+            .limit(rows)
         )
-        
-        return [DailyNutrition(**record) for record in response.data]
+        return _DAILY_NUTRITION_LIST.validate_python(response.data)
+
+    try:
+        if limit > DAILY_NUTRITION_CACHE_ROWS:
+            return await fetch(limit)
+        records = await get_cache("daily_nutrition").get_or_revalidate(
+            _user_key(user_id), lambda: fetch(DAILY_NUTRITION_CACHE_ROWS)
+        )
+        return records[:limit]
     except Exception as e:
-        print(f"[ERROR] get_daily_nutrition: {str(e)}")
+        log.error("get_daily_nutrition falló", extra={"error": str(e)})
+        raise Exception(f"Error fetching daily nutrition: {str(e)}")
+
+
+CURSOR_SEPARATOR = "|"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, Optional[str]]:
+    """Cursor "valor|id" (o solo "valor", cursores viejos) → (valor, id o None)"""
+    value, _, row_id = cursor.partition(CURSOR_SEPARATOR)
+    return value, row_id or None
+
+
+def page_cursor(row: Dict[str, Any], column: str, tiebreaker: Optional[str] = None) -> str:
+    """Cursor que apunta a `row` (next_cursor de las páginas)"""
+    return f"{row[column]}{CURSOR_SEPARATOR}{row[tiebreaker]}" if tiebreaker else str(row[column])
+
+
+def message_cursor(message: ConversationMessage) -> str:
+    """Cursor "created_at|id" que apunta a `message` (covered_until, límite de la ventana)"""
+    return page_cursor({"created_at": message.created_at, "id": message.id}, "created_at", "id")
+
+
+def _cursor_filter(query, column: str, bounds: List[Tuple[str, Optional[str]]], tiebreaker: Optional[str] = None):
+    """
+    Filtra por cursores: bounds [("lt" | "gt", cursor o None)]. Con `tiebreaker`, un
+    cursor "valor|id" compara (column, tiebreaker); un cursor sin id, solo column
+    """
+    conditions = []
+    for op, cursor in bounds:
+        if not cursor:
+            continue
+        value, row_id = parse_cursor(cursor)
+        if tiebreaker and row_id:
+            # Valores entre comillas: los timestamps tienen ':' y '.', reservados en or=(...)
+            conditions.append(f'{column}.{op}."{value}",and({column}.eq."{value}",{tiebreaker}.{op}."{row_id}")')
+        else:
+            query = query.lt(column, value) if op == "lt" else query.gt(column, value)
+    if len(conditions) == 1:
+        query = query.or_(conditions[0])
+    elif conditions:
+        query = query.or_(f"and({','.join(f'or({c})' for c in conditions)})")
+    return query
+
+
+async def _keyset_page(
+    table: str,
+    columns: str,
+    user_id: str,
+    column: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    tiebreaker: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Página por cursor sobre `column` (índice user_id, column): filas antes del cursor
+    `before` (descendente, default) o después de `after` (ascendente). Si `column` se
+    repite, `tiebreaker` (ej. id) desempata: cursor compuesto "valor|id" y orden
+    (column, tiebreaker), así ninguna fila con el mismo valor se salta ni se repite.
+    Pide limit + 1 filas para saber si hay más sin otra query. Retorna (filas en el
+    orden de la query, hay_más)
+    """
+    client = get_supabase_client()
+    query = client.table(table).select(columns).eq("user_id", user_id)
+    cursor, desc = (after, False) if after else (before, True)
+    query = _cursor_filter(query, column, [("lt" if desc else "gt", cursor)], tiebreaker)
+    query = query.order(column, desc=desc)
+    if tiebreaker:
+        query = query.order(tiebreaker, desc=desc)
+    response = await _execute_async(query.limit(limit + 1))
+    rows = response.data or []
+    return rows[:limit], len(rows) > limit
+
+
+async def get_daily_nutrition_page(
+    user_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Página del historial de nutrición diaria (cursor por fecha)
+    
+    Args:
+        user_id: UUID del usuario
+        limit: Tamaño de página
+        before: Días anteriores a esta fecha (YYYY-MM-DD); sin cursores, los más recientes
+        after: Días posteriores a esta fecha
+    
+    Returns:
+        Tupla (registros del más reciente al más antiguo, hay_más en esa dirección)
+    """
+    if not before and not after and limit < DAILY_NUTRITION_CACHE_ROWS:
+        # Primera página: sale de los días recientes cacheados
+        records = await get_daily_nutrition(user_id, limit + 1)
+        rows = [record.model_dump(include=_DAILY_NUTRITION_PAGE_FIELDS) for record in records[:limit]]
+        return rows, len(records) > limit
+    try:
+        # Sin desempate: la fecha es única por usuario (UNIQUE (user_id, date))
+        rows, has_more = await _keyset_page(
+            "daily_nutrition", DAILY_NUTRITION_PAGE_COLUMNS, user_id, "date", limit, before, after
+        )
+        return (rows[::-1] if after else rows), has_more
+    except Exception as e:
+        log.error("get_daily_nutrition_page falló", extra={"error": str(e)})
         raise Exception(f"Error fetching daily nutrition: {str(e)}")
 
 
 async def get_today_nutrition(user_id: str, date: str) -> Optional[DailyNutrition]:
     """
-    Obtiene el registro de nutrición de un día específico
+    Obtiene el registro de nutrición de un día específico (cacheado)
     
     Args:
         user_id: UUID del usuario
@@ -137,21 +363,22 @@ async def get_today_nutrition(user_id: str, date: str) -> Optional[DailyNutritio
     Returns:
         DailyNutrition o None si no existe
     """
-    try:
+    async def fetch() -> Optional[DailyNutrition]:
         client = get_supabase_client()
-        response = (
+        response = await _execute_async(
             client.table("daily_nutrition")
             .select("*")
             .eq("user_id", user_id)
             .eq("date", date)
-            .execute()
         )
-        
         if response.data and len(response.data) > 0:
-            return DailyNutrition(**response.data[0])
+            return DailyNutrition.model_validate(response.data[0])
         return None
+
+    try:
+        return await get_cache("today_nutrition").get_or_revalidate(_user_key(user_id, date), fetch)
     except Exception as e:
-        print(f"[ERROR] get_today_nutrition: {str(e)}")
+        log.error("get_today_nutrition falló", extra={"error": str(e)})
         raise Exception(f"Error fetching today nutrition: {str(e)}")
 
 
@@ -164,7 +391,8 @@ async def create_or_update_daily_nutrition(
     fat: float,
 ) -> DailyNutrition:
     """
-    Crea o actualiza el registro de nutrición diaria
+    Crea o reemplaza el registro de nutrición diaria con totales absolutos
+    (un solo upsert sobre UNIQUE(user_id, date))
     
     Args:
         user_id: UUID del usuario
@@ -179,70 +407,158 @@ async def create_or_update_daily_nutrition(
     """
     try:
         client = get_supabase_client()
-        
-        # Verificar si existe el registro
-        existing = (
+        response = await _execute_async(
             client.table("daily_nutrition")
-            .select("*")
-            .eq("user_id", user_id)
-            .eq("date", date)
-            .execute()
-        )
-        
-        if existing.data and len(existing.data) > 0:
-            # Actualizar
-            response = (
-                client.table("daily_nutrition")
-                .update({
-                    "calories": calories,
-                    "protein": protein,
-                    "carbs": carbs,
-                    "fat": fat,
-                })
-                .eq("id", existing.data[0]["id"])
-                .execute()
-            )
-        else:
-            # Crear
-            response = (
-                client.table("daily_nutrition")
-                .insert({
+            .upsert(
+                {
                     "user_id": user_id,
                     "date": date,
                     "calories": calories,
                     "protein": protein,
                     "carbs": carbs,
                     "fat": fat,
-                })
-                .execute()
+                    "updated_at": datetime.utcnow().isoformat(),
+                },
+                on_conflict="user_id,date",
             )
+        )
         
+        await invalidate_daily_nutrition(user_id, date)
         if response.data and len(response.data) > 0:
-            return DailyNutrition(**response.data[0])
+            return DailyNutrition.model_construct(**response.data[0])
         else:
             raise Exception("Error creating/updating daily nutrition record")
     
     except Exception as e:
-        print(f"[ERROR] create_or_update_daily_nutrition: {str(e)}")
+        log.error("create_or_update_daily_nutrition falló", extra={"error": str(e)})
         raise Exception(f"Error saving daily nutrition: {str(e)}")
 
 
+async def add_to_daily_nutrition(
+    user_id: str,
+    date: str,
+    calories: float,
+    protein: float,
+    carbs: float,
+    fat: float,
+    token: Optional[str] = None,
+) -> DailyNutrition:
+    """
+    Suma los macros de una comida a los totales del día, de forma atómica: la
+    función SQL increment_daily_nutrition hace INSERT ... ON CONFLICT DO UPDATE
+    con calories = calories + excluded.calories (ver README). Una sola query y
+    registros concurrentes del mismo día no pisan sus sumas
+    
+    Args:
+        user_id: UUID del usuario
+        date: Fecha en formato YYYY-MM-DD
+        calories, protein, carbs, fat: Lo que se suma (no los totales)
+        token: Identifica el incremento; la función ignora un token ya aplicado,
+            así que reintentarlo tras un timeout no suma dos veces
+    
+    Returns:
+        DailyNutrition con los totales resultantes
+    """
+    try:
+        client = get_supabase_client()
+        response = await _execute_async(
+            client.rpc(
+                "increment_daily_nutrition",
+                {
+                    "p_user_id": user_id,
+                    "p_date": date,
+                    "p_calories": calories,
+                    "p_protein": protein,
+                    "p_carbs": carbs,
+                    "p_fat": fat,
+                    **({"p_token": token} if token is not None else {}),
+                },
+            )
+        )
+        await invalidate_daily_nutrition(user_id, date)
+        # La función retorna una fila: PostgREST la entrega como objeto (o lista de uno)
+        row = response.data[0] if isinstance(response.data, list) and response.data else response.data
+        if not row:
+            raise Exception("increment_daily_nutrition no retornó el registro")
+        return DailyNutrition.model_construct(**row)
+    
+    except Exception as e:
+        log.error("add_to_daily_nutrition falló", extra={"error": str(e)})
+        raise Exception(f"Error adding to daily nutrition: {str(e)}") from e
+
+
+# None: no se sabe todavía; False: la base no tiene la función (se usan las dos lecturas)
+_profile_rpc_available: Optional[bool] = None
+_profile_fetches: Dict[str, "asyncio.Task"] = {}  # Single-flight del RPC por usuario
+
+
+async def _fetch_profile_rpc(user_id: str) -> Tuple[Optional[UserMetrics], List[DailyNutrition]]:
+    """
+    Métricas + últimos DAILY_NUTRITION_CACHE_ROWS días en una sola query (función SQL
+    get_user_profile, ver README). Deja ambos resultados en sus caches, salvo el de un
+    cache invalidado mientras tanto (una escritura o el change feed trajo algo más nuevo)
+    """
+    key = _user_key(user_id)
+    metrics_cache, nutrition_cache = get_cache("user_metrics"), get_cache("daily_nutrition")
+    generations = (metrics_cache.generation, nutrition_cache.generation)
+    client = get_supabase_client()
+    response = await _execute_async(
+        client.rpc("get_user_profile", {"p_user_id": user_id, "p_days": DAILY_NUTRITION_CACHE_ROWS})
+    )
+    data = response.data[0] if isinstance(response.data, list) and response.data else response.data
+    data = data or {}
+    metrics = UserMetrics.model_validate(data["metrics"]) if data.get("metrics") else None
+    records = _DAILY_NUTRITION_LIST.validate_python(data.get("daily_nutrition") or [])
+    await metrics_cache.aset_fresh_if_unchanged(key, metrics, generations[0])
+    await nutrition_cache.aset_fresh_if_unchanged(key, records, generations[1])
+    return metrics, records
+
+
 async def get_user_profile(user_id: str) -> UserNutritionProfile:
     """
     Obtiene el perfil completo del usuario (métricas + últimos registros de nutrición)
     
+    Desde los caches si ya están; si no, en un solo round trip con la función SQL
+    get_user_profile. Sin esa función, las dos lecturas van en paralelo
+    
     Args:
         user_id: UUID del usuario
     
     Returns:
         UserNutritionProfile con métricas y nutrición diaria
     """
-    metrics = await get_user_metrics(user_id)
+    global _profile_rpc_available
+    key = _user_key(user_id)
+    cached = get_cache("user_metrics").contains(key) and get_cache("daily_nutrition").contains(key)
+
+    fetched = None
+    if not cached and _profile_rpc_available is not False:
+        task = _profile_fetches.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_fetch_profile_rpc(user_id))
+            _profile_fetches[key] = task
+            task.add_done_callback(lambda _: _profile_fetches.pop(key, None))
+        try:
+            fetched = await asyncio.shield(task)
+            _profile_rpc_available = True
+        except Exception as e:
+            if getattr(e, "code", None) in ("PGRST202", 404):  # La función no existe en la base
+                _profile_rpc_available = False
+                log.warning("get_user_profile: sin función SQL get_user_profile; lecturas en paralelo")
+            else:
+                log.error("get_user_profile (rpc) falló", extra={"error": str(e)})
+
+    if fetched is not None:
+        metrics, records = fetched
+        daily_nutrition = records[:30]
+    else:
+        metrics, daily_nutrition = await asyncio.gather(
+            get_user_metrics(user_id),
+            get_daily_nutrition(user_id, limit=30),
+        )
     if not metrics:
         raise Exception(f"User with id {user_id} not found")
     
-    daily_nutrition = await get_daily_nutrition(user_id, limit=30)
-    
     return UserNutritionProfile(
         metrics=metrics,
         daily_nutrition=daily_nutrition,
@@ -271,7 +587,7 @@ async def save_conversation_message(
         client = get_supabase_client()
         timestamp = datetime.utcnow().isoformat()
         
-        response = (
+        response = await _execute_async(
             client.table("conversation_history")
             .insert({
                 "user_id": user_id,
@@ -279,51 +595,155 @@ async def save_conversation_message(
                 "content": content,
                 "timestamp": timestamp,
             })
-            .execute()
         )
         
         if response.data and len(response.data) > 0:
-            return ConversationMessage(**response.data[0])
+            return ConversationMessage.model_construct(**response.data[0])
         else:
             raise Exception("Error saving conversation message")
     
     except Exception as e:
-        print(f"[ERROR] save_conversation_message: {str(e)}")
+        log.error("save_conversation_message falló", extra={"error": str(e)})
         raise Exception(f"Error saving message: {str(e)}")
 
 
 async def get_conversation_history(
     user_id: str,
     limit: int = 50,
+    after: Optional[str] = None,
 ) -> List[ConversationMessage]:
     """
-    Obtiene el historial de conversación del usuario
+    Obtiene los mensajes más recientes del historial de conversación
     
     Args:
         user_id: UUID del usuario
-        limit: Número máximo de mensajes a retornar
+        limit: Número máximo de mensajes a retornar (los N más nuevos)
+        after: Cursor "created_at|id" (o solo created_at): solo mensajes posteriores
+            (ej. los no resumidos)
     
     Returns:
-        Lista de ConversationMessage ordenados por timestamp
+        Lista de ConversationMessage en orden cronológico
     """
     try:
         client = get_supabase_client()
-        response = (
-            client.table("conversation_history")
-            .select("*")
-            .eq("user_id", user_id)
-            .order("created_at", desc=False)
+        query = client.table("conversation_history").select("*").eq("user_id", user_id)
+        query = _cursor_filter(query, "created_at", [("gt", after)], tiebreaker="id")
+        # Keyset descendente (índice user_id, created_at): lee solo las N filas del final
+        response = await _execute_async(
+            query
+            .order("created_at", desc=True)
+            .order("id", desc=True)
             .limit(limit)
-            .execute()
         )
         
-        return [ConversationMessage(**record) for record in response.data]
+        return _CONVERSATION_LIST.validate_python(response.data[::-1])
     
     except Exception as e:
-        print(f"[ERROR] get_conversation_history: {str(e)}")
+        log.error("get_conversation_history falló", extra={"error": str(e)})
         raise Exception(f"Error fetching conversation history: {str(e)}")
 
 
+async def get_conversation_page(
+    user_id: str,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Página del historial de conversación (cursor por created_at + id: varios mensajes
+    pueden tener el mismo created_at, ej. pregunta y respuesta guardadas juntas)
+    
+    Args:
+        user_id: UUID del usuario
+        limit: Tamaño de página
+        before: Cursor "created_at|id" (o solo created_at): mensajes anteriores; sin
+            cursores, los más recientes
+        after: Cursor de la misma forma: mensajes posteriores
+    
+    Returns:
+        Tupla (mensajes en orden cronológico, hay_más en esa dirección)
+    """
+    try:
+        rows, has_more = await _keyset_page(
+            "conversation_history", CONVERSATION_PAGE_COLUMNS, user_id, "created_at", limit, before, after,
+            tiebreaker="id",
+        )
+        return (rows if after else rows[::-1]), has_more
+    except Exception as e:
+        log.error("get_conversation_page falló", extra={"error": str(e)})
+        raise Exception(f"Error fetching conversation history: {str(e)}")
+
+
+async def get_conversation_range(
+    user_id: str,
+    after: Optional[str],
+    before: str,
+    limit: int,
+) -> List[ConversationMessage]:
+    """
+    Mensajes entre los cursores after y before ("created_at|id", sin incluirlos), del
+    más antiguo al más nuevo (los anteriores a la ventana que aún no están en el resumen)
+    """
+    try:
+        client = get_supabase_client()
+        query = client.table("conversation_history").select("*").eq("user_id", user_id)
+        query = _cursor_filter(query, "created_at", [("gt", after), ("lt", before)], tiebreaker="id")
+        response = await _execute_async(query.order("created_at").order("id").limit(limit))
+        return _CONVERSATION_LIST.validate_python(response.data)
+    except Exception as e:
+        log.error("get_conversation_range falló", extra={"error": str(e)})
+        raise Exception(f"Error fetching conversation range: {str(e)}")
+
+
+async def get_conversation_summary(user_id: str) -> Optional[ConversationSummary]:
+    """
+    Obtiene el resumen acumulado de la conversación (None si aún no hay)
+    """
+    try:
+        client = get_supabase_client()
+        response = await _execute_async(
+            client.table("conversation_summaries").select("*").eq("user_id", user_id).limit(1)
+        )
+        if response.data:
+            return ConversationSummary.model_validate(response.data[0])
+        return None
+    except Exception as e:
+        log.error("get_conversation_summary falló", extra={"error": str(e)})
+        raise Exception(f"Error fetching conversation summary: {str(e)}")
+
+
+async def save_conversation_summary(
+    user_id: str,
+    summary: str,
+    covered_until: str,
+    messages_summarized: int,
+) -> ConversationSummary:
+    """
+    Crea o reemplaza el resumen de la conversación (upsert por user_id)
+    """
+    try:
+        client = get_supabase_client()
+        response = await _execute_async(
+            client.table("conversation_summaries")
+            .upsert(
+                {
+                    "user_id": user_id,
+                    "summary": summary,
+                    "covered_until": covered_until,
+                    "messages_summarized": messages_summarized,
+                    "updated_at": datetime.utcnow().isoformat(),
+                },
+                on_conflict="user_id",
+            )
+        )
+        if response.data:
+            return ConversationSummary.model_construct(**response.data[0])
+        raise Exception("Error saving conversation summary")
+    except Exception as e:
+        log.error("save_conversation_summary falló", extra={"error": str(e)})
+        raise Exception(f"Error saving conversation summary: {str(e)}")
+
+
 async def clear_conversation_history(user_id: str) -> bool:
     """
     Limpia el historial de conversación de un usuario
@@ -336,8 +756,9 @@ async def clear_conversation_history(user_id: str) -> bool:
     """
     try:
         client = get_supabase_client()
-        client.table("conversation_history").delete().eq("user_id", user_id).execute()
+        await _execute_async(client.table("conversation_history").delete().eq("user_id", user_id))
+        await _execute_async(client.table("conversation_summaries").delete().eq("user_id", user_id))
         return True
     except Exception as e:
-        print(f"[ERROR] clear_conversation_history: {str(e)}")
+        log.error("clear_conversation_history falló", extra={"error": str(e)})
         raise Exception(f"Error clearing conversation history: {str(e)}")
@@ -0,0 +1,123 @@
+"""
+Grabación opcional de trazas de tráfico (anonimizadas) para replay de rendimiento
+- Se activa con TRACE_RECORD_PATH=<archivo.jsonl>; sin esa variable no hace nada
+- Registra la "forma" de cada request: endpoint, tamaños y MIME de archivos,
+  largo de la pregunta/mensaje, hash del usuario y tiempos entre llegadas
+- Nunca guarda contenido: usuarios y archivos se representan con hashes con clave
+  (TRACE_SALT), útiles para medir repeticiones (p. ej. la misma foto enviada dos veces)
+"""
+
+import hashlib
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import parse_qsl
+
+from structured_logging import get_jsonl_logger
+
+TRACE_RECORD_PATH = os.environ.get("TRACE_RECORD_PATH", "")
+TRACE_SALT = os.environ.get("TRACE_SALT", "nutriapp-trace").encode("utf-8")
+
+# Parámetros de query que se registran con su valor (el resto se omite)
+_RECORDED_QUERY_PARAMS = {"limit", "date", "before", "after"}
+
+_current_shape: ContextVar[Optional[Dict[str, Any]]] = ContextVar("trace_shape", default=None)
+
+
+def is_enabled() -> bool:
+    return bool(TRACE_RECORD_PATH)
+
+
+def anonymize(value: str) -> str:
+    """Hash con clave (no reversible sin TRACE_SALT) para IDs de usuario"""
+    return hashlib.blake2b(value.encode("utf-8"), key=TRACE_SALT[:64], digest_size=8).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    """Hash con clave del contenido de un archivo (detecta repeticiones sin guardar bytes)"""
+    return hashlib.blake2b(data, key=TRACE_SALT[:64], digest_size=8).hexdigest()
+
+
+def annotate_request(**fields: Any):
+    """Agrega campos a la traza del request actual (no-op si la grabación está apagada)"""
+    shape = _current_shape.get()
+    if shape is not None:
+        shape.update(fields)
+
+
+def annotate_user(user_id: str):
+    """Agrega el hash del usuario cuando no viene en el path (ej. un campo de formulario)"""
+    shape = _current_shape.get()
+    if shape is not None and user_id:
+        shape["user"] = anonymize(user_id)
+
+
+def annotate_files(media_files: Iterable[Any]):
+    """Agrega tamaño, MIME y hash de cada archivo subido a la traza del request actual"""
+    shape = _current_shape.get()
+    if shape is None:
+        return
+    shape["files"] = [
+        {
+            "size": f.size_bytes,
+            "mime": f.mime_type,
+            "hash": content_hash(f.data),
+        }
+        for f in media_files
+    ]
+
+
+class TraceRecorderMiddleware:
+    """
+    Middleware ASGI que escribe una línea JSON por request HTTP:
+    {"t": offset_s, "gap_ms": ..., "method", "endpoint", "user", "status", "latency_ms", ...}
+    La escritura usa la cola no bloqueante de structured_logging.
+    """
+
+    def __init__(self, app, path: str = ""):
+        self.app = app
+        self.writer = get_jsonl_logger("trace", path or TRACE_RECORD_PATH)
+        self.started = time.monotonic()
+        self.last_arrival: Optional[float] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        arrival = time.monotonic()
+        gap_ms = 0.0 if self.last_arrival is None else (arrival - self.last_arrival) * 1000
+        self.last_arrival = arrival
+        shape: Dict[str, Any] = {}
+        token = _current_shape.set(shape)
+        status = {"code": 0}
+
+        async def send_capturing_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_capturing_status)
+        finally:
+            _current_shape.reset(token)
+            route = scope.get("route")
+            path_params = scope.get("path_params") or {}
+            record = {
+                "t": round(arrival - self.started, 4),
+                "gap_ms": round(gap_ms, 1),
+                "method": scope.get("method"),
+                "endpoint": getattr(route, "path", None) or "<unmatched>",
+                "query": {
+                    k: v
+                    for k, v in parse_qsl((scope.get("query_string") or b"").decode("latin-1"))
+                    if k in _RECORDED_QUERY_PARAMS
+                },
+                "status": status["code"],
+                "latency_ms": round((time.monotonic() - arrival) * 1000, 1),
+                **shape,
+            }
+            if "user_id" in path_params:
+                record["user"] = anonymize(str(path_params["user_id"]))
+            self.writer.info(record)
@@ -0,0 +1,150 @@
+"""
+Warm-up de arranque (lifespan de FastAPI)
+- Compila el grafo LangGraph, crea los clientes de Gemini, LangChain y Supabase,
+  carga la tabla de alimentos y levanta los workers del pool de medios antes de aceptar tráfico, para que el primer usuario tras un scale-up no pague el setup
+- Con PRIME_BACKENDS envía un request mínimo a cada backend (abre conexiones keep-alive)
+- Ningún fallo es fatal: la app arranca igual y ese componente se crea en el primer uso
+"""
+
+import asyncio
+import importlib
+import time
+from typing import Any, Callable, Dict, Optional
+
+from orchestration.config import WarmupConfig, get_config
+from structured_logging import get_logger
+
+log = get_logger("warmup")
+
+# Resultado del último warm-up (lo expone GET /ready)
+_report: Optional[Dict[str, Any]] = None
+
+# SDKs que la app importa en el primer uso. Se importan antes y en un solo hilo:
+# importar los mismos paquetes desde varios hilos a la vez puede terminar en
+# _DeadlockError del import lock de Python.
+_SDK_MODULES = (
+    "langgraph.graph",
+    "langchain_core.messages",
+    "langchain_core.output_parsers",
+    "langchain_google_genai",
+    "supabase",
+    "numpy",
+)
+
+
+def _import_sdks():
+    from orchestration import graph
+
+    for name in _SDK_MODULES:
+        importlib.import_module(name)
+    graph._genai_sdk()
+    graph._part_type()
+
+
+def _warm_graph():
+    from orchestration.graph import get_orchestration_graph
+
+    get_orchestration_graph()
+
+
+def _warm_gemini(prime: bool):
+    from orchestration import graph
+
+    client = graph._get_gemini_client()
+    if prime and client is not None:
+        # Metadatos del modelo: no consume tokens pero abre la conexión HTTP
+        client.models.get(model=graph.DEFAULT_MODEL)
+
+
+def _warm_langchain():
+    from llm_client import get_chat_model
+    from orchestration import graph
+
+    if not graph.USING_NEW_SDK:
+        get_chat_model(temperature=0.0)  # /analyze-meal con el SDK viejo
+    get_chat_model(temperature=0.7)  # chatbot
+
+
+def _warm_food_table():
+    from food_composition import get_food_table
+
+    get_food_table()
+
+
+def _warm_media_pool():
+    from media import get_media_pool
+
+    get_media_pool().start()
+
+
+def _warm_supabase(prime: bool):
+    from supabase_client import get_supabase_client, prime_connection
+
+    get_supabase_client()
+    if prime:
+        prime_connection()
+
+
+async def _run_step(name: str, func: Callable[[], Any], steps: Dict[str, Any]):
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(func)
+        steps[name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        steps[name] = {
+            "ok": False,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "error": f"{type(e).__name__}: {e}",
+        }
+        log.warning("warm-up falló", extra={"step": name, "error": str(e)})
+
+
+async def warm_up(config: Optional[WarmupConfig] = None) -> Dict[str, Any]:
+    """
+    Importa los SDKs y luego ejecuta los pasos en paralelo (cada uno en un hilo),
+    todo con un tiempo máximo.
+    Retorna el reporte {"ready", "ms", "timed_out", "steps": {nombre: {ok, ms, error?}}}.
+    """
+    global _report
+    config = config or get_config().warmup
+    started = time.perf_counter()
+    steps: Dict[str, Any] = {}
+    timed_out = False
+
+    if config.ENABLED:
+        prime = config.PRIME_BACKENDS
+
+        async def run_all():
+            await _run_step("imports", _import_sdks, steps)
+            await asyncio.gather(
+                _run_step("graph", _warm_graph, steps),
+                _run_step("gemini", lambda: _warm_gemini(prime), steps),
+                _run_step("langchain", _warm_langchain, steps),
+                _run_step("supabase", lambda: _warm_supabase(prime), steps),
+                _run_step("media_pool", _warm_media_pool, steps),
+                _run_step("food_table", _warm_food_table, steps),
+            )
+
+        try:
+            await asyncio.wait_for(run_all(), timeout=config.TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Los hilos siguen en segundo plano; lo pendiente se completa en el primer uso
+            timed_out = True
+            log.warning("warm-up excedió el tiempo máximo", extra={"timeout_s": config.TIMEOUT_SECONDS})
+
+    _report = {
+        "ready": True,
+        "enabled": config.ENABLED,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+        "timed_out": timed_out,
+        "steps": steps,
+    }
+    log.info("warm-up completo", extra={"ms": _report["ms"], "failed": [k for k, v in steps.items() if not v["ok"]]})
+    return _report
+
+
+def readiness() -> Dict[str, Any]:
+    """Estado de warm-up para el probe de readiness (ready=False hasta que termine)"""
+    if _report is None:
+        return {"ready": False, "steps": {}}
+    return _report
@@ -0,0 +1,55 @@
+"""
+Fixtures compartidas: src/ en sys.path, configuración fresca por test y un PostgREST
+falso en memoria (benchmarks/fakes.py) para probar sin servicios externos
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("GOOGLE_API_KEY", "fake")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Configuración de development con cache en memoria (sin L2) y SQLite en tmp_path"""
+    import cache
+    import idempotency
+    from orchestration.config import OrchestrationConfig, set_config
+
+    config = OrchestrationConfig.for_environment("development")
+    config.cache.ENABLED = True
+    config.cache.BACKEND = "memory"
+    config.cache.SQLITE_PATH = str(tmp_path / "cache.sqlite3")
+    config.jobs.SQLITE_PATH = str(tmp_path / "jobs.sqlite3")
+    config.meal_log.SPOOL_PATH = str(tmp_path / "meal-log.sqlite3")
+    set_config(config)
+    cache.reset_caches()
+    idempotency.reset_idempotency_store()
+    yield config
+    cache.reset_caches()
+    idempotency.reset_idempotency_store()
+    set_config(None)
+
+
+@pytest.fixture
+def fake_supabase(config):
+    """FakePostgrest con 3 usuarios y 5 días, conectado a supabase_client"""
+    import supabase_client
+    from benchmarks.fakes import FAKE_SUPABASE_KEY, FakePostgrest, seed_rows
+
+    backend = FakePostgrest(tables=seed_rows(users=3, days=5, messages=4)).start()
+    saved = (supabase_client.SUPABASE_URL, supabase_client.SUPABASE_KEY, supabase_client.supabase_client)
+    supabase_client.SUPABASE_URL = backend.url
+    supabase_client.SUPABASE_KEY = FAKE_SUPABASE_KEY
+    supabase_client.supabase_client = None
+    yield backend
+    supabase_client.SUPABASE_URL, supabase_client.SUPABASE_KEY, supabase_client.supabase_client = saved
+    backend.stop()
@@ -0,0 +1,68 @@
+"""
+wav_downmix (src/media/audio.py), la alternativa sin ffmpeg: mezcla de canales,
+remuestreo, WAV de 8 bits (sin signo) y recorte de silencio con margen
+"""
+
+import io
+import struct
+import wave
+
+import pytest
+
+from media import audio
+
+RATE = 16000
+SILENCE_DB = -45.0
+
+
+def make_wav(frames: bytes, channels: int, width: int, rate: int) -> memoryview:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(width)
+        writer.setframerate(rate)
+        writer.writeframes(frames)
+    return memoryview(out.getvalue())
+
+
+def read_wav(data: bytes):
+    with wave.open(io.BytesIO(data), "rb") as reader:
+        params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+        frames = reader.readframes(reader.getnframes())
+    return params, struct.unpack(f"<{len(frames) // 2}h", frames)
+
+
+def test_stereo_is_averaged_and_resampled():
+    # 1 s a 44.1 kHz: izquierda 10000, derecha 2000
+    frames = struct.pack("<hh", 10000, 2000) * 44100
+    params, samples = read_wav(audio.wav_downmix(make_wav(frames, 2, 2, 44100), RATE, SILENCE_DB))
+    assert params == (1, 2, RATE)
+    assert len(samples) == RATE
+    assert set(samples) == {6000}
+
+
+def test_8_bit_unsigned_samples():
+    # 128 es el cero del PCM de 8 bits; 192 → +64 → 16384 en 16 bits
+    frames = bytes([128]) * 8000 + bytes([192, 64]) * 4000 + bytes([128]) * 8000
+    params, samples = read_wav(audio.wav_downmix(make_wav(frames, 1, 1, RATE), RATE, SILENCE_DB))
+    assert params == (1, 2, RATE)
+    assert max(samples) == 16384 and min(samples) == -16384
+
+
+def test_silence_at_both_ends_is_trimmed_with_padding():
+    voice = struct.pack("<h", 8000) * (RATE // 2)
+    silence = bytes(2 * RATE)
+    _, samples = read_wav(audio.wav_downmix(make_wav(silence + voice + silence, 1, 2, RATE), RATE, SILENCE_DB))
+    padding = int(0.15 * RATE)
+    assert len(samples) == RATE // 2 + 2 * padding
+    assert samples[padding] == 8000 and samples[padding - 1] == 0
+
+
+def test_all_silence_is_kept():
+    _, samples = read_wav(audio.wav_downmix(make_wav(bytes(2 * RATE), 1, 2, RATE), RATE, SILENCE_DB))
+    assert len(samples) == RATE
+
+
+def test_24_bit_is_rejected():
+    with pytest.raises(ValueError, match="24 bits"):
+        audio.wav_downmix(make_wav(bytes(3 * 100), 1, 3, RATE), RATE, SILENCE_DB)
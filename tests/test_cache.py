@@ -0,0 +1,226 @@
+"""
+Cache de dos niveles (src/cache.py): L2 en JSON (nunca pickle), modelos registrados,
+single-flight que sobrevive a la cancelación de quien inició el cálculo, stale-while-
+revalidate con un solo refresco y escrituras async que no hacen I/O del L2 en el event loop
+"""
+
+import asyncio
+import builtins
+import pickle
+
+import pytest
+
+import cache
+from orchestration.config import CacheConfig
+from supabase_client import DailyNutrition, UserMetrics
+
+METRICS = UserMetrics(
+    id="m1", user_id="u1", weight=70.5, height=175.0, calorie_goal=2000.0, protein_goal=120.0,
+    carbs_goal=250.0, fat_goal=70.0, created_at="2026-01-01T08:00:00", updated_at="2026-01-01T08:00:00",
+)
+DAY = DailyNutrition(
+    id="d1", user_id="u1", date="2026-01-01", calories=1800.0, protein=90.0, carbs=200.0, fat=60.0,
+    created_at="2026-01-01T08:00:00", updated_at="2026-01-01T20:00:00",
+)
+
+
+@pytest.fixture
+def l2(tmp_path):
+    return cache.SQLiteStore(str(tmp_path / "l2.sqlite3"), 100)
+
+
+def worker(l2, name="test"):
+    """Un Cache con L1 vacío sobre el L2 compartido (otro worker)"""
+    return cache.Cache(name, ttl_seconds=60, max_entries=10, l2=l2)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        ["página 1", "", "página 3"],
+        "texto OCR",
+        {"a": [1, 2.5, True, None], "b": {"c": b"\x00\xff"}},
+        (1760000000.0, METRICS),
+        (1760000000.0, [DAY, DAY]),
+        (1760000000.0, None),
+    ],
+)
+def test_l2_round_trip(l2, value):
+    worker(l2).set("k", value)
+    assert worker(l2).get("k", "miss") == value
+
+
+def test_l2_never_unpickles(l2):
+    class Exploit:
+        def __reduce__(self):
+            return (exec, ("import builtins; builtins.pwned = True",))
+
+    l2.set("nutriapp:test:k", pickle.dumps(Exploit()), 60)
+    assert worker(l2).get("k", "miss") == "miss"
+    assert not hasattr(builtins, "pwned")
+
+
+def test_unregistered_types_stay_in_l1(l2):
+    class Unknown:
+        pass
+
+    value = Unknown()
+    first = worker(l2)
+    first.set("k", value)
+    assert first.get("k") is value
+    assert first.l2_errors == 1
+    assert worker(l2).get("k", "miss") == "miss"
+
+
+def test_unknown_model_in_l2_is_a_miss(l2):
+    l2.set("nutriapp:test:k", b'{"m": "Otro", "v": {}}', 60)
+    assert worker(l2).get("k", "miss") == "miss"
+
+
+def test_cancelled_first_caller_does_not_cancel_waiters():
+    shared = cache.Cache("test", ttl_seconds=60, max_entries=10)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "valor"
+
+    async def scenario():
+        first = asyncio.create_task(shared.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(shared.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await waiter, first.cancelled()
+
+    value, cancelled = asyncio.run(scenario())
+    assert (value, cancelled, calls) == ("valor", True, 1)
+    assert shared.get("k") == "valor"
+
+
+def test_async_writes_keep_l2_off_the_loop(l2):
+    import threading
+
+    class RecordingL2:
+        def __init__(self):
+            self.threads = []
+
+        def __getattr__(self, method):
+            def call(*args):
+                self.threads.append(threading.get_ident())
+                return getattr(l2, method)(*args)
+
+            return call
+
+    recording = RecordingL2()
+    shared = cache.Cache("test", ttl_seconds=60, max_entries=10, l2=recording)
+
+    async def scenario():
+        await shared.aset("a", 1)
+        await shared.aset_fresh("b", 2)
+        await shared.adelete("a")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(recording.threads) == 3 and loop_thread not in recording.threads
+    assert worker(l2).get("a", "miss") == "miss"
+    assert worker(l2).get("b")[1] == 2
+
+
+def test_set_fresh_if_unchanged_skips_values_read_before_an_invalidation():
+    shared = cache.Cache("test", ttl_seconds=60, max_entries=10)
+
+    async def scenario():
+        generation = shared.generation
+        await shared.adelete("k")  # Una escritura mientras se leía la fuente
+        stale = await shared.aset_fresh_if_unchanged("k", "viejo", generation)
+        fresh = await shared.aset_fresh_if_unchanged("k", "nuevo", shared.generation)
+        return stale, fresh
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert shared.get("k")[1] == "nuevo"
+
+
+def swr_cache():
+    """Fresco 50 ms y servible stale un minuto más"""
+    return cache.Cache("test", ttl_seconds=0.05, max_entries=10, stale_seconds=60)
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    shared = swr_cache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return f"v{calls}"
+
+    async def scenario():
+        first = await shared.get_or_revalidate("k", compute)
+        await asyncio.sleep(0.06)
+        stale = await asyncio.gather(*(shared.get_or_revalidate("k", compute) for _ in range(5)))
+        refreshing = dict(shared._refreshing)
+        await asyncio.gather(*refreshing.values())
+        return first, stale, refreshing, await shared.get_or_revalidate("k", compute)
+
+    first, stale, refreshing, refreshed = asyncio.run(scenario())
+    assert first == "v1" and stale == ["v1"] * 5  # Sin esperar al refresco
+    assert list(refreshing) == ["k"] and calls == 2  # Un solo refresco para las 5 lecturas
+    assert refreshed == "v2"
+    assert shared.stale_hits == 5 and shared._refreshing == {}
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    shared = swr_cache()
+    results = iter(["viejo", ConnectionError("fuente caída"), "nuevo"])
+
+    async def compute():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def read_after_refresh():
+        value = await shared.get_or_revalidate("k", compute)
+        await asyncio.gather(*shared._refreshing.values())
+        return value
+
+    async def scenario():
+        await shared.get_or_revalidate("k", compute)
+        await asyncio.sleep(0.06)
+        failed = await read_after_refresh()
+        retried = await read_after_refresh()  # Sigue stale: la siguiente lectura reintenta
+        return failed, retried, await shared.get_or_revalidate("k", compute)
+
+    assert asyncio.run(scenario()) == ("viejo", "viejo", "nuevo")
+    assert shared.refresh_errors == 1 and shared.stale_hits == 2
+
+
+def test_refresh_started_before_an_invalidation_is_not_stored():
+    shared = swr_cache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return f"v{calls}"
+
+    async def scenario():
+        await shared.get_or_revalidate("k", compute)
+        await asyncio.sleep(0.06)
+        await shared.get_or_revalidate("k", compute)  # Dispara el refresco (v2)
+        await asyncio.sleep(0.01)  # Ya está leyendo la fuente
+        await shared.aset_fresh("k", "escrito")  # Un evento llega mientras tanto
+        await asyncio.gather(*shared._refreshing.values())
+        return await shared.get_or_revalidate("k", compute)
+
+    assert asyncio.run(scenario()) == "escrito"
+
+
+def test_disabled_by_default():
+    assert CacheConfig().ENABLED is False
@@ -0,0 +1,130 @@
+"""
+Change feed local (src/change_feed.py) sobre el PostgREST falso: TTLs según la
+suscripción, actualización/invalidación por eventos (en orden) y descarte al reconectar
+"""
+
+import asyncio
+
+import pytest
+
+import change_feed
+import supabase_client
+from benchmarks.fakes import fake_user_id
+from cache import get_cache
+
+
+@pytest.fixture
+def feed(config, fake_supabase):
+    config.cache.BACKEND = "sqlite"  # L2 compartido como entre workers
+    return change_feed.LocalChangeFeed(config.change_feed)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_ttls_follow_subscription(feed, config):
+    async def scenario():
+        base = get_cache("user_metrics").ttl_seconds
+        await feed.start()
+        subscribed = {name: get_cache(name).ttl_seconds for name in supabase_client.USER_CACHE_NAMES}
+        await feed.stop()
+        return base, subscribed, get_cache("user_metrics").ttl_seconds
+
+    base, subscribed, after = run(scenario())
+    assert subscribed == {
+        name: config.change_feed.TTL_BY_NAME[name] for name in supabase_client.USER_CACHE_NAMES
+    }
+    assert after == base != subscribed["user_metrics"]
+
+
+def test_events_update_and_invalidate(feed, fake_supabase):
+    user_id = fake_user_id(0)
+    where = [("user_id", f"eq.{user_id}")]
+
+    async def scenario():
+        await feed.start()
+        fake_supabase.change_listeners.append(feed.publish)
+        await supabase_client.get_user_metrics(user_id)
+
+        await asyncio.to_thread(fake_supabase.update, "user_metrics", {"calorie_goal": 1234.0}, where)
+        await feed.drain()
+        before = fake_supabase.requests
+        updated = await supabase_client.get_user_metrics(user_id)
+        served_from_cache = fake_supabase.requests == before
+
+        await asyncio.to_thread(fake_supabase.delete, "user_metrics", where)
+        await feed.drain()
+        deleted = await supabase_client.get_user_metrics(user_id)
+        await feed.stop()
+        return updated, served_from_cache, deleted
+
+    updated, served_from_cache, deleted = run(scenario())
+    assert updated.calorie_goal == 1234.0
+    assert served_from_cache
+    assert deleted is None
+    assert feed.stats()["events"] == 2 and feed.stats()["errors"] == 0
+
+
+def test_events_apply_in_order_with_shared_l2(feed, fake_supabase):
+    user_id = fake_user_id(2)
+    row = dict(next(r for r in fake_supabase.tables["user_metrics"] if r["user_id"] == user_id))
+
+    async def scenario():
+        await feed.start()
+        for goal in (1000.0, 2000.0):
+            feed.publish("user_metrics", change_feed.UPDATE, {**row, "calorie_goal": goal}, row)
+        feed.publish("user_metrics", change_feed.DELETE, None, row)
+        feed.publish("user_metrics", change_feed.INSERT, {**row, "calorie_goal": 3000.0})
+        await feed.drain()
+        key = supabase_client._user_key(user_id)
+        cached = get_cache("user_metrics").get(key)
+        # Otro worker (L1 vacío) lee el L2 compartido: la última escritura es la del INSERT
+        get_cache("user_metrics").clear_local()
+        shared = get_cache("user_metrics").get(key)
+        await feed.stop()
+        return cached, shared
+
+    cached, shared = run(scenario())
+    assert cached[1].calorie_goal == 3000.0
+    assert shared[1].calorie_goal == 3000.0
+    assert feed.stats()["events"] == 4 and feed.stats()["errors"] == 0
+
+
+def test_reconnect_discards_entries_from_shared_l2(feed, fake_supabase):
+    user_id = fake_user_id(1)
+
+    async def scenario():
+        await feed.start()
+        first_epoch = supabase_client._user_cache_epoch
+        await supabase_client.get_user_metrics(user_id)
+        # Cambio que el feed no vio (desconectado): sin listener
+        await asyncio.to_thread(
+            fake_supabase.update, "user_metrics", {"calorie_goal": 4321.0}, [("user_id", f"eq.{user_id}")]
+        )
+        await feed.stop()
+        await feed.start()
+        second_epoch = supabase_client._user_cache_epoch
+        metrics = await supabase_client.get_user_metrics(user_id)
+        await feed.stop()
+        return first_epoch, second_epoch, metrics
+
+    first_epoch, second_epoch, metrics = run(scenario())
+    # Aleatoria por suscripción: otro proceso con el mismo L2 no llega a la misma época
+    assert first_epoch != second_epoch
+    assert "0" not in (first_epoch, second_epoch)
+    assert metrics.calorie_goal == 4321.0
+    assert feed.stats()["subscriptions"] == 2
+
+
+def test_unknown_rows_clear_everything(feed):
+    async def scenario():
+        await feed.start()
+        epoch = supabase_client._user_cache_epoch
+        feed.publish("daily_nutrition", change_feed.DELETE, None, {"id": "x"})  # sin REPLICA IDENTITY FULL
+        await feed.drain()
+        changed = supabase_client._user_cache_epoch != epoch
+        await feed.stop()
+        return changed
+
+    assert run(scenario())
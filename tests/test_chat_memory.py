@@ -0,0 +1,94 @@
+"""
+Memoria del chatbot (src/nutrition_chatbot.py): todo lo que el resumen no cubre va al
+prompt, el resumen se dispara al pasar ventana + umbral y covered_until es un cursor
+compuesto created_at|id (mensajes con el mismo created_at no se saltan)
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import nutrition_chatbot
+from benchmarks.fakes import fake_user_id
+
+USER_ID = fake_user_id(0)
+
+
+class FakeModel:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, messages):
+        self.prompts.append(messages)
+        return SimpleNamespace(content="Resumen: prefiere desayunos salados")
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(nutrition_chatbot, "get_chat_model", lambda **kwargs: fake)
+    return fake
+
+
+@pytest.fixture
+def messages(fake_supabase):
+    """10 mensajes en 4 instantes distintos (pregunta y respuesta con el mismo created_at)"""
+    fake_supabase.tables["conversation_history"] = [
+        {
+            "id": f"msg-{i:02d}",
+            "user_id": USER_ID,
+            "message_type": "user" if i % 2 == 0 else "assistant",
+            "content": f"Mensaje {i}",
+            "timestamp": f"2026-01-01T16:3{i // 3}:00+00:00",
+            "created_at": f"2026-01-01T16:3{i // 3}:00+00:00",
+        }
+        for i in range(10)
+    ]
+    return fake_supabase
+
+
+def memory(window: int, trigger: int):
+    async def scenario():
+        chatbot = nutrition_chatbot.NutritionChatbot(USER_ID)
+        history, summary = await chatbot._get_conversation_memory()
+        await asyncio.gather(*nutrition_chatbot._background_tasks)
+        return [m.content for m in history], summary
+
+    from orchestration.config import get_config
+
+    get_config().chat_memory.WINDOW_MESSAGES = window
+    get_config().chat_memory.SUMMARY_TRIGGER_MESSAGES = trigger
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "covered_until, expected",
+    [
+        pytest.param("2026-01-01T16:31:00+00:00|msg-03", range(4, 10), id="cursor-compuesto"),
+        pytest.param("2026-01-01T16:31:00+00:00", range(6, 10), id="cursor-viejo-solo-created_at"),
+    ],
+)
+def test_every_unsummarized_message_goes_to_the_prompt(messages, model, covered_until, expected):
+    messages.tables["conversation_summaries"] = [
+        {"user_id": USER_ID, "summary": "Resumen previo", "covered_until": covered_until, "messages_summarized": 4}
+    ]
+    history, summary = memory(window=2, trigger=10)
+    assert history == [f"Mensaje {i}" for i in expected]  # No solo los 2 de la ventana
+    assert summary.summary == "Resumen previo"
+    assert model.prompts == []  # Menos de ventana + umbral: no se resume
+
+
+def test_summary_trigger_covers_up_to_the_window(messages, model):
+    history, summary = memory(window=2, trigger=3)
+    assert summary is None
+    assert history == [f"Mensaje {i}" for i in range(5, 10)]
+
+    saved = messages.tables["conversation_summaries"][0]
+    assert saved["covered_until"] == "2026-01-01T16:32:00+00:00|msg-07"  # Hasta antes de la ventana
+    assert saved["messages_summarized"] == 8
+    assert "Mensaje 0" in model.prompts[0][0].content and "Mensaje 8" not in model.prompts[0][0].content
+
+    history, summary = memory(window=2, trigger=3)
+    assert history == ["Mensaje 8", "Mensaje 9"]
+    assert summary.summary == "Resumen: prefiere desayunos salados"
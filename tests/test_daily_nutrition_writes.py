@@ -0,0 +1,90 @@
+"""
+Escrituras de daily_nutrition (src/supabase_client.py): upsert de totales en una sola
+request y el RPC increment_daily_nutrition, que suma sin perder registros concurrentes
+y no repite un token ya aplicado
+"""
+
+import asyncio
+
+import pytest
+
+import supabase_client
+from benchmarks.fakes import fake_user_id
+
+USER_ID = fake_user_id(0)
+DAY = "2030-01-01"
+MEAL = {"calories": 500.0, "protein": 30.0, "carbs": 50.0, "fat": 20.0}
+
+
+def day_rows(backend):
+    return [r for r in backend.tables["daily_nutrition"] if r["user_id"] == USER_ID and r["date"] == DAY]
+
+
+@pytest.fixture
+def rpc_calls(fake_supabase):
+    """Parámetros con los que se llamó increment_daily_nutrition"""
+    calls = []
+    real = fake_supabase.rpc_handlers["increment_daily_nutrition"]
+
+    def spy(backend, params):
+        calls.append(dict(params))
+        return real(backend, params)
+
+    fake_supabase.rpc_handlers["increment_daily_nutrition"] = spy
+    return calls
+
+
+def test_upsert_replaces_totals_in_one_request(fake_supabase):
+    async def scenario():
+        await supabase_client.create_or_update_daily_nutrition(USER_ID, DAY, **MEAL)
+        before = fake_supabase.requests
+        row = await supabase_client.create_or_update_daily_nutrition(USER_ID, DAY, 800.0, 40.0, 90.0, 25.0)
+        return row, fake_supabase.requests - before
+
+    row, requests = asyncio.run(scenario())
+    assert requests == 1  # Sin el select previo
+    assert row.calories == 800.0
+    assert len(day_rows(fake_supabase)) == 1 and day_rows(fake_supabase)[0]["fat"] == 25.0
+
+
+def test_increment_payload_and_totals(fake_supabase, rpc_calls):
+    async def scenario():
+        await supabase_client.add_to_daily_nutrition(USER_ID, DAY, **MEAL)
+        return await supabase_client.add_to_daily_nutrition(USER_ID, DAY, 100.0, 5.0, 10.0, 2.5)
+
+    row = asyncio.run(scenario())
+    assert rpc_calls[0] == {
+        "p_user_id": USER_ID,
+        "p_date": DAY,
+        "p_calories": 500.0,
+        "p_protein": 30.0,
+        "p_carbs": 50.0,
+        "p_fat": 20.0,
+    }  # Sin token no se manda p_token
+    assert (row.calories, row.protein, row.carbs, row.fat) == (600.0, 35.0, 60.0, 22.5)
+    assert len(day_rows(fake_supabase)) == 1
+
+
+def test_repeated_token_is_added_once(fake_supabase, rpc_calls):
+    async def scenario():
+        first = await supabase_client.add_to_daily_nutrition(USER_ID, DAY, **MEAL, token="meal-1")
+        retry = await supabase_client.add_to_daily_nutrition(USER_ID, DAY, **MEAL, token="meal-1")
+        other = await supabase_client.add_to_daily_nutrition(USER_ID, DAY, **MEAL, token="meal-2")
+        return first, retry, other
+
+    first, retry, other = asyncio.run(scenario())
+    assert [call["p_token"] for call in rpc_calls] == ["meal-1", "meal-1", "meal-2"]
+    assert fake_supabase.increment_tokens == {"meal-1", "meal-2"}
+    assert first.calories == retry.calories == 500.0  # El reintento devuelve el día sin sumar
+    assert other.calories == 1000.0
+
+
+def test_concurrent_increments_do_not_lose_updates(fake_supabase):
+    async def scenario():
+        await asyncio.gather(
+            *(supabase_client.add_to_daily_nutrition(USER_ID, DAY, **MEAL, token=f"meal-{i}") for i in range(10))
+        )
+
+    asyncio.run(scenario())
+    assert day_rows(fake_supabase)[0]["calories"] == 5000.0
+    assert day_rows(fake_supabase)[0]["protein"] == 300.0
@@ -0,0 +1,130 @@
+"""
+Tabla local de composición (src/food_composition.py): búsqueda por nombre, platos
+compuestos ambiguos, totales de una comida y respaldo con la estimación del modelo
+"""
+
+import pytest
+
+from food_composition import FoodTable, normalize_name
+
+
+@pytest.fixture(scope="module")
+def table():
+    return FoodTable()
+
+
+def name_of(table, food):
+    index = table.lookup(food)
+    return table.names[index] if index is not None else None
+
+
+@pytest.mark.parametrize(
+    "food, expected",
+    [
+        ("arroz", "arroz blanco cocido"),
+        ("Arroz Blanco", "arroz blanco cocido"),
+        ("white rice", "arroz blanco cocido"),
+        ("frijoles negros", "frijoles cocidos"),
+        ("salmon", "salmón"),
+        ("arroz blanco con cilantro", "arroz blanco cocido"),  # Alias más específico contenido
+        ("pechuga de pollo a la plancha", "pechuga de pollo"),
+        ("helado de vainilla", "helado"),
+        ("pechuga de polo", "pechuga de pollo"),  # Error de tipeo
+        ("xyz", None),
+    ],
+)
+def test_lookup(table, food, expected):
+    assert name_of(table, food) == expected
+
+
+@pytest.mark.parametrize(
+    "dish",
+    ["helado de chocolate", "arroz con pollo", "batido de fresa", "pollo con papas", "galletas de avena"],
+)
+def test_composite_dishes_are_ambiguous(table, dish):
+    # Dos ingredientes igual de específicos: no se elige el primero de la tabla
+    assert table.lookup(dish) is None
+
+
+def test_normalize_name():
+    assert normalize_name("Frijoles Negros") == normalize_name("frijol negro")
+    assert normalize_name("Plátano") == "platano"
+
+
+def test_compute_totals_and_unmatched(table):
+    rice = table.values[table.lookup("arroz")]
+    chicken = table.values[table.lookup("pechuga de pollo")]
+    nutrients, matched = table.compute([("arroz", 150), ("pechuga de pollo", 100), ("arroz con pollo", 300)])
+
+    assert matched == ["arroz blanco cocido", "pechuga de pollo", None]
+    assert nutrients["calories"] == round(1.5 * rice[0] + chicken[0], 1)
+    assert nutrients["protein_g"] == round(1.5 * rice[1] + chicken[1], 1)
+
+
+def test_compute_empty_and_negative_grams(table):
+    nutrients, matched = table.compute([("arroz", -50)])
+    assert matched == ["arroz blanco cocido"]
+    assert all(value == 0 for value in nutrients.values())
+    assert table.compute([])[0]["calories"] == 0
+
+
+def test_lookup_cache_is_bounded():
+    table = FoodTable(lookup_cache_size=8)
+    for i in range(50):
+        table.lookup(f"plato inventado {i}")
+    assert table._resolve.cache_info().currsize == 8
+    assert name_of(table, "arroz") == "arroz blanco cocido"
+
+
+def test_unmatched_items_use_the_model_estimate():
+    from nutrition_api import estimate_from_items
+
+    mole = {"food": "mole", "grams": 60, "calories": 120, "protein_g": 3, "carbs_g": 10, "fat_g": 8}
+    estimate = estimate_from_items([{"food": "arroz", "grams": 100}, mole])
+    rice = estimate_from_items([{"food": "arroz", "grams": 100}])
+
+    assert not estimate.partial
+    assert [item["source"] for item in estimate.items] == ["table", "model"]
+    assert estimate.nutrients.calories == round(rice.nutrients.calories + 120, 1)
+    assert estimate.nutrients.fat_g == round(rice.nutrients.fat_g + 8, 1)
+
+
+def test_unmatched_items_without_estimate_are_partial():
+    from nutrition_api import estimate_from_items
+
+    estimate = estimate_from_items([{"food": "arroz con pollo", "grams": 300, "calories": 400}])
+    assert estimate.partial
+    assert estimate.items[0]["source"] is None
+    assert estimate.nutrients.calories == 0
+
+
+def test_partial_estimate_is_not_logged(config, monkeypatch):
+    import asyncio
+
+    import httpx
+
+    import nutrition_api
+
+    async def analyze(media_file):
+        return nutrition_api.estimate_from_items([{"food": "arroz con pollo", "grams": 300}])
+
+    added = []
+
+    class MealLog:
+        async def add(self, *args, **kwargs):
+            added.append(args)
+
+    monkeypatch.setattr(nutrition_api, "analyze_meal_direct", analyze)
+    monkeypatch.setattr(nutrition_api, "get_meal_log", MealLog)
+
+    async def post():
+        transport = httpx.ASGITransport(app=nutrition_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            files = {"file": ("comida.jpg", b"\xff\xd8\xff\xd9", "image/jpeg")}
+            data = {"log": "true", "user_id": "u1", "date": "2026-03-01"}
+            return await client.post("/analyze-meal", data=data, files=files)
+
+    body = asyncio.run(post()).json()
+    assert body["ok"] is False and body["metadata"]["partial"] is True
+    assert body["metadata"]["logged"] is None and body["metadata"]["log_skipped"]
+    assert added == []
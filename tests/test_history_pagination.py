@@ -0,0 +1,76 @@
+"""
+Paginación por cursor del historial de conversación: mensajes con el mismo created_at
+no se saltan ni se repiten entre páginas (cursor compuesto created_at|id)
+"""
+
+import asyncio
+
+import pytest
+
+import supabase_client
+from benchmarks.fakes import fake_user_id
+
+USER_ID = fake_user_id(0)
+
+
+@pytest.fixture
+def messages(fake_supabase):
+    """10 mensajes del usuario en 4 instantes distintos (pregunta y respuesta juntas)"""
+    rows = [
+        {
+            "id": f"msg-{i:02d}",
+            "user_id": USER_ID,
+            "message_type": "user" if i % 2 == 0 else "assistant",
+            "content": f"Mensaje {i}",
+            "created_at": f"2026-01-01T16:3{i // 3}:00+00:00",
+        }
+        for i in range(10)
+    ]
+    fake_supabase.tables["conversation_history"] = rows
+    return [row["id"] for row in rows]
+
+
+def walk(direction: str, limit: int):
+    async def scenario():
+        seen, cursor = [], None
+        while True:
+            page, has_more = await supabase_client.get_conversation_page(
+                USER_ID, limit, **({direction: cursor} if cursor else {})
+            )
+            seen.extend(row["id"] for row in page)
+            if not has_more:
+                return seen
+            edge = page[-1] if direction == "after" else page[0]
+            cursor = supabase_client.page_cursor(edge, "created_at", "id")
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_backwards_pages_cover_every_message_once(messages, limit):
+    seen = walk("before", limit)
+    assert sorted(seen) == messages
+    assert len(seen) == len(set(seen))
+
+
+def test_forward_pages_from_composite_cursor(messages):
+    async def scenario():
+        return await supabase_client.get_conversation_page(USER_ID, 3, after="2026-01-01T16:31:00+00:00|msg-03")
+
+    page, has_more = asyncio.run(scenario())
+    assert [row["id"] for row in page] == ["msg-04", "msg-05", "msg-06"]
+    assert has_more
+
+
+def test_plain_timestamp_cursor_still_accepted(messages):
+    async def scenario():
+        return await supabase_client.get_conversation_page(USER_ID, 10, before="2026-01-01T16:31:00+00:00")
+
+    page, has_more = asyncio.run(scenario())
+    assert [row["id"] for row in page] == ["msg-00", "msg-01", "msg-02"]
+    assert not has_more
+
+
+def test_parse_cursor():
+    assert supabase_client.parse_cursor("2026-01-01T16:30:00+00:00|msg-1") == ("2026-01-01T16:30:00+00:00", "msg-1")
+    assert supabase_client.parse_cursor("2026-01-01") == ("2026-01-01", None)
@@ -0,0 +1,112 @@
+"""
+Idempotency-Key (src/idempotency.py): repetición de respuestas con el cache apagado,
+reintentos concurrentes en el proceso y entre workers (lease renovado), cancelación
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+from cache import SQLiteStore
+from orchestration.config import IdempotencyConfig
+
+
+class Handler:
+    def __init__(self, delay: float = 0.0, body=None):
+        self.calls = 0
+        self.delay = delay
+        self.body = body or {"ok": True, "reply": "hola"}
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.body
+
+
+def replayed(response) -> bool:
+    return response.headers.get(idempotency.REPLAYED_HEADER) == "true"
+
+
+def test_replays_with_cache_disabled(config):
+    config.cache.ENABLED = False
+    handler = Handler()
+
+    async def scenario():
+        first = await idempotency.run_idempotent("k1", "/chat/u1", handler, "hola")
+        second = await idempotency.run_idempotent("k1", "/chat/u1", handler, "hola")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert handler.calls == 1
+    assert not replayed(first) and replayed(second)
+    assert first.body == second.body
+
+
+def test_concurrent_retry_waits_for_original(config):
+    handler = Handler(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(
+            idempotency.run_idempotent("k2", "/qa", handler, "pregunta"),
+            idempotency.run_idempotent("k2", "/qa", handler, "pregunta"),
+        )
+
+    first, second = asyncio.run(scenario())
+    assert handler.calls == 1
+    assert [replayed(first), replayed(second)] == [False, True]
+
+
+def test_cancelled_client_still_stores_response(config):
+    handler = Handler(delay=0.05)
+
+    async def scenario():
+        original = asyncio.create_task(idempotency.run_idempotent("k3", "/qa", handler, "pregunta"))
+        await asyncio.sleep(0.01)
+        original.cancel()  # El cliente cortó la conexión
+        retry = await idempotency.run_idempotent("k3", "/qa", handler, "pregunta")
+        return original.cancelled(), retry
+
+    cancelled, retry = asyncio.run(scenario())
+    assert cancelled
+    assert handler.calls == 1 and replayed(retry)
+
+
+def test_other_payload_and_unstored_errors(config):
+    failing = Handler(body={"answer": "Error al generar respuesta: timeout"})
+
+    async def scenario():
+        await idempotency.run_idempotent("k4", "/qa", Handler(), "pregunta")
+        with pytest.raises(HTTPException) as conflict:
+            await idempotency.run_idempotent("k4", "/qa", Handler(), "otra pregunta")
+        for _ in range(2):
+            await idempotency.run_idempotent(
+                "k5", "/qa", failing, "pregunta", should_store=lambda body: not body["answer"].startswith("Error")
+            )
+        return conflict.value
+
+    conflict = asyncio.run(scenario())
+    assert conflict.status_code == 422
+    assert failing.calls == 2
+
+
+def test_other_worker_gets_409_while_lease_is_renewed(tmp_path):
+    config = IdempotencyConfig(LEASE_SECONDS=0.3)
+    path = str(tmp_path / "l2.sqlite3")
+    worker_a = idempotency.IdempotencyStore(config, SQLiteStore(path, 100))
+    worker_b = idempotency.IdempotencyStore(config, SQLiteStore(path, 100))
+    handler = Handler(delay=0.6)  # Más que el lease: sigue tomado porque se renueva
+
+    async def scenario():
+        original = asyncio.create_task(worker_a.run("k", "fp", handler))
+        await asyncio.sleep(0.45)
+        during = await worker_b.run("k", "fp", handler)
+        await original
+        after = await worker_b.run("k", "fp", handler)
+        return during, after
+
+    (during, _), (after, entry) = asyncio.run(scenario())
+    assert during == idempotency.IN_PROGRESS
+    assert after == idempotency.REPLAYED and entry["body"] == handler.body
+    assert handler.calls == 1
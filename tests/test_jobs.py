@@ -0,0 +1,154 @@
+"""
+Jobs de /qa (src/jobs.py): stores, back-pressure, firma del webhook, jobs interrumpidos
+y validación de webhook_url (SSRF)
+"""
+
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+import pytest
+
+import jobs
+from orchestration.config import JobsConfig
+
+
+def make_job(job_id: str, status: str = jobs.QUEUED, ttl: float = 60.0, **extra):
+    return {"job_id": job_id, "status": status, "expires_at": time.time() + ttl, "owner_pid": os.getpid(), **extra}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return jobs.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    return jobs.MemoryJobStore()
+
+
+def test_store_round_trip_and_expiry(store):
+    store.put(make_job("a", result={"answer": "ok"}))
+    store.put(make_job("old", ttl=-1))
+    assert store.get("a")["result"] == {"answer": "ok"}
+    assert store.get("old") is None
+    store.purge_expired()
+    assert store.get("missing") is None
+
+
+def test_fail_unfinished_only_touches_dead_owners(tmp_path):
+    store = jobs.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    store.put(make_job("mine", jobs.RUNNING))  # Este proceso reinició: ya no lo ejecuta nadie
+    store.put(make_job("dead", jobs.QUEUED, owner_pid=2 ** 22 + 1))
+    store.put(make_job("live", jobs.RUNNING, owner_pid=os.getppid()))
+    store.put(make_job("done", jobs.SUCCEEDED))
+
+    assert store.fail_unfinished("reinicio") == 2
+    assert store.get("mine")["status"] == store.get("dead")["status"] == jobs.FAILED
+    assert store.get("mine")["error"] == "reinicio"
+    assert store.get("live")["status"] == jobs.RUNNING
+    assert store.get("done")["status"] == jobs.SUCCEEDED
+    assert jobs.MemoryJobStore().fail_unfinished("reinicio") == 0
+
+
+def test_sign_payload_is_hmac_sha256():
+    body = b'{"job_id": "a"}'
+    expected = hmac.new(b"secreto", body, hashlib.sha256).hexdigest()
+    assert jobs.sign_payload(body, "secreto") == f"sha256={expected}"
+
+
+def test_queue_full_rejects():
+    release = threading.Event()
+    manager = jobs.JobManager(JobsConfig(WORKERS=1, MAX_QUEUED=1))
+
+    async def scenario():
+        first = await manager.submit(lambda: release.wait(5))
+        while (await manager.get(first["job_id"]))["status"] != jobs.RUNNING:
+            await asyncio.sleep(0.01)
+        await manager.submit(lambda: "en espera")
+        with pytest.raises(jobs.JobQueueFull):
+            await manager.submit(lambda: "de más")
+        release.set()
+        await manager.stop()
+
+    asyncio.run(scenario())
+    assert manager.stats()["rejected"] == 1
+
+
+def test_failed_func_marks_job_failed():
+    manager = jobs.JobManager(JobsConfig(WORKERS=1))
+
+    def boom():
+        raise RuntimeError("Error al generar respuesta: timeout")
+
+    async def scenario():
+        job = await manager.submit(boom)
+        while (await manager.get(job["job_id"]))["status"] in (jobs.QUEUED, jobs.RUNNING):
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return await manager.get(job["job_id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == jobs.FAILED
+    assert job["result"] is None and "timeout" in job["error"]
+
+
+@pytest.mark.parametrize(
+    "url, allowed",
+    [
+        ("ftp://93.184.216.34/hook", ["93.184.216.34"]),
+        ("https://93.184.216.34/hook", []),  # sin allowlist no hay webhooks
+        ("https://otro.ejemplo.com/hook", ["api.ejemplo.com"]),
+        ("http://127.0.0.1:8000/hook", ["127.0.0.1"]),
+        ("http://169.254.169.254/latest/meta-data/", ["169.254.169.254"]),
+        ("http://10.0.0.5/hook", ["10.0.0.5"]),
+        ("http://[::1]/hook", ["::1"]),
+        ("http://[::ffff:192.168.1.1]/hook", ["::ffff:192.168.1.1"]),
+        ("http://localhost/hook", ["localhost"]),
+    ],
+)
+def test_webhook_url_rejected(url, allowed, monkeypatch):
+    monkeypatch.delenv("JOBS_WEBHOOK_ALLOWED_HOSTS", raising=False)
+    with pytest.raises(jobs.WebhookNotAllowed):
+        asyncio.run(jobs.check_webhook_url(url, JobsConfig(WEBHOOK_ALLOWED_HOSTS=allowed)))
+
+
+def test_webhook_url_allowed(monkeypatch):
+    monkeypatch.setenv("JOBS_WEBHOOK_ALLOWED_HOSTS", "93.184.216.34, .ejemplo.com")
+    asyncio.run(jobs.check_webhook_url("https://93.184.216.34/hook", JobsConfig()))
+
+
+@pytest.fixture
+def api(config, monkeypatch):
+    import httpx
+    import nutrition_api
+
+    manager = jobs.JobManager(config.jobs)
+    monkeypatch.setattr(nutrition_api, "get_job_manager", lambda: manager)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=nutrition_api.app), base_url="http://test")
+    return client, manager
+
+
+def post_job(client, **data):
+    files = {"files": ("notas.txt", b"100 g de avena", "text/plain")}
+    return asyncio.run(client.post("/qa/jobs", data={"question": "¿Cuántas calorías?", **data}, files=files))
+
+
+def test_api_queue_full_is_503(api, monkeypatch):
+    client, manager = api
+
+    async def full(*args, **kwargs):
+        raise jobs.JobQueueFull("cola de jobs llena")
+
+    monkeypatch.setattr(manager, "submit", full)
+    response = post_job(client)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_api_rejects_internal_webhook(api, monkeypatch):
+    client, manager = api
+    monkeypatch.setenv("JOBS_WEBHOOK_ALLOWED_HOSTS", "169.254.169.254")
+    response = post_job(client, webhook_url="http://169.254.169.254/latest/meta-data/")
+    assert response.status_code == 400
+    assert manager.submitted == 0
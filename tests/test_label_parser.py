@@ -0,0 +1,227 @@
+"""
+Parser de etiquetas nutricionales (src/media/label.py) y el fast path que responde
+con la tabla (_answer_from_labels en src/orchestration/graph.py): sin modelo si la
+pregunta es genérica, con una llamada solo de texto si es concreta
+"""
+
+import pytest
+
+from media import label
+from orchestration import graph
+from orchestration.graph import _answer_from_labels
+from orchestration.state import MediaFile, OrchestrationState
+
+LABEL_ES = """
+INFORMACIÓN NUTRICIONAL
+Valores medios por 100 g   por porción (30 g)
+Valor energético 1046 kJ / 250 kcal   314 kJ / 75 kcal
+Grasas 10 g   3 g
+de las cuales saturadas 2,5 g   0,8 g
+Hidratos de carbono 30 g   9 g
+de los cuales azúcares 12 g   3,6 g
+Fibra alimentaria 3 g   0,9 g
+Proteínas 10 g   3 g
+Sal 1,2 g   0,36 g
+"""
+
+LABEL_EN_US = """
+Nutrition Facts
+8 servings per container
+Serving size 2/3 cup (55g)
+Amount per serving
+Calories 230
+Calories from Fat 72
+Total Fat 8g 10%
+Saturated Fat 1g 5%
+Trans Fat 0g
+Sodium 160mg 7%
+Total Carbohydrate 37g 13%
+Dietary Fiber 4g 14%
+Total Sugars 12g
+Includes 10g Added Sugars 20%
+Protein 3g
+"""
+
+LABEL_EN_EU = """
+Nutrition information
+Typical values per 100g
+Energy 1046kJ 250kcal
+Fat 10g
+of which saturates 2.5g
+Carbohydrate 30g
+of which sugars 12g
+Fibre 3g
+Protein 10g
+Salt 1.2g
+"""
+
+PER_100G = {"calories": 250.0, "fat_g": 10.0, "carbs_g": 30.0, "sugar_g": 12.0, "fiber_g": 3.0, "protein_g": 10.0, "sodium_mg": 480.0}
+
+
+@pytest.mark.parametrize(
+    "text, basis, expected",
+    [
+        pytest.param(LABEL_ES, "100g", PER_100G, id="es-100g-y-porcion"),
+        pytest.param(LABEL_EN_EU, "100g", PER_100G, id="en-eu"),
+        pytest.param(
+            LABEL_EN_US,
+            "serving",
+            {"calories": 230.0, "fat_g": 8.0, "carbs_g": 37.0, "sugar_g": 12.0, "fiber_g": 4.0, "protein_g": 3.0, "sodium_mg": 160.0},
+            id="en-us-calories-from-fat",
+        ),
+        pytest.param(
+            "Per serving (30 g)   Per 100 g\nEnergy 314 kJ / 75 kcal   1046 kJ / 250 kcal\nFat 3 g   10 g\nProtein 3 g   10 g",
+            "serving",
+            {"calories": 75.0, "fat_g": 3.0, "protein_g": 3.0},
+            id="porcion-primera-columna",
+        ),
+        pytest.param(
+            "Por 100 g\nValor energético 1046 kJ\nGrasas 10 g",
+            "100g",
+            {"calories": 250.0, "fat_g": 10.0},
+            id="solo-kj",
+        ),
+        pytest.param(
+            "Por 100 g\nEnergía (kJ) 1046\nEnergía (kcal) 250\nGrasas 10 g",
+            "100g",
+            {"calories": 250.0, "fat_g": 10.0},
+            id="unidad-en-la-fila",
+        ),
+        pytest.param(
+            "Por 100 g\nValor energético 1.046 kJ / 250 kcal\nGrasas 3,5 g\nProteínas 0,5 g",
+            "100g",
+            {"calories": 250.0, "fat_g": 3.5, "protein_g": 0.5},
+            id="coma-decimal-y-miles",
+        ),
+        pytest.param("Energía 1.046 kJ", None, {"calories": 250.0}, id="miles-solo-kj"),
+        pytest.param(
+            "Por 1OO g\nEnergía 2OO kcal\nGrasas O,5 g\nHidratos de carbono 4O g\nProteínas lO g\nSodio 1OO mg",
+            "100g",
+            {"calories": 200.0, "fat_g": 0.5, "carbs_g": 40.0, "protein_g": 10.0, "sodium_mg": 100.0},
+            id="ocr-o-por-cero",
+        ),
+        pytest.param(
+            "Por 100 g\nSal 0,5 g",
+            "100g",
+            {"sodium_mg": 200.0},
+            id="sal-a-sodio",
+        ),
+        pytest.param(
+            "Por 100 g\nSodio 300 mg\nSal 0,75 g",
+            "100g",
+            {"sodium_mg": 300.0},
+            id="sodio-tiene-prioridad",
+        ),
+        pytest.param("Sodium 0.4 g", None, {"sodium_mg": 400.0}, id="sodio-en-gramos"),
+    ],
+)
+def test_parse_label(text, basis, expected):
+    parsed = label.parse_label(text)
+    assert parsed["basis"] == basis
+    assert parsed["nutrients"] == pytest.approx(expected, abs=0.1)
+
+
+@pytest.mark.parametrize(
+    "text, low, high",
+    [
+        pytest.param(LABEL_ES, 1.0, 1.0, id="completa-y-coherente"),
+        pytest.param("Grasas 10 g\nProteínas 10 g", 0.0, 0.34, id="pocos-campos"),
+        pytest.param(
+            "Energía 250 kcal\nGrasas 10 g\nHidratos de carbono 80 g\nAzúcares 12 g\nProteínas 10 g\nSodio 100 mg",
+            0.0, 0.5, id="no-cuadra-atwater",
+        ),
+        pytest.param(
+            "Energía 250 kcal\nGrasas 10 g\nHidratos de carbono 30 g\nAzúcares 45 g\nProteínas 10 g\nSodio 100 mg",
+            0.0, 0.5, id="mas-azucar-que-hidratos",
+        ),
+        pytest.param("Ingredientes: harina, azúcar", 0.0, 0.0, id="sin-tabla"),
+    ],
+)
+def test_confidence(text, low, high):
+    assert low <= label.parse_label(text)["confidence"] <= high
+
+
+def test_summary_text():
+    parsed = label.parse_label(LABEL_ES)
+    assert label.summary_text(parsed).startswith("Tabla nutricional leída por OCR (por 100 g): calories=250 kcal, fat_g=10 g")
+
+
+def label_file(text: str, action: str = "text") -> MediaFile:
+    parsed = label.parse_label(text)
+    info = {"kind": "label", "action": action, "confidence": parsed["confidence"], "basis": parsed["basis"]}
+    return MediaFile("etiqueta.jpg", "image/jpeg", b"", preprocessing={**info, "nutrients": parsed["nutrients"]})
+
+
+@pytest.mark.parametrize(
+    "files, language, answered",
+    [
+        pytest.param([label_file(LABEL_ES)], "es", True, id="etiqueta-confiable"),
+        pytest.param([label_file(LABEL_EN_EU), label_file(LABEL_ES)], "en", True, id="dos-etiquetas"),
+        pytest.param([label_file("Grasas 10 g\nProteínas 10 g")], "es", False, id="poco-confiable"),
+        pytest.param([label_file(LABEL_ES, action="raw")], "es", False, id="sin-texto"),
+        pytest.param([label_file(LABEL_ES), MediaFile("plato.jpg", "image/jpeg", b"")], "es", False, id="mezclado"),
+        pytest.param([], "es", False, id="sin-archivos"),
+    ],
+)
+def test_answer_from_labels(config, files, language, answered, monkeypatch):
+    monkeypatch.setattr(graph, "_generate_text", pytest.fail)  # Pregunta genérica: sin modelo
+    state = OrchestrationState(question="Analiza esta etiqueta", media_files=files, language=language)
+    assert _answer_from_labels(state) is answered
+    assert (state.fast_path == "label") is answered
+    if answered:
+        assert state.answer.count("| Grasas |" if language == "es" else "| Fat |") == len(files)
+        assert ("| Nivel |" if language == "es" else "| Level |") in state.answer  # Semáforo: base 100 g
+
+
+@pytest.mark.parametrize(
+    "question, generic",
+    [
+        ("", True),
+        ("¿Qué es esto?", True),
+        ("Analiza la etiqueta, por favor", True),
+        ("What does this label show?", True),
+        ("¿Es saludable?", False),
+        ("¿Cuántas calorías tiene una porción?", False),
+        ("Is it OK for a low sodium diet?", False),
+    ],
+)
+def test_is_generic_question(question, generic):
+    assert label.is_generic_question(question) is generic
+
+
+def test_specific_question_asks_the_model_with_text_only(config, monkeypatch):
+    calls = []
+
+    def fake_generate(state, parts, max_output_tokens):
+        calls.append((parts, max_output_tokens))
+        return "Tiene **sal moderada**: mejor con moderación en una dieta baja en sodio."
+
+    monkeypatch.setattr(graph, "_generate_text", fake_generate)
+    state = OrchestrationState(question="¿Sirve para una dieta baja en sodio?", media_files=[label_file(LABEL_ES)])
+    assert _answer_from_labels(state)
+
+    (parts, max_tokens), = calls
+    assert all(isinstance(part, str) for part in parts)  # Sin la imagen
+    assert any("sodium_mg=480 mg" in part for part in parts)
+    assert parts[-1] == "Pregunta del usuario: ¿Sirve para una dieta baja en sodio?"
+    assert max_tokens == config.preprocess.LABEL_ANSWER_MAX_TOKENS
+    assert state.answer.startswith("Tiene **sal moderada**")
+    assert "| Grasas |" in state.answer
+    assert state.fast_path == "label_text"
+
+
+def test_model_failure_still_answers_with_the_table(config, monkeypatch):
+    def down(*args):
+        raise ConnectionError("sin red")
+
+    monkeypatch.setattr(graph, "_generate_text", down)
+    state = OrchestrationState(question="¿Es saludable?", media_files=[label_file(LABEL_ES)])
+    assert _answer_from_labels(state)
+    assert state.answer.startswith("**Información nutricional leída de la etiqueta**")
+    assert state.fast_path == "label"
+
+
+def test_render_markdown_without_100g_basis_has_no_traffic_light():
+    markdown = label.render_markdown(label.parse_label(LABEL_EN_US), "en")
+    assert "(per serving)" in markdown
+    assert "| Level |" not in markdown
@@ -0,0 +1,217 @@
+"""
+Registro de comidas (src/meal_log.py): incrementos agrupados por día, reintentos con el
+mismo token (un timeout después del commit no suma dos veces) y con backoff, dead letter
+de lo que la base rechaza, spool al apagar y la fecha del cliente obligatoria en /analyze-meal
+"""
+
+import asyncio
+
+import pytest
+
+import meal_log
+from meal_log import MealLogAggregator, MealLogSpool
+
+USER = "user-meal-log"
+DAY = "2026-03-01"
+MEAL = {"calories": 500.0, "protein": 30.0, "carbs": 50.0, "fat": 20.0}
+
+
+def day_row(backend, user_id=USER, date=DAY):
+    return next((r for r in backend.tables["daily_nutrition"] if r["user_id"] == user_id and r["date"] == date), None)
+
+
+def test_meals_of_the_same_day_are_one_increment(fake_supabase, config):
+    aggregator = MealLogAggregator(config.meal_log)
+
+    async def scenario():
+        await aggregator.add(USER, DAY, **MEAL)
+        await aggregator.add(USER, DAY, **MEAL)
+        pending = aggregator.pending_totals(USER, DAY)
+        await aggregator.stop()
+        return pending
+
+    pending = asyncio.run(scenario())
+    assert pending["calories"] == 1000.0
+    assert day_row(fake_supabase)["calories"] == 1000.0
+    assert aggregator.writes == 1 and aggregator.meals == 2
+
+
+def test_failure_after_commit_is_not_added_twice(fake_supabase, config, monkeypatch):
+    real = meal_log.add_to_daily_nutrition
+    calls = []
+
+    async def timeout_after_commit(*args, token=None):
+        calls.append(token)
+        await real(*args, token=token)
+        if len(calls) == 1:
+            raise TimeoutError("respuesta perdida")
+
+    monkeypatch.setattr(meal_log, "add_to_daily_nutrition", timeout_after_commit)
+    config.meal_log.RETRY_BACKOFF_SECONDS = 0.0  # El segundo flush ya lo reenvía
+    aggregator = MealLogAggregator(config.meal_log)
+
+    async def scenario():
+        await aggregator.add(USER, DAY, **MEAL)
+        await aggregator.flush()
+        retrying = aggregator.pending_totals(USER, DAY)
+        await aggregator.flush()
+        await aggregator.stop()
+        return retrying
+
+    retrying = asyncio.run(scenario())
+    assert retrying["calories"] == 500.0  # Se sigue mostrando mientras se reintenta
+    assert len(calls) == 2 and calls[0] == calls[1]
+    assert day_row(fake_supabase)["calories"] == 500.0
+    assert aggregator.pending_totals(USER, DAY) is None
+
+
+def test_unsent_increments_are_spooled_and_resent(fake_supabase, config, monkeypatch):
+    async def down(*args, token=None):
+        raise ConnectionError("Supabase caído")
+
+    first = MealLogAggregator(config.meal_log)
+    monkeypatch.setattr(meal_log, "add_to_daily_nutrition", down)
+
+    async def shutdown():
+        await first.add(USER, DAY, **MEAL)
+        await first.stop()
+
+    asyncio.run(shutdown())
+    assert first.spooled == 1 and day_row(fake_supabase) is None
+    monkeypatch.undo()
+
+    second = MealLogAggregator(config.meal_log)
+
+    async def restart():
+        await second.start()
+        assert second.pending_totals(USER, DAY)["calories"] == 500.0
+        await second.stop()
+
+    asyncio.run(restart())
+    assert second.restored == 1
+    assert day_row(fake_supabase)["calories"] == 500.0
+    assert MealLogSpool(config.meal_log.SPOOL_PATH).take() == {}
+
+
+class FakeAPIError(Exception):
+    """Como postgrest.APIError: el SQLSTATE o el status HTTP en `code`"""
+
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+def wrapped(error):
+    """Como lo relanza add_to_daily_nutrition"""
+    try:
+        raise error
+    except Exception as e:
+        try:
+            raise Exception(f"Error adding to daily nutrition: {e}") from e
+        except Exception as outer:
+            return outer
+
+
+@pytest.mark.parametrize(
+    "error, permanent",
+    [
+        (FakeAPIError("23503"), True),  # FK: el usuario no existe
+        (FakeAPIError("22P02"), True),  # Tipo inválido
+        (FakeAPIError("PGRST202"), True),
+        (FakeAPIError("400"), True),
+        (wrapped(FakeAPIError("23503")), True),
+        (FakeAPIError("PGRST001"), False),  # Base caída
+        (FakeAPIError("503"), False),
+        (FakeAPIError("429"), False),
+        (FakeAPIError("40001"), False),  # Conflicto de serialización
+        (TimeoutError("timeout"), False),
+        (wrapped(ConnectionError("reset")), False),
+    ],
+)
+def test_is_permanent_error(error, permanent):
+    assert meal_log.is_permanent_error(error) is permanent
+
+
+def test_rejected_increment_goes_to_dead_letter(fake_supabase, config, monkeypatch):
+    tokens = []
+
+    async def foreign_key_violation(*args, token=None):
+        tokens.append(token)
+        raise wrapped(FakeAPIError("23503"))
+
+    monkeypatch.setattr(meal_log, "add_to_daily_nutrition", foreign_key_violation)
+    config.meal_log.RETRY_BACKOFF_SECONDS = 0.0
+    aggregator = MealLogAggregator(config.meal_log)
+
+    async def scenario():
+        await aggregator.add(USER, DAY, **MEAL)
+        for _ in range(config.meal_log.MAX_PERMANENT_FAILURES + 1):
+            await aggregator.flush()
+        await aggregator.stop()
+
+    asyncio.run(scenario())
+    assert len(tokens) == config.meal_log.MAX_PERMANENT_FAILURES and len(set(tokens)) == 1
+    assert aggregator.pending_totals(USER, DAY) is None
+    assert aggregator.stats()["dead_lettered"] == 1 and aggregator.spooled == 0
+    (increment, error), = MealLogSpool(config.meal_log.SPOOL_PATH).dead_letters().values()
+    assert increment == ((USER, DAY), MEAL)
+    assert "23503" in error
+
+
+def test_transient_failures_back_off(fake_supabase, config, monkeypatch):
+    real = meal_log.add_to_daily_nutrition
+    calls = []
+
+    async def down_once(*args, token=None):
+        calls.append(token)
+        if len(calls) == 1:
+            raise ConnectionError("Supabase caído")
+        await real(*args, token=token)
+
+    monkeypatch.setattr(meal_log, "add_to_daily_nutrition", down_once)
+    config.meal_log.RETRY_BACKOFF_SECONDS = 60.0
+    aggregator = MealLogAggregator(config.meal_log)
+
+    async def scenario():
+        await aggregator.add(USER, DAY, **MEAL)
+        await aggregator.flush()
+        await aggregator.flush()  # Dentro del backoff: no se reenvía
+        waiting = len(calls), aggregator.pending_totals(USER, DAY)
+        await aggregator.stop()  # El último flush no espera el backoff
+        return waiting
+
+    (calls_during_backoff, pending) = asyncio.run(scenario())
+    assert calls_during_backoff == 1 and pending["calories"] == 500.0
+    assert len(calls) == 2 and calls[0] == calls[1]
+    assert day_row(fake_supabase)["calories"] == 500.0
+
+
+def test_spool_keeps_tokens(tmp_path):
+    spool = MealLogSpool(str(tmp_path / "spool.sqlite3"))
+    spool.save({"t1": ((USER, DAY), MEAL)})
+    assert spool.take() == {"t1": ((USER, DAY), MEAL)}
+    assert spool.take() == {}
+
+
+@pytest.mark.parametrize(
+    "form, detail",
+    [
+        ({"log": "true", "user_id": USER}, "requiere 'date'"),
+        ({"log": "true", "user_id": USER, "date": "01/03/2026"}, "YYYY-MM-DD"),
+        ({"log": "true", "date": DAY}, "requiere 'user_id'"),
+    ],
+)
+def test_analyze_meal_log_requires_client_date(config, form, detail):
+    import httpx
+
+    import nutrition_api
+
+    async def post():
+        transport = httpx.ASGITransport(app=nutrition_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            files = {"file": ("comida.jpg", b"\xff\xd8\xff\xd9", "image/jpeg")}
+            return await client.post("/analyze-meal", data=form, files=files)
+
+    response = asyncio.run(post())
+    assert response.status_code == 400
+    assert detail in response.json()["detail"]
@@ -0,0 +1,57 @@
+"""
+Pool de medios (src/media/pool.py): las esperas de run() por un lugar o un resultado no
+ocupan hilos del executor por defecto (Supabase y /qa siguen respondiendo) y la
+back-pressure responde MediaPoolBusy
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from media.pool import MediaPool, MediaPoolBusy
+from orchestration.config import MediaPoolConfig
+
+
+def slow_length(data, seconds):
+    time.sleep(seconds)
+    return len(data)
+
+
+@pytest.fixture
+def pool():
+    pool = MediaPool(MediaPoolConfig(WORKERS=1, MAX_PENDING=1, INLINE_THRESHOLD_BYTES=10, QUEUE_TIMEOUT_SECONDS=0.3))
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_saturated_pool_does_not_park_default_threads(pool):
+    async def scenario():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        uploads = [asyncio.create_task(pool.run(slow_length, b"x" * 100, 0.2)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await asyncio.to_thread(lambda: None)  # Lo que haría una query a Supabase
+        waited = time.perf_counter() - started
+        return waited, await asyncio.gather(*uploads, return_exceptions=True)
+
+    waited, results = asyncio.run(scenario())
+    assert waited < 0.1
+    assert results[0] == 100
+    assert any(isinstance(result, MediaPoolBusy) for result in results)
+    assert pool.rejected >= 1
+
+
+def test_inline_and_cancelled_runs_release_their_slot(pool):
+    async def scenario():
+        assert await pool.run(slow_length, b"chico", 0) == 5
+        task = asyncio.create_task(pool.run(slow_length, b"x" * 100, 0.1))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.sleep(0.3)  # El worker termina y el lugar se libera
+        return await pool.run(slow_length, b"y" * 50, 0)
+
+    assert asyncio.run(scenario()) == 50
+    assert pool.inline == 1
@@ -0,0 +1,66 @@
+"""
+Selección de páginas de PDFs (src/media/pdf.py): ranking BM25 por la pregunta, tope de
+páginas (PDF_TOP_PAGES) y de caracteres (PDF_MAX_CHARS), y PDFs escaneados sin texto
+"""
+
+import pytest
+
+from media import pdf
+
+FILLER = "Plan semanal de alimentación con indicaciones generales para el paciente. " * 4
+
+PAGES = [
+    "Introducción al plan. " + FILLER,
+    "Desayunos: avena con fruta, tostadas integrales y yogur natural. " + FILLER,
+    "Almuerzos: legumbres, arroz integral y verduras de temporada. " + FILLER,
+    "Cenas ligeras: sopa de verduras y pescado al horno. " + FILLER,
+    "Colaciones: frutos secos y fruta fresca. " + FILLER,
+    "Alergias: el paciente es alérgico al maní y a los frutos secos. " + FILLER,
+    "Hidratación: dos litros de agua al día. " + FILLER,
+]
+
+
+def test_rank_pages_prefers_the_page_that_matches():
+    scores = pdf.rank_pages("¿Qué alergias hay?", PAGES)
+    assert max(range(len(PAGES)), key=scores.__getitem__) == 5
+    assert scores[0] == 0.0  # Ningún término de la pregunta
+
+
+def test_rank_pages_rewards_rare_terms():
+    # "frutos secos" aparece en dos páginas, "maní" solo en la de alergias
+    scores = pdf.rank_pages("maní frutos secos", PAGES)
+    assert scores[5] > scores[4] > 0.0
+
+
+def test_tokenize_drops_accents_stopwords_and_plurals():
+    assert pdf.tokenize("¿Cuántas calorías tienen las legumbres?") == ["caloria", "legumbr"]
+
+
+@pytest.mark.parametrize(
+    "question, top_k, expected",
+    [
+        pytest.param("frutos secos", 2, [5, 6], id="top-k-en-orden-original"),
+        pytest.param("desayunos y cenas", 4, [2, 4], id="solo-paginas-con-puntaje"),
+        pytest.param("cualquier cosa", 7, [1, 2, 3, 4, 5, 6, 7], id="pdf-corto-completo"),
+    ],
+)
+def test_select_pages(question, top_k, expected):
+    selection = pdf.select_pages(question, PAGES, top_k=top_k, max_chars=100_000)
+    assert selection["pages"] == expected
+    assert selection["text"].startswith(f"--- Página {expected[0]} ---")
+
+
+def test_select_pages_respects_max_chars():
+    selection = pdf.select_pages("frutos secos alergias", PAGES, top_k=3, max_chars=len(PAGES[4].strip()) + 50)
+    assert selection["pages"] == [5, 6]  # La segunda página entra recortada
+    assert selection["chars"] == len(PAGES[4].strip()) + 50
+
+
+def test_no_matching_page_sends_the_whole_pdf():
+    assert pdf.select_pages("presupuesto trimestral", PAGES, top_k=3, max_chars=100_000) is None
+
+
+def test_has_text_layer():
+    assert pdf.has_text_layer(PAGES, min_chars_per_page=80)
+    assert not pdf.has_text_layer(["", " ", PAGES[0]], min_chars_per_page=80)
+    assert not pdf.has_text_layer([], min_chars_per_page=80)
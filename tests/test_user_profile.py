@@ -0,0 +1,59 @@
+"""
+get_user_profile (src/supabase_client.py): RPC de un round trip, fallback sin la función
+SQL y que el resultado no pise una invalidación ocurrida durante la RPC
+"""
+
+import asyncio
+
+import supabase_client
+from benchmarks.fakes import _rpc_get_user_profile, fake_user_id
+from cache import get_cache
+
+
+def test_profile_in_one_round_trip(fake_supabase):
+    user_id = fake_user_id(0)
+
+    async def scenario():
+        first = await supabase_client.get_user_profile(user_id)
+        requests = fake_supabase.requests
+        second = await supabase_client.get_user_profile(user_id)
+        return first, second, fake_supabase.requests - requests
+
+    first, second, extra_requests = asyncio.run(scenario())
+    assert fake_supabase.requests - extra_requests == 1
+    assert extra_requests == 0
+    assert first.metrics.user_id == user_id and len(first.daily_nutrition) == 5
+    assert second.model_dump() == first.model_dump()
+
+
+def test_profile_falls_back_without_rpc(fake_supabase, monkeypatch):
+    monkeypatch.setattr(supabase_client, "_profile_rpc_available", None)
+    del fake_supabase.rpc_handlers["get_user_profile"]
+    profile = asyncio.run(supabase_client.get_user_profile(fake_user_id(1)))
+    assert profile.metrics.user_id == fake_user_id(1) and len(profile.daily_nutrition) == 5
+    assert supabase_client._profile_rpc_available is False
+
+
+def test_rpc_result_does_not_overwrite_newer_invalidation(fake_supabase, monkeypatch):
+    monkeypatch.setattr(supabase_client, "_profile_rpc_available", None)
+    user_id = fake_user_id(2)
+    key = supabase_client._user_key(user_id)
+
+    def rpc_racing_a_write(backend, params):
+        result = _rpc_get_user_profile(backend, params)
+        # Otra request cambia la meta mientras la RPC está en vuelo
+        next(r for r in backend.tables["user_metrics"] if r["user_id"] == user_id)["calorie_goal"] = 1500.0
+        asyncio.run(supabase_client.invalidate_user_metrics(user_id))  # Hilo del servidor falso: loop propio
+        return result
+
+    fake_supabase.rpc_handlers["get_user_profile"] = rpc_racing_a_write
+
+    async def scenario():
+        await supabase_client.get_user_profile(user_id)
+        stored = get_cache("user_metrics").contains(key), get_cache("daily_nutrition").contains(key)
+        return stored, await supabase_client.get_user_metrics(user_id)
+
+    (metrics_stored, nutrition_stored), metrics = asyncio.run(scenario())
+    assert not metrics_stored
+    assert nutrition_stored
+    assert metrics.calorie_goal == 1500.0